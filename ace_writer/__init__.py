@@ -0,0 +1,35 @@
+# Núcleo de ACE Writer: generación, referencias, análisis y exportación, sin Streamlit.
+# Los submódulos se cargan recién al usarlos (`ace_writer.citas`, `from ace_writer import lote`...)
+# y cada uno difiere sus dependencias pesadas (sklearn, openai, tiktoken, python-docx) hasta la
+# primera llamada que las necesita.
+import importlib
+
+__all__ = [
+    "cache_respuestas",
+    "carga",
+    "catalogo",
+    "citas",
+    "exportacion",
+    "generacion",
+    "instrumentacion",
+    "libro",
+    "lote",
+    "planificador",
+    "proveedores",
+    "redundancia",
+    "referencias",
+    "relevancia",
+    "renderizado",
+    "revision",
+    "secciones",
+    "segmentos",
+    "solapamiento",
+    "trabajos",
+    "validacion",
+]
+
+
+def __getattr__(nombre):
+    if nombre in __all__:
+        return importlib.import_module(f".{nombre}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
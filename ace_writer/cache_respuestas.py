@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+RUTA_POR_DEFECTO = ".cache_ace/completions.sqlite"
+MAX_BYTES = 200 * 1024 * 1024
+MAX_EDAD = 30 * 24 * 3600
+
+
+def clave_completion(prompt, modelo, temperatura, max_tokens):
+    datos = json.dumps(
+        {"prompt": prompt, "modelo": modelo, "temperatura": temperatura, "max_tokens": max_tokens},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+class CacheCompletions:
+    # Cache en disco (SQLite) de respuestas del modelo, direccionada por el hash del prompt
+    # completo y los parámetros de la llamada. Expira por edad y, al superar `max_bytes`,
+    # descarta primero las entradas usadas hace más tiempo.
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO, max_bytes=MAX_BYTES, max_edad=MAX_EDAD):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.aciertos = 0
+        self.fallos = 0
+        self.escrituras = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.ruta), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                clave TEXT PRIMARY KEY,
+                respuesta TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                usado REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usado ON completions(usado)")
+        self._conn.commit()
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT respuesta, creado FROM completions WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.max_edad:
+                if fila is not None:
+                    self._conn.execute("DELETE FROM completions WHERE clave = ?", (clave,))
+                    self._conn.commit()
+                self.fallos += 1
+                return None
+            self._conn.execute("UPDATE completions SET usado = ? WHERE clave = ?", (ahora, clave))
+            self._conn.commit()
+            self.aciertos += 1
+            return fila[0]
+
+    def guardar(self, clave, respuesta):
+        if not respuesta:
+            return
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (clave, respuesta, bytes, creado, usado) VALUES (?, ?, ?, ?, ?)",
+                (clave, respuesta, len(respuesta.encode("utf-8")), ahora, ahora)
+            )
+            self.escrituras += 1
+            self._desalojar(ahora)
+            self._conn.commit()
+
+    def _desalojar(self, ahora):
+        self._conn.execute("DELETE FROM completions WHERE creado < ?", (ahora - self.max_edad,))
+        total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        sobrante = total - self.max_bytes
+        for clave, tamano in self._conn.execute("SELECT clave, bytes FROM completions ORDER BY usado").fetchall():
+            if sobrante <= 0:
+                break
+            self._conn.execute("DELETE FROM completions WHERE clave = ?", (clave,))
+            sobrante -= tamano
+
+    def limpiar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def estadisticas(self):
+        with self._lock:
+            entradas, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM completions"
+            ).fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "escrituras": self.escrituras,
+            "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0,
+            "entradas": entradas,
+            "bytes": total,
+        }
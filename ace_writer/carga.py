@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from . import proveedores, trabajos
+from .cache_respuestas import CacheCompletions
+from .instrumentacion import Registro
+from .planificador import RPM, TPM, Planificador, estimar_tokens
+from .relevancia import PRESUPUESTO_TOKENS_REFERENCIAS, seleccionar_referencias
+
+# Prueba de carga del camino de generación de la app: N escritores simultáneos envían subtemas a
+# la misma ColaTrabajos que usa Streamlit (pool de hilos, planificador y registro compartidos,
+# texto parcial persistido en SQLite) y la consultan como la página, hasta que cada trabajo
+# termina. Pensada para correr contra el proveedor sintético o una grabación, sin red ni costo.
+ESCRITORES = 8
+GENERACIONES_POR_ESCRITOR = 3
+INTERVALO_CONSULTA = 0.1
+PERCENTILES = (50, 95, 99)
+REFERENCIAS_SINTETICAS = [
+    f"Autor{i}, A. (20{10 + i % 14}). Efectos del entrenamiento de fuerza sobre la potencia en deportistas {i}. "
+    f"Revista de Ciencias del Deporte, {i}(2), 1-10. https://doi.org/10.1000/ace{i}"
+    for i in range(1, 31)
+]
+
+
+def percentil(valores, p):
+    # Rango más cercano sobre los valores ordenados; None si no hay valores.
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, min(len(ordenados) - 1, -(-p * len(ordenados) // 100) - 1))]
+
+
+def resumir_latencias(valores):
+    return {**{f"p{p}": percentil(valores, p) for p in PERCENTILES}, "max": max(valores) if valores else None}
+
+
+# --- ESCRITORES ---
+def _escritor(cola, subtemas, api_key, resultados, lock):
+    for subtema in subtemas:
+        enviado = time.time()
+        id_trabajo = cola.enviar(subtema, api_key)
+        while (trabajo := cola.obtener(id_trabajo))["estado"] in trabajos.ACTIVOS:
+            time.sleep(INTERVALO_CONSULTA)
+        metricas = trabajo["metricas"]
+        with lock:
+            resultados.append({
+                "subtema": subtema["subtema"],
+                "estado": trabajo["estado"],
+                "error": trabajo["error"],
+                "latencia": time.time() - enviado,
+                "espera": (trabajo["iniciado"] or trabajo["terminado"]) - trabajo["creado"],
+                "ttft": metricas[0]["ttft"] if metricas and "ttft" in metricas[0] else None,
+                "llamadas": len(metricas),
+                "completion_tokens": trabajo["completion_tokens"],
+            })
+
+
+def subtemas_de_prueba(escritores, por_escritor, referencias, presupuesto=PRESUPUESTO_TOKENS_REFERENCIAS):
+    # Un subtema distinto por generación, con las referencias elegidas como en la app. Los tokens se
+    # estiman como en el planificador: tiktoken bajaría su codificador de la red en la primera llamada.
+    lotes = []
+    for e in range(escritores):
+        lote = []
+        for g in range(por_escritor):
+            nombre = f"Subtema de carga {e + 1}.{g + 1}"
+            incluidas, _ = seleccionar_referencias(referencias, nombre, "Capítulo de carga", presupuesto,
+                                                   contar=lambda texto: estimar_tokens(texto, 0))
+            lote.append({"subtema": nombre, "capitulo": "Capítulo de carga",
+                         "referencias": [r["referencia"] for r in incluidas]})
+        lotes.append(lote)
+    return lotes
+
+
+def correr(escritores=ESCRITORES, por_escritor=GENERACIONES_POR_ESCRITOR, trabajadores=trabajos.TRABAJADORES,
+           referencias=None, planificador=None, cache=None, api_key="sk-carga"):
+    # Devuelve un informe con throughput y percentiles de latencia; el proveedor es el que indique
+    # ACE_PROVEEDOR (ver proveedores).
+    planificador = planificador or Planificador()
+    registro = Registro(ruta_log=None)
+    with tempfile.TemporaryDirectory() as carpeta:
+        cola = trabajos.ColaTrabajos(Path(carpeta) / "trabajos.sqlite", trabajadores=trabajadores,
+                                     cache=cache, planificador=planificador, registro=registro)
+        lotes = subtemas_de_prueba(escritores, por_escritor, referencias or REFERENCIAS_SINTETICAS)
+        resultados, lock = [], threading.Lock()
+        hilos = [threading.Thread(target=_escritor, args=(cola, lote, api_key, resultados, lock)) for lote in lotes]
+        inicio = time.perf_counter()
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        total = time.perf_counter() - inicio
+
+    listos = [r for r in resultados if r["estado"] == "listo"]
+    tokens = sum(r["completion_tokens"] for r in resultados)
+    return {
+        "proveedor": os.environ.get("ACE_PROVEEDOR", "openai"),
+        "escritores": escritores,
+        "trabajadores": trabajadores,
+        "generaciones": len(resultados),
+        "listas": len(listos),
+        "errores": {r["subtema"]: r["error"] for r in resultados if r["estado"] != "listo"},
+        "segundos": round(total, 3),
+        "generaciones_por_minuto": round(len(listos) / total * 60, 2) if total else 0.0,
+        "tokens_por_segundo": round(tokens / total, 1) if total else 0.0,
+        "llamadas": sum(r["llamadas"] for r in resultados),
+        "latencia": resumir_latencias([r["latencia"] for r in listos]),
+        "espera_en_cola": resumir_latencias([r["espera"] for r in listos]),
+        "primer_token": resumir_latencias([r["ttft"] for r in listos if r["ttft"] is not None]),
+        "planificador": planificador.estadisticas(),
+        "costo_estimado": round(registro.resumen()["costo_total"], 4),
+    }
+
+
+# --- LÍNEA DE COMANDOS ---
+def _fila(nombre, latencias):
+    valores = " · ".join(f"{k} {v:.2f}s" for k, v in latencias.items() if v is not None)
+    return f"{nombre:<16}{valores or '—'}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la generación con N escritores simultáneos.")
+    parser.add_argument("-n", "--escritores", type=int, default=ESCRITORES)
+    parser.add_argument("-g", "--generaciones", type=int, default=GENERACIONES_POR_ESCRITOR,
+                        help="Subtemas que genera cada escritor, uno después del otro")
+    parser.add_argument("-t", "--trabajadores", type=int, default=trabajos.TRABAJADORES,
+                        help="Hilos de la cola de trabajos (como en la app)")
+    parser.add_argument("--proveedor", choices=proveedores.PROVEEDORES,
+                        default=os.environ.get("ACE_PROVEEDOR", "sintetico"))
+    parser.add_argument("--grabacion", default=os.environ.get("ACE_GRABACION", proveedores.RUTA_GRABACION),
+                        help="JSONL de respuestas para grabar o reproducir")
+    parser.add_argument("--opciones", default="",
+                        help="Opciones del proveedor, p. ej. 'latencia=0.5,tokens_por_segundo=60,errores=0.05'")
+    parser.add_argument("--referencias", help="CSV de referencias (por defecto, referencias sintéticas)")
+    parser.add_argument("--cache", help="Usar esta cache de respuestas (por defecto, sin cache)")
+    parser.add_argument("--rpm", type=int, default=RPM, help="Solicitudes por minuto permitidas")
+    parser.add_argument("--tpm", type=int, default=TPM, help="Tokens por minuto permitidos")
+    parser.add_argument("--json", help="Escribir el informe completo en este archivo")
+    args = parser.parse_args(argv)
+
+    os.environ["ACE_PROVEEDOR"] = args.proveedor
+    os.environ["ACE_GRABACION"] = args.grabacion
+    os.environ["ACE_REPRODUCIR" if args.proveedor == "reproducir" else "ACE_SINTETICO"] = args.opciones
+    referencias = None
+    if args.referencias:
+        from .lote import leer_referencias
+
+        referencias = leer_referencias(args.referencias)
+    informe = correr(
+        args.escritores, args.generaciones, args.trabajadores, referencias,
+        Planificador(rpm=args.rpm, tpm=args.tpm), CacheCompletions(args.cache) if args.cache else None,
+        api_key=os.environ.get("OPENAI_API_KEY") or "sk-carga",
+    )
+
+    print(f"Proveedor {informe['proveedor']}: {informe['escritores']} escritores, {informe['trabajadores']} trabajadores")
+    print(f"{informe['listas']}/{informe['generaciones']} generaciones en {informe['segundos']:.1f}s · "
+          f"{informe['generaciones_por_minuto']} generaciones/min · {informe['tokens_por_segundo']} tokens/s · "
+          f"{informe['llamadas']} llamadas")
+    print(_fila("Latencia total", informe["latencia"]))
+    print(_fila("Espera en cola", informe["espera_en_cola"]))
+    print(_fila("Primer token", informe["primer_token"]))
+    p = informe["planificador"]
+    print(f"Planificador: {p['solicitudes']} solicitudes, {p['reintentos']} reintentos, {p['errores']} errores, "
+          f"espera media {p['espera_media']}s")
+    for subtema, error in informe["errores"].items():
+        print(f"❌ {subtema}: {error}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from .citas import apellido_principal, normalizar
+from .referencias import COLUMNAS_CANONICAS, cargar_tabla, mascara_completas, normalizar_columnas
+
+RUTA_POR_DEFECTO = ".cache_ace/catalogo.sqlite"
+UMBRAL_TITULO = 0.6
+# Un término que aparece en más títulos que esto no sirve para buscar candidatos.
+MAX_POR_TERMINO = 200
+FILAS_POR_LOTE = 20000
+MAX_TABLAS_CACHEADAS = 8
+# Columna canónica -> columna en SQLite.
+CAMPOS = {
+    "Autores": "autores",
+    "Año": "anio",
+    "Título del artículo": "titulo",
+    "Journal": "journal",
+    "Volumen": "volumen",
+    "Páginas": "paginas",
+    "DOI": "doi",
+}
+
+
+# --- CLAVES DE COINCIDENCIA ---
+def clave_autor(autores):
+    # Apellido del primer autor sin tildes, guiones ni espacios: "García-Ramos, A." -> "garciaramos".
+    if not autores:
+        return None
+    return re.sub(r"[^a-z]", "", normalizar(apellido_principal(autores))) or None
+
+
+def clave_titulo(titulo):
+    if not titulo:
+        return None
+    return " ".join(re.findall(r"[a-z0-9]{3,}", normalizar(str(titulo)))) or None
+
+
+def clave_doi(doi):
+    if not doi:
+        return None
+    doi = re.sub(r"^(https?://)?(dx\.)?doi\.org/", "", str(doi).strip(), flags=re.IGNORECASE)
+    return doi.lower() or None
+
+
+def clave_anio(anio):
+    encontrado = re.search(r"\d{4}", str(anio)) if anio else None
+    return encontrado.group() if encontrado else None
+
+
+def similitud_titulos(a, b):
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _valor(v):
+    # pd.NA / NaN / "" -> None, para SQLite y para las claves.
+    if pd.isna(v):
+        return None
+    v = str(v).strip()
+    return v or None
+
+
+# --- CATÁLOGO ---
+class CatalogoBibliografico:
+    # Catálogo local (SQLite + FTS5) armado a partir de un volcado de metadatos. Completa las filas
+    # incompletas de un CSV de referencias sin red: primero por DOI, después por apellido del primer
+    # autor + año (desempatando por título) y por último por título con la búsqueda de texto
+    # completo. Solo rellena campos vacíos; nunca pisa lo que el usuario cargó.
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._completadas = OrderedDict()
+        self._conn = sqlite3.connect(str(self.ruta), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS registros (
+                id INTEGER PRIMARY KEY,
+                autores TEXT,
+                anio TEXT,
+                titulo TEXT,
+                journal TEXT,
+                volumen TEXT,
+                paginas TEXT,
+                doi TEXT,
+                clave_autor TEXT,
+                clave_titulo TEXT,
+                clave_doi TEXT UNIQUE
+            );
+            CREATE INDEX IF NOT EXISTS idx_registros_autor_anio ON registros(clave_autor, anio);
+            CREATE VIRTUAL TABLE IF NOT EXISTS titulos USING fts5(
+                clave_titulo, content='registros', content_rowid='id'
+            );
+        """)
+        self._conn.commit()
+        self._cambios = None
+        self._version = 0
+
+    @property
+    def version(self):
+        # Cantidad de registros; se recuenta solo si otra conexión (p. ej. `importar` desde la línea
+        # de comandos) escribió en la base desde la última vez.
+        with self._lock:
+            cambios = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if cambios != self._cambios:
+                self._cambios = cambios
+                self._version = self._conn.execute("SELECT COUNT(*) FROM registros").fetchone()[0]
+            return self._version
+
+    # --- IMPORTACIÓN ---
+    def importar(self, ruta):
+        # Volcado plano en CSV o JSON Lines (opcionalmente .gz) con las columnas de siempre o sus
+        # alias en inglés (authors, year, title, journal, volume, pages, doi). Los DOI repetidos se
+        # ignoran. Devuelve la cantidad de registros nuevos.
+        ruta = str(ruta)
+        if re.search(r"\.jsonl?(\.gz)?$", ruta, re.IGNORECASE):
+            trozos = pd.read_json(ruta, lines=True, dtype=False, chunksize=FILAS_POR_LOTE)
+        else:
+            trozos = pd.read_csv(ruta, dtype=str, chunksize=FILAS_POR_LOTE)
+        antes = self.version
+        with self._lock:
+            ultimo_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM registros").fetchone()[0]
+        for trozo in trozos:
+            trozo = normalizar_columnas(trozo)
+            filas = []
+            for registro in trozo[COLUMNAS_CANONICAS].itertuples(index=False, name=None):
+                autores, anio, titulo, journal, volumen, paginas, doi = (_valor(v) for v in registro)
+                anio = clave_anio(anio)
+                filas.append((autores, anio, titulo, journal, volumen, paginas, doi,
+                              clave_autor(autores), clave_titulo(titulo), clave_doi(doi)))
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO registros (autores, anio, titulo, journal, volumen, paginas, doi, "
+                    "clave_autor, clave_titulo, clave_doi) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    filas
+                )
+                self._conn.commit()
+        with self._lock:
+            # Solo se indexan los registros nuevos (los ids crecen y los repetidos se ignoraron).
+            self._conn.execute(
+                "INSERT INTO titulos (rowid, clave_titulo) SELECT id, clave_titulo FROM registros "
+                "WHERE id > ? AND clave_titulo IS NOT NULL", (ultimo_id,)
+            )
+            self._conn.commit()
+        self._cambios = None
+        self._completadas.clear()
+        return self.version - antes
+
+    # --- BÚSQUEDA ---
+    def _por_doi(self):
+        filas = self._conn.execute(
+            "SELECT c.fila, r.* FROM consulta c JOIN registros r ON r.clave_doi = c.clave_doi"
+        ).fetchall()
+        return {f[0]: (f[1:], 1.0, "doi") for f in filas}
+
+    def _por_autor_y_anio(self, consultas, resueltas):
+        # Apellido y año no identifican una obra (el catálogo puede no tener la correcta y sí otra del
+        # mismo autor ese año): sin título que coincida, o DOI en _por_doi, la fila no se completa.
+        candidatos = {}
+        for fila, *registro in self._conn.execute(
+            "SELECT c.fila, r.* FROM consulta c JOIN registros r ON r.clave_autor = c.clave_autor AND r.anio = c.anio"
+        ):
+            if fila not in resueltas and consultas[fila]["clave_titulo"]:
+                candidatos.setdefault(fila, []).append(tuple(registro))
+        elegidos = {}
+        for fila, registros in candidatos.items():
+            titulo = consultas[fila]["clave_titulo"]
+            puntaje, mejor = max(((similitud_titulos(titulo, r[9] or ""), r) for r in registros), key=lambda p: p[0])
+            if puntaje >= UMBRAL_TITULO:
+                elegidos[fila] = (mejor, round(puntaje, 3), "autor y año")
+        return elegidos
+
+    def _por_titulo(self, consulta, posteos):
+        # Los candidatos salen de los términos poco frecuentes del título (cada lista de posteos se
+        # lee con LIMIT, así que un término común cuesta poco); si todos son comunes se exigen todos.
+        # `posteos` recuerda lo leído por término durante una misma búsqueda (None = término común).
+        terminos = sorted(set(consulta["clave_titulo"].split()))
+        ids = set()
+        for termino in terminos:
+            if termino not in posteos:
+                filas = self._conn.execute(
+                    "SELECT rowid FROM titulos WHERE titulos MATCH ? LIMIT ?", (f'"{termino}"', MAX_POR_TERMINO + 1)
+                ).fetchall()
+                posteos[termino] = [f[0] for f in filas] if len(filas) <= MAX_POR_TERMINO else None
+            ids.update(posteos[termino] or ())
+        if not ids:
+            ids = {f[0] for f in self._conn.execute(
+                "SELECT rowid FROM titulos WHERE titulos MATCH ? LIMIT ?",
+                (" AND ".join(f'"{t}"' for t in terminos), MAX_POR_TERMINO)
+            )}
+        if not ids:
+            return None
+        registros = self._conn.execute(
+            f"SELECT * FROM registros WHERE id IN ({', '.join('?' * len(ids))})", tuple(ids)
+        ).fetchall()
+        mejor, puntaje = None, 0.0
+        for r in registros:
+            # Si la fila trae autor o año, el candidato tiene que coincidir en eso.
+            if consulta["clave_autor"] and r[8] and r[8] != consulta["clave_autor"]:
+                continue
+            if consulta["anio"] and r[2] and r[2] != consulta["anio"]:
+                continue
+            s = similitud_titulos(consulta["clave_titulo"], r[9] or "")
+            if s > puntaje:
+                mejor, puntaje = r, s
+        if mejor is None or puntaje < UMBRAL_TITULO:
+            return None
+        return mejor, round(puntaje, 3), "título"
+
+    def buscar(self, consultas):
+        # `consultas`: {fila: {"clave_doi", "clave_autor", "anio", "clave_titulo"}} -> {fila: (registro, similitud, vía)}.
+        with self._lock:
+            self._conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS consulta (fila INTEGER, clave_doi TEXT, clave_autor TEXT, anio TEXT)"
+            )
+            self._conn.execute("DELETE FROM consulta")
+            self._conn.executemany(
+                "INSERT INTO consulta VALUES (?, ?, ?, ?)",
+                ((fila, c["clave_doi"], c["clave_autor"], c["anio"]) for fila, c in consultas.items())
+            )
+            resueltas = self._por_doi()
+            resueltas.update(self._por_autor_y_anio(consultas, resueltas))
+            posteos = {}
+            for fila, c in consultas.items():
+                if fila not in resueltas and c["clave_titulo"]:
+                    encontrada = self._por_titulo(c, posteos)
+                    if encontrada:
+                        resueltas[fila] = encontrada
+            self._conn.commit()
+        return resueltas
+
+    def completar(self, df):
+        # Devuelve (df con los campos faltantes rellenados, informe). El informe tiene una entrada
+        # por fila completada: vía de coincidencia, similitud de títulos y campos agregados. El
+        # resultado se reutiliza mientras no cambien la tabla ni el catálogo.
+        clave = (df.attrs.get("sha256"), self.version)
+        if clave[0] and clave in self._completadas:
+            self._completadas.move_to_end(clave)
+            return self._completadas[clave]
+        pendientes = df[~mascara_completas(df, COLUMNAS_CANONICAS)]
+        actuales = [tuple(_valor(v) for v in registro)
+                    for registro in pendientes[COLUMNAS_CANONICAS].itertuples(index=False, name=None)]
+        consultas = {}
+        for posicion, (autores, anio, titulo, _, _, _, doi) in enumerate(actuales):
+            consulta = {"clave_doi": clave_doi(doi), "clave_autor": clave_autor(autores),
+                        "anio": clave_anio(anio), "clave_titulo": clave_titulo(titulo)}
+            if any(consulta.values()):
+                consultas[posicion] = consulta
+        resueltas = self.buscar(consultas) if consultas and clave[1] else {}
+        # Los valores nuevos se juntan por columna y se aplican con un fillna por columna.
+        nuevos = {columna: {} for columna in CAMPOS}
+        informe = []
+        for posicion, (registro, similitud, via) in sorted(resueltas.items()):
+            fila = pendientes.index[posicion]
+            agregados = []
+            for columna, actual, valor in zip(CAMPOS, actuales[posicion], registro[1:8]):
+                if actual is None and valor is not None:
+                    nuevos[columna][fila] = valor
+                    agregados.append(columna)
+            if agregados:
+                informe.append({"fila": fila, "via": via, "similitud": similitud, "campos": agregados})
+        completado = df.copy()
+        completado.attrs = dict(df.attrs)
+        if clave[0] and informe:
+            # Otra clave para que los índices cacheados por contenido (citas.indice_para) no confundan
+            # la tabla completada con la original.
+            completado.attrs["sha256"] = hashlib.sha256(f"{clave[0]}:{self.ruta}:{clave[1]}".encode()).hexdigest()
+        for columna, valores in nuevos.items():
+            if valores:
+                completado[columna] = completado[columna].fillna(pd.Series(valores, dtype="string"))
+        resultado = (completado, informe)
+        if clave[0]:
+            self._completadas[clave] = resultado
+            if len(self._completadas) > MAX_TABLAS_CACHEADAS:
+                self._completadas.popitem(last=False)
+        return resultado
+
+    def estadisticas(self):
+        with self._lock:
+            registros, con_doi = self._conn.execute(
+                "SELECT COUNT(*), COUNT(clave_doi) FROM registros"
+            ).fetchone()
+        return {"registros": registros, "con_doi": con_doi}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catálogo bibliográfico local para completar referencias.")
+    parser.add_argument("--catalogo", default=RUTA_POR_DEFECTO, help="Archivo SQLite del catálogo")
+    sub = parser.add_subparsers(dest="orden", required=True)
+    importar = sub.add_parser("importar", help="Agregar un volcado de metadatos (CSV o JSON Lines)")
+    importar.add_argument("volcados", nargs="+")
+    completar = sub.add_parser("completar", help="Completar las filas incompletas de un CSV de referencias")
+    completar.add_argument("referencias")
+    completar.add_argument("-o", "--salida", help="CSV de salida (por defecto <referencias>_completado.csv)")
+    args = parser.parse_args(argv)
+
+    catalogo = CatalogoBibliografico(args.catalogo)
+    if args.orden == "importar":
+        for volcado in args.volcados:
+            inicio = time.perf_counter()
+            nuevos = catalogo.importar(volcado)
+            print(f"{volcado}: {nuevos} registros nuevos en {time.perf_counter() - inicio:.1f}s")
+        print(f"Catálogo: {catalogo.estadisticas()['registros']} registros")
+        return 0
+
+    inicio = time.perf_counter()
+    df = cargar_tabla(Path(args.referencias).read_bytes())
+    completado, informe = catalogo.completar(df)
+    salida = args.salida or str(Path(args.referencias).with_suffix("")) + "_completado.csv"
+    completado.to_csv(salida, index=False)
+    incompletas = int((~mascara_completas(completado)).sum())
+    print(f"{len(informe)} filas completadas en {time.perf_counter() - inicio:.2f}s; quedan {incompletas} incompletas")
+    print(f"Escrito en {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,234 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+
+MAX_INDICES_CACHEADOS = 8
+_indices = OrderedDict()
+# Las sesiones de Streamlit corren en hilos distintos y comparten la cache.
+_lock_indices = threading.Lock()
+
+
+# --- NORMALIZACIÓN CON POSICIONES ESTABLES ---
+def _tabla_sin_tildes():
+    tabla = {}
+    for codigo in range(0xC0, 0x250):
+        base = unicodedata.normalize("NFKD", chr(codigo))[0]
+        if base != chr(codigo) and base.isascii():
+            tabla[codigo] = base
+    return tabla
+
+
+_SIN_TILDES = _tabla_sin_tildes()
+
+
+def normalizar(texto):
+    # Minúsculas y sin tildes, carácter por carácter, para que las posiciones del texto
+    # normalizado coincidan con las del original.
+    minusculas = texto.lower()
+    if len(minusculas) != len(texto):
+        minusculas = "".join(c.lower() if len(c.lower()) == 1 else c for c in texto)
+    return minusculas.translate(_SIN_TILDES)
+
+
+def vacio(valor):
+    # None, NaN o pd.NA: las tablas normalizadas usan el dtype "string" de pandas, cuyo NA no se
+    # puede comparar consigo mismo como un NaN.
+    import pandas as pd
+
+    return valor is None or bool(pd.isna(valor))
+
+
+def apellido_principal(autores):
+    # "García-Ramos, A., & Pérez, B." -> "García-Ramos"; "A. García" -> "García"
+    primero = str(autores).split(",")[0].split("&")[0].strip()
+    palabras = [p for p in primero.split() if not re.fullmatch(r"(?:\w\.)+", p)]
+    return " ".join(palabras) or primero
+
+
+# --- CLAVE Y ORDEN APA DE REFERENCIAS ---
+_DOI = re.compile(r"10\.\d{4,9}/[^\s]+", re.I)
+_AUTORES_Y_ANIO = re.compile(r"^(?P<autores>.*?)\s*\((?P<anio>[^)]*)\)\.?\s*(?P<resto>.*)$", re.S)
+
+
+def _sin_puntuacion(texto):
+    return " ".join(re.sub(r"[^\w]+", " ", normalizar(texto)).split())
+
+
+def clave_referencia(ref):
+    # Misma obra = mismo DOI; sin DOI, mismo texto sin tildes, mayúsculas ni puntuación.
+    doi = _DOI.search(ref)
+    if doi:
+        return "doi:" + doi.group(0).rstrip(".,;").lower()
+    return _sin_puntuacion(ref)
+
+
+def orden_apa(ref):
+    # APA 7 ordena alfabéticamente por el primer autor, luego por año (las obras sin fecha van
+    # primero) y luego por el resto; una referencia sin "(año)" se ordena por su texto completo.
+    partes = _AUTORES_Y_ANIO.match(ref)
+    if not partes:
+        return (_sin_puntuacion(ref), "", "")
+    anio = re.search(r"\d{4}\w?", partes["anio"])
+    return (
+        _sin_puntuacion(apellido_principal(partes["autores"])),
+        anio.group(0) if anio else "",
+        _sin_puntuacion(partes["autores"] + " " + partes["resto"]),
+    )
+
+
+# --- AHO–CORASICK ---
+class AhoCorasick:
+    # Autómata sobre un diccionario {patrón: valor}; `buscar` recorre el texto una sola vez
+    # y devuelve (inicio, fin, valor) para cada aparición de cualquier patrón.
+
+    def __init__(self, patrones):
+        self._transiciones = [{}]
+        self._fallo = [0]
+        self._salidas = [[]]
+        for patron, valor in patrones.items():
+            estado = 0
+            for c in patron:
+                siguiente = self._transiciones[estado].get(c)
+                if siguiente is None:
+                    siguiente = len(self._transiciones)
+                    self._transiciones[estado][c] = siguiente
+                    self._transiciones.append({})
+                    self._fallo.append(0)
+                    self._salidas.append([])
+                estado = siguiente
+            self._salidas[estado].append((len(patron), valor))
+        self._enlazar_fallos()
+
+    def _enlazar_fallos(self):
+        cola = deque(self._transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for c, siguiente in self._transiciones[estado].items():
+                cola.append(siguiente)
+                fallo = self._fallo[estado]
+                while fallo and c not in self._transiciones[fallo]:
+                    fallo = self._fallo[fallo]
+                destino = self._transiciones[fallo].get(c, 0)
+                self._fallo[siguiente] = destino if destino != siguiente else 0
+                self._salidas[siguiente] = self._salidas[siguiente] + self._salidas[self._fallo[siguiente]]
+
+    def buscar(self, texto):
+        transiciones, fallo, salidas = self._transiciones, self._fallo, self._salidas
+        estado = 0
+        for pos, c in enumerate(texto):
+            while estado and c not in transiciones[estado]:
+                estado = fallo[estado]
+            estado = transiciones[estado].get(c, 0)
+            for largo, valor in salidas[estado]:
+                yield pos + 1 - largo, pos + 1, valor
+
+
+# --- ÍNDICE DE CITAS APA 7 ---
+# Lo que puede seguir al apellido del primer autor (sobre texto normalizado):
+# "et al.", coautores con "&"/"y"/"and", y luego ", 2020" (parentética) o " (2020)" (narrativa),
+# con uno o varios años.
+_COLA = re.compile(r"""
+    (?P<etal>\s+et\s+al\.?)?
+    (?P<coautores>(?:\s*,\s*[a-z][\w'-]*(?:\s+[a-z][\w'-]*)?)*\s*,?\s*(?:&|\by\b|\band\b)\s*[a-z][\w'-]*(?:\s+[a-z][\w'-]*)?)?
+    (?P<sep>\s*,\s*|\s*\(\s*)
+    (?P<anios>\d{4}[a-z]?(?:\s*,\s*\d{4}[a-z]?)*)
+""", re.X)
+_ANIO = re.compile(r"\d{4}[a-z]?")
+_COAUTOR_PREVIO = re.compile(r"(?:&|\band)\s*$")
+
+
+def _es_letra(c):
+    return c.isalnum() or c in "-'"
+
+
+class IndiceCitas:
+    # Índice precompilado de una tabla de referencias normalizada (ver referencias.cargar_tabla).
+    # Se indexa el apellido del primer autor; el año desambigua entre referencias del mismo autor.
+
+    def __init__(self, df):
+        self._por_clave = {}
+        apellidos = {}
+        for fila, autores, anio in zip(df.index, df["Autores"], df["Año"]):
+            if vacio(autores):
+                continue
+            apellido = normalizar(apellido_principal(autores))
+            if not apellido:
+                continue
+            apellidos[apellido] = apellido
+            anio = "" if vacio(anio) else normalizar(str(anio)).strip()
+            self._por_clave.setdefault((apellido, anio), []).append(fila)
+        self._automata = AhoCorasick(apellidos)
+
+    def buscar(self, texto):
+        # Devuelve ({fila: {"conteo", "posiciones", "formas"}}, [citas sin referencia]) en una pasada.
+        normal = normalizar(texto)
+        por_referencia = {}
+        sin_referencia = []
+        ultimo_fin = 0
+        for inicio, fin, apellido in self._automata.buscar(normal):
+            if inicio < ultimo_fin:
+                continue
+            if (inicio > 0 and _es_letra(normal[inicio - 1])) or (fin < len(normal) and _es_letra(normal[fin])):
+                continue
+            # Un apellido precedido de "&" es coautor de una cita cuyo primer autor no está en la tabla.
+            if _COAUTOR_PREVIO.search(normal, max(0, inicio - 6), inicio):
+                continue
+            cola = _COLA.match(normal, fin)
+            if not cola:
+                continue
+            ultimo_fin = cola.end()
+            forma = "narrativa" if "(" in cola.group("sep") else "parentetica"
+            if cola.group("etal"):
+                forma += "_et_al"
+            elif cola.group("coautores"):
+                forma += "_coautores"
+            for anio in _ANIO.findall(cola.group("anios")):
+                filas = self._por_clave.get((apellido, anio)) or self._por_clave.get((apellido, anio[:4]))
+                if not filas:
+                    sin_referencia.append({"apellido": texto[inicio:fin], "anio": anio, "posicion": (inicio, cola.end())})
+                    continue
+                for fila in filas:
+                    info = por_referencia.setdefault(fila, {"conteo": 0, "posiciones": [], "formas": {}})
+                    info["conteo"] += 1
+                    info["posiciones"].append((inicio, cola.end()))
+                    info["formas"][forma] = info["formas"].get(forma, 0) + 1
+        return por_referencia, sin_referencia
+
+    def buscar_por_segmentos(self, segmentos):
+        # Misma salida que `buscar`, con posiciones relativas al texto completo.
+        por_referencia = {}
+        sin_referencia = []
+        for segmento in segmentos:
+            d = segmento["desplazamiento"]
+            parcial, huerfanas = self.buscar(segmento["texto"])
+            for fila, info in parcial.items():
+                total = por_referencia.setdefault(fila, {"conteo": 0, "posiciones": [], "formas": {}})
+                total["conteo"] += info["conteo"]
+                total["posiciones"].extend((a + d, b + d) for a, b in info["posiciones"])
+                for forma, n in info["formas"].items():
+                    total["formas"][forma] = total["formas"].get(forma, 0) + n
+            for cita in huerfanas:
+                a, b = cita["posicion"]
+                sin_referencia.append({**cita, "posicion": (a + d, b + d)})
+        return por_referencia, sin_referencia
+
+
+def indice_para(df):
+    # Reutiliza el índice mientras la tabla sea la misma (hash que deja referencias.cargar_tabla).
+    # Los subconjuntos heredan `attrs`, por eso la clave incluye también las filas.
+    import pandas as pd
+
+    if "sha256" not in df.attrs:
+        return IndiceCitas(df)
+    clave = (df.attrs["sha256"], int(pd.util.hash_pandas_object(df.index, index=False).sum()))
+    with _lock_indices:
+        if clave in _indices:
+            _indices.move_to_end(clave)
+            return _indices[clave]
+    indice = IndiceCitas(df)
+    with _lock_indices:
+        _indices[clave] = indice
+        if len(_indices) > MAX_INDICES_CACHEADOS:
+            _indices.popitem(last=False)
+    return indice
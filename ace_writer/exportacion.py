@@ -0,0 +1,168 @@
+import hashlib
+import html
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+from . import renderizado
+
+ESTILOS_REQUERIDOS = ["Heading 1", "Heading 2", "Normal", "Reference"]
+_TIPO_PLANTILLA = b"wordprocessingml.template.main+xml"
+_TIPO_DOCUMENTO = b"wordprocessingml.document.main+xml"
+
+MAX_PLANTILLAS_CACHEADAS = 8
+_plantillas = OrderedDict()
+# Las sesiones de Streamlit corren en hilos distintos y comparten la cache.
+_lock_plantillas = threading.Lock()
+
+
+def nombre_seguro(texto, defecto="ACEWriter"):
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', texto.strip()) or defecto
+
+
+# --- PLANTILLAS ---
+def _leer(plantilla):
+    if plantilla is None:
+        return b""
+    if isinstance(plantilla, (bytes, bytearray)):
+        return bytes(plantilla)
+    if hasattr(plantilla, "getvalue"):
+        return plantilla.getvalue()
+    with open(plantilla, "rb") as f:
+        return f.read()
+
+
+def normalizar_plantilla(datos):
+    # python-docx rechaza los .dotx por su content type; se reescribe como .docx en memoria.
+    with zipfile.ZipFile(BytesIO(datos)) as origen:
+        tipos = origen.read("[Content_Types].xml")
+        if _TIPO_PLANTILLA not in tipos:
+            return datos
+        salida = BytesIO()
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as destino:
+            for item in origen.infolist():
+                contenido = origen.read(item.filename)
+                if item.filename == "[Content_Types].xml":
+                    contenido = contenido.replace(_TIPO_PLANTILLA, _TIPO_DOCUMENTO)
+                destino.writestr(item, contenido)
+    return salida.getvalue()
+
+
+def cargar_plantilla(plantilla):
+    # Por contenido se cachea solo la lectura, la conversión de .dotx y la lista de estilos. Un
+    # documento de python-docx no se puede compartir ni copiar entre exportaciones, así que cada
+    # una vuelve a abrir el paquete desde los bytes guardados (ver nuevo_documento).
+    import docx
+
+    datos = _leer(plantilla)
+    clave = hashlib.sha256(datos).hexdigest()
+    with _lock_plantillas:
+        if clave in _plantillas:
+            _plantillas.move_to_end(clave)
+            return _plantillas[clave]
+    if datos:
+        datos = normalizar_plantilla(datos)
+        doc = docx.Document(BytesIO(datos))
+    else:
+        doc = docx.Document()
+        buffer = BytesIO()
+        doc.save(buffer)
+        datos = buffer.getvalue()
+    plantilla = {"datos": datos, "estilos": frozenset(s.name for s in doc.styles)}
+    with _lock_plantillas:
+        _plantillas[clave] = plantilla
+        if len(_plantillas) > MAX_PLANTILLAS_CACHEADAS:
+            _plantillas.popitem(last=False)
+    return plantilla
+
+
+def validar_estilos(plantilla, requeridos=ESTILOS_REQUERIDOS):
+    estilos = cargar_plantilla(plantilla)["estilos"]
+    return [{"Estilo": s, "Presente": "✅" if s in estilos else "❌"} for s in requeridos]
+
+
+def nuevo_documento(plantilla):
+    import docx
+
+    return docx.Document(BytesIO(cargar_plantilla(plantilla)["datos"]))
+
+
+def estilo_o_normal(plantilla, estilo):
+    return estilo if estilo in cargar_plantilla(plantilla)["estilos"] else "Normal"
+
+
+def a_buffer(doc):
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# --- EXPORTACIÓN ---
+# El markdown del modelo se parsea una vez (ver renderizado) y se escribe con los estilos de la
+# plantilla: títulos, listas, negritas y tablas en lugar de un único párrafo con los símbolos.
+# Si hay referencias citadas (del CSV), reemplazan al bloque de referencias que escribió el modelo.
+TITULO_REFERENCIAS = "Referencias citadas"
+
+
+def agregar_subtema(doc, plantilla, titulo, texto, referencias):
+    doc.add_heading(titulo, level=1)
+    escritor = renderizado.EscritorDocx(doc, cargar_plantilla(plantilla)["estilos"])
+    escritor.escribir(renderizado.preparar(texto, titulo, sin_referencias=bool(referencias)))
+    if referencias:
+        doc.add_page_break()
+        doc.add_heading(TITULO_REFERENCIAS, level=2)
+        estilo = estilo_o_normal(plantilla, "Reference")
+        for ref in referencias:
+            doc.add_paragraph(ref, style=estilo)
+
+
+def exportar_subtema(plantilla, titulo, texto, referencias):
+    doc = nuevo_documento(plantilla)
+    agregar_subtema(doc, plantilla, titulo, texto, referencias)
+    return a_buffer(doc)
+
+
+def _bloques_con_referencias(titulo, texto, referencias):
+    bloques = renderizado.preparar(texto, titulo, sin_referencias=bool(referencias))
+    if referencias:
+        bloques.append({"tipo": "referencias", "titulo": TITULO_REFERENCIAS,
+                        "entradas": [renderizado.parsear_en_linea(r) for r in referencias]})
+    return bloques
+
+
+def exportar_subtema_markdown(titulo, texto, referencias):
+    return f"# {titulo}\n\n" + renderizado.a_markdown(_bloques_con_referencias(titulo, texto, referencias))
+
+
+def exportar_subtema_html(titulo, texto, referencias):
+    cuerpo = renderizado.a_html(_bloques_con_referencias(titulo, texto, referencias))
+    return renderizado.documento_html(titulo, f"<h1>{html.escape(titulo)}</h1>\n{cuerpo}")
+
+
+def exportar(formato, plantilla, titulo, texto, referencias):
+    # Bytes del archivo en el formato pedido: "docx", "md" o "html".
+    if formato == "md":
+        return exportar_subtema_markdown(titulo, texto, referencias).encode("utf-8")
+    if formato == "html":
+        return exportar_subtema_html(titulo, texto, referencias).encode("utf-8")
+    return exportar_subtema(plantilla, titulo, texto, referencias).getvalue()
+
+
+def exportar_subtemas(plantilla, subtemas, formato="docx"):
+    # Un archivo por subtema dentro de un único .zip, todo en memoria.
+    # `subtemas`: iterable de dicts con "titulo", "texto" y "referencias".
+    salida = BytesIO()
+    usados = set()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as archivo:
+        for i, subtema in enumerate(subtemas, start=1):
+            nombre = nombre_seguro(subtema["titulo"])
+            if nombre in usados:
+                nombre = f"{nombre}_{i}"
+            usados.add(nombre)
+            datos = exportar(formato, plantilla, subtema["titulo"], subtema["texto"], subtema.get("referencias", []))
+            archivo.writestr(f"{nombre}.{formato}", datos)
+    salida.seek(0)
+    return salida
@@ -0,0 +1,364 @@
+import re
+import time
+from types import SimpleNamespace
+
+from . import proveedores
+from .cache_respuestas import clave_completion
+from .citas import clave_referencia, orden_apa
+from .planificador import estimar_tokens
+from .validacion import PATRON_REFERENCIAS, contar_palabras_cuerpo
+
+MODELO = "gpt-4"
+TEMPERATURA = 0.7
+MAX_TOKENS_BASE = 4096
+MAX_TOKENS_EXTENSION = 3000
+PALABRAS_MINIMAS = 1500
+MAX_RONDAS_EXTENSION = 3
+PALABRAS_MINIMAS_POR_RONDA = 50
+PARRAFOS_CONTEXTO = 3
+MAX_PALABRAS_ESQUEMA = 15
+UMBRAL_SOLAPAMIENTO = 0.6
+MIN_TEJAS_SOLAPAMIENTO = 8
+_ENCABEZADO = re.compile(r"^(#{1,6})\s+")
+_VIÑETA = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+
+
+# --- PROMPTS ---
+def construir_prompt(subtema, capitulo, referencias, evitar=""):
+    # `evitar`: lo ya cubierto en otros subtemas del libro (ver solapamiento.pista_no_repetir).
+    no_repetir = f"\n🚫 Ya está desarrollado en otros subtemas del libro; no lo repitas, a lo sumo remití a él:\n{evitar}\n" if evitar else ""
+    return f"""Actuás como redactor científico del Proyecto eBooks ACE.
+Tu tarea es redactar el subtema titulado "{subtema}", parte del capítulo "{capitulo}" de un e-book científico.
+
+📌 Requisitos:
+– Redactar un texto científicamente sólido y bien estructurado. El mínimo es de 1500 palabras reales, pero si el tema se agota correctamente con menos, se puede entregar así.
+– Incluir 1 sugerencia de recurso visual cada 500 palabras
+– Usar solo las referencias proporcionadas
+– Cerrar con sección de referencias APA 7, solo si fueron citadas
+
+📚 Lista de referencias válidas:
+{chr(10).join(referencias)}
+{no_repetir}
+Redactá con tono técnico claro, orientado a entrenadores, usando ejemplos prácticos y subtítulos jerárquicos.
+"""
+
+
+def construir_prompt_extension(texto, palabras_objetivo=PALABRAS_MINIMAS):
+    # Modo continuación: en lugar de reenviar todo el texto se manda un esquema de lo ya
+    # cubierto y los últimos párrafos, y se pide solo la parte nueva.
+    parrafos = dividir_parrafos(separar_bloque_referencias(texto)[0])
+    faltan = max(palabras_objetivo - contar_palabras(texto), 0)
+    return f"""Estás continuando un texto científico ya redactado. No lo repitas ni lo resumas.
+
+🗂️ Lo que ya está cubierto (no volver sobre estos puntos):
+{esquema_cubierto(parrafos[:-PARRAFOS_CONTEXTO])}
+
+📄 Últimos párrafos escritos:
+{(chr(10) * 2).join(parrafos[-PARRAFOS_CONTEXTO:])}
+
+Escribí solo la continuación (unas {faltan} palabras más) con nuevas ideas, ejemplos o subtítulos, \
+manteniendo el mismo tono, formato y criterio de citas.
+"""
+
+
+def necesita_extension(base):
+    return contar_palabras(base) < PALABRAS_MINIMAS
+
+
+def unir_extension(base, extra):
+    # La continuación va antes del bloque de referencias del texto base, que se vuelve a poner
+    # al final con las entradas nuevas que haya traído la continuación.
+    cuerpo, referencias = separar_bloque_referencias(base)
+    cuerpo_extra, referencias_extra = separar_bloque_referencias(extra)
+    nuevos = quitar_solapamientos(dividir_parrafos(cuerpo), dividir_parrafos(cuerpo_extra))
+    unidas = unir_referencias(referencias, referencias_extra)
+    if not nuevos and unidas == referencias:
+        return base
+    return "\n\n".join([p for p in [cuerpo.rstrip()] + nuevos + [unidas] if p])
+
+
+def extender(texto, extra):
+    # Une una ronda de continuación y dice si valió la pena seguir (si aportó palabras nuevas).
+    unido = unir_extension(texto, extra)
+    return unido, contar_palabras(unido) - contar_palabras(texto) >= PALABRAS_MINIMAS_POR_RONDA
+
+
+# --- CONTINUACIÓN ---
+def contar_palabras(texto):
+    # Palabras reales: sin marcado, encabezados, recursos visuales ni bloque de referencias.
+    return contar_palabras_cuerpo(texto)
+
+
+def dividir_parrafos(texto):
+    return [p.strip() for p in re.split(r"\n\s*\n", texto) if p.strip()]
+
+
+def separar_bloque_referencias(texto):
+    # (cuerpo, bloque de referencias final o ""). Un encabezado del mismo nivel o superior que
+    # "Referencias" cierra el bloque, como en validacion.Validador; si se cierra, no es final.
+    lineas = texto.split("\n")
+    inicio = nivel = None
+    for i, linea in enumerate(lineas):
+        encabezado = _ENCABEZADO.match(linea)
+        if PATRON_REFERENCIAS.match(linea):
+            inicio, nivel = i, len(encabezado.group(1)) if encabezado else 0
+        elif encabezado and inicio is not None and not (nivel and len(encabezado.group(1)) > nivel):
+            inicio = nivel = None
+    if inicio is None:
+        return texto, ""
+    return "\n".join(lineas[:inicio]).rstrip(), "\n".join(lineas[inicio:]).strip()
+
+
+def unir_referencias(bloque, extra):
+    # Si `extra` trae entradas que el bloque no tiene (misma clave que en el libro), el bloque se
+    # rearma sin viñetas, con una entrada por párrafo y en orden APA.
+    if not bloque or not extra:
+        return bloque or extra
+
+    def entradas(b):
+        return [_VIÑETA.sub("", linea).strip() for linea in b.split("\n")[1:] if linea.strip()]
+
+    unidas = {}
+    for entrada in entradas(bloque):
+        unidas.setdefault(clave_referencia(entrada), entrada)
+    previas = len(unidas)
+    for entrada in entradas(extra):
+        unidas.setdefault(clave_referencia(entrada), entrada)
+    if len(unidas) == previas:
+        return bloque
+    return "\n\n".join([bloque.split("\n", 1)[0]] + sorted(unidas.values(), key=orden_apa))
+
+
+def esquema_cubierto(parrafos, max_palabras=MAX_PALABRAS_ESQUEMA):
+    # Encabezados completos y la primera oración de cada párrafo, recortada a unas pocas palabras.
+    lineas = []
+    for p in parrafos:
+        if p.startswith("#"):
+            lineas.append(p.splitlines()[0])
+        else:
+            oracion = re.split(r"(?<=[.!?])\s", p, maxsplit=1)[0].split()
+            lineas.append("- " + " ".join(oracion[:max_palabras]) + (" …" if len(oracion) > max_palabras else ""))
+    return "\n".join(lineas) or "(solo los párrafos de abajo)"
+
+
+def _tejas(parrafo, n=3):
+    palabras = re.findall(r"\w+", parrafo.lower())
+    if len(palabras) < n:
+        return {tuple(palabras)} if palabras else set()
+    return {tuple(palabras[i:i + n]) for i in range(len(palabras) - n + 1)}
+
+
+def quitar_solapamientos(previos, nuevos, umbral=UMBRAL_SOLAPAMIENTO, min_tejas=MIN_TEJAS_SOLAPAMIENTO):
+    # Descarta los párrafos nuevos cuyas tejas de 3 palabras están en su mayoría (proporción sobre
+    # las del párrafo nuevo) en un párrafo ya escrito o en uno nuevo anterior: detecta repeticiones
+    # parafraseadas a medias, que la comparación exacta de cadenas no ve. Encabezados y párrafos
+    # con menos de `min_tejas` tejas no entran en la comparación de ningún lado (un título corto
+    # contenido en un párrafo largo no es una repetición); solo se descartan si son idénticos.
+    def comparable(p):
+        return not p.startswith("#")
+
+    exactos = {" ".join(p.split()) for p in previos}
+    vistos = [t for t in (_tejas(p) for p in previos if comparable(p)) if len(t) >= min_tejas]
+    conservados = []
+    for p in nuevos:
+        texto = " ".join(p.split())
+        if texto in exactos:
+            continue
+        exactos.add(texto)
+        tejas = _tejas(p) if comparable(p) else set()
+        if len(tejas) >= min_tejas:
+            if any(len(tejas & v) / len(tejas) >= umbral for v in vistos):
+                continue
+            vistos.append(tejas)
+        conservados.append(p)
+    return conservados
+
+
+# --- LLAMADAS AL MODELO ---
+def crear_cliente(api_key, base_url=None):
+    # OpenAI o, según ACE_PROVEEDOR, un proveedor grabado o sintético (ver proveedores).
+    return proveedores.crear_cliente(api_key, base_url)
+
+
+def crear_cliente_async(api_key, base_url=None):
+    return proveedores.crear_cliente(api_key, base_url, asincrono=True)
+
+
+def _crear(cliente, planificador, prompt, max_tokens, modelo, **extra):
+    def llamar():
+        return cliente.chat.completions.create(
+            model=modelo,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=TEMPERATURA,
+            max_tokens=max_tokens,
+            **extra
+        )
+    if planificador is None:
+        return llamar()
+    return planificador.ejecutar(llamar, estimar_tokens(prompt, max_tokens))
+
+
+async def _crear_async(cliente, planificador, prompt, max_tokens, modelo):
+    def llamar():
+        return cliente.chat.completions.create(
+            model=modelo,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=TEMPERATURA,
+            max_tokens=max_tokens
+        )
+    if planificador is None:
+        return await llamar()
+    return await planificador.ejecutar_async(llamar, estimar_tokens(prompt, max_tokens))
+
+
+def _consultar_cache(cache, forzar, prompt, modelo, max_tokens):
+    # Devuelve (clave, texto_cacheado); sin cache no hay clave y `forzar` salta la lectura
+    # pero deja que la nueva respuesta reemplace a la anterior.
+    if cache is None:
+        return None, None
+    clave = clave_completion(prompt, modelo, TEMPERATURA, max_tokens)
+    return clave, (None if forzar else cache.obtener(clave))
+
+
+def _registrar(registro, modelo, inicio, usage=None, cache=False):
+    if registro is None:
+        return
+    registro.llamada(
+        modelo,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        segundos=time.perf_counter() - inicio,
+        cache=cache,
+    )
+
+
+def completar(cliente, prompt, max_tokens, modelo=MODELO, cache=None, forzar=False, planificador=None, registro=None):
+    inicio = time.perf_counter()
+    clave, texto = _consultar_cache(cache, forzar, prompt, modelo, max_tokens)
+    if texto is not None:
+        _registrar(registro, modelo, inicio, cache=True)
+        return texto
+    r = _crear(cliente, planificador, prompt, max_tokens, modelo)
+    _registrar(registro, modelo, inicio, r.usage)
+    texto = r.choices[0].message.content
+    if clave:
+        cache.guardar(clave, texto)
+    return texto
+
+
+def completar_en_vivo(cliente, prompt, max_tokens, modelo=MODELO, metricas=None, cache=None, forzar=False,
+                      planificador=None, registro=None):
+    # Generador de fragmentos de texto; completa `metricas` con ttft y tokens/s al terminar
+    # o al cortarse (si el consumidor deja de iterar se cierra el stream y no se sigue pagando).
+    metricas = {} if metricas is None else metricas
+    inicio = time.perf_counter()
+    clave, texto = _consultar_cache(cache, forzar, prompt, modelo, max_tokens)
+    if texto is not None:
+        metricas["cache"] = True
+        metricas["tokens"] = 0
+        _cerrar_metricas(metricas, inicio, 0)
+        _registrar(registro, modelo, inicio, cache=True)
+        yield texto
+        return
+    # Solo se reintenta la apertura del stream; un corte a mitad de respuesta se propaga.
+    flujo = _crear(cliente, planificador, prompt, max_tokens, modelo,
+                   stream=True, stream_options={"include_usage": True})
+    fragmentos = []
+    completo = False
+    usage = None
+    try:
+        for chunk in flujo:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+                metricas["tokens"] = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not fragmentos:
+                metricas["ttft"] = time.perf_counter() - inicio
+            fragmentos.append(delta)
+            yield delta
+        completo = True
+    finally:
+        flujo.close()
+        _cerrar_metricas(metricas, inicio, len(fragmentos))
+        # Un stream cortado no trae `usage`: se estima la salida por fragmentos y la entrada queda en 0.
+        _registrar(registro, modelo, inicio, usage or SimpleNamespace(completion_tokens=metricas["tokens"]))
+    # Solo se cachean respuestas completas: un stream cortado no debe servirse después.
+    if completo and clave:
+        cache.guardar(clave, "".join(fragmentos))
+
+
+def _cerrar_metricas(metricas, inicio, fragmentos):
+    duracion = time.perf_counter() - inicio
+    metricas["duracion"] = round(duracion, 3)
+    metricas["ttft"] = round(metricas.get("ttft", duracion), 3)
+    # Sin `usage` (stream cortado o servidor que no lo envía) cada fragmento cuenta como un token.
+    metricas.setdefault("tokens", fragmentos)
+    generando = duracion - metricas["ttft"]
+    metricas["tokens_por_segundo"] = round(metricas["tokens"] / generando, 1) if generando > 0 else 0.0
+    return metricas
+
+
+async def completar_async(cliente, prompt, max_tokens, modelo=MODELO, cache=None, forzar=False, planificador=None,
+                          registro=None):
+    inicio = time.perf_counter()
+    clave, texto = _consultar_cache(cache, forzar, prompt, modelo, max_tokens)
+    if texto is not None:
+        _registrar(registro, modelo, inicio, cache=True)
+        return texto
+    r = await _crear_async(cliente, planificador, prompt, max_tokens, modelo)
+    _registrar(registro, modelo, inicio, r.usage)
+    texto = r.choices[0].message.content
+    if clave:
+        cache.guardar(clave, texto)
+    return texto
+
+
+def redactar(cliente, subtema, capitulo, referencias, modelo=MODELO, cache=None, forzar=False, planificador=None,
+             registro=None, evitar="", al_avanzar=None, metricas=None):
+    # Base + rondas de continuación, con streaming. `al_avanzar(texto)` recibe el texto acumulado
+    # en cada fragmento (para mostrarlo o persistirlo); `metricas` se llena con una entrada por llamada.
+    metricas = [] if metricas is None else metricas
+
+    def en_vivo(prompt, max_tokens, etapa, previo=""):
+        m = {"etapa": etapa}
+        metricas.append(m)
+        texto = ""
+        for fragmento in completar_en_vivo(cliente, prompt, max_tokens, modelo, m, cache, forzar, planificador, registro):
+            texto += fragmento
+            if al_avanzar:
+                al_avanzar(previo + texto)
+        return texto
+
+    texto = en_vivo(construir_prompt(subtema, capitulo, referencias, evitar), MAX_TOKENS_BASE, "base")
+    for ronda in range(1, MAX_RONDAS_EXTENSION + 1):
+        if not necesita_extension(texto):
+            break
+        # La vista previa muestra la continuación debajo del cuerpo; las referencias vuelven al unir.
+        previo = separar_bloque_referencias(texto)[0] + "\n\n"
+        extra = en_vivo(construir_prompt_extension(texto), MAX_TOKENS_EXTENSION, f"extensión {ronda}", previo)
+        texto, agregado = extender(texto, extra)
+        if al_avanzar:
+            al_avanzar(texto)
+        if not agregado:
+            break
+    return texto
+
+
+async def redactar_async(cliente, subtema, capitulo, referencias, modelo=MODELO, cache=None, forzar=False,
+                         planificador=None, registro=None, evitar=""):
+    prompt = construir_prompt(subtema, capitulo, referencias, evitar)
+    texto = await completar_async(cliente, prompt, MAX_TOKENS_BASE, modelo, cache, forzar, planificador, registro)
+    for _ in range(MAX_RONDAS_EXTENSION):
+        if not necesita_extension(texto):
+            break
+        extension = construir_prompt_extension(texto)
+        extra = await completar_async(cliente, extension, MAX_TOKENS_EXTENSION, modelo, cache, forzar, planificador,
+                                      registro)
+        texto, agregado = extender(texto, extra)
+        if not agregado:
+            break
+    return texto
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+RUTA_LOG = ".cache_ace/metricas.jsonl"
+# USD por 1000 tokens (entrada, salida). Los modelos sin precio conocido se registran con costo 0.
+PRECIOS = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+def precio(modelo):
+    # Coincidencia por prefijo más largo: "gpt-4o-2024-08-06" usa el precio de "gpt-4o".
+    candidatos = [m for m in PRECIOS if modelo == m or modelo.startswith(m + "-")]
+    return PRECIOS[max(candidatos, key=len)] if candidatos else (0.0, 0.0)
+
+
+def calcular_costo(modelo, prompt_tokens, completion_tokens):
+    entrada, salida = precio(modelo)
+    return (prompt_tokens * entrada + completion_tokens * salida) / 1000
+
+
+class Registro:
+    # Cronómetros por etapa y contadores de tokens/costo por modelo. Cada evento se agrega a un
+    # JSONL local; si hay `ruta_prometheus` se reescribe además un textfile para node_exporter.
+    # Con `padre` los eventos también se suman a otro registro (p. ej. uno por proceso).
+
+    def __init__(self, ruta_log=RUTA_LOG, ruta_prometheus=None, sesion=None, padre=None):
+        self.ruta_log = Path(ruta_log) if ruta_log else None
+        self.ruta_prometheus = Path(ruta_prometheus) if ruta_prometheus else None
+        self.sesion = sesion or uuid.uuid4().hex[:12]
+        self.padre = padre
+        self._lock = threading.Lock()
+        self._etapas = {}
+        self._llamadas = {}
+        if self.ruta_log:
+            self.ruta_log.parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def etapa(self, nombre, **datos):
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            self.registrar({"tipo": "etapa", "etapa": nombre, "segundos": time.perf_counter() - inicio, **datos})
+
+    def llamada(self, modelo, prompt_tokens=0, completion_tokens=0, segundos=0.0, cache=False):
+        self.registrar({
+            "tipo": "llamada",
+            "modelo": modelo,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "segundos": segundos,
+            "costo": 0.0 if cache else calcular_costo(modelo, prompt_tokens, completion_tokens),
+            "cache": cache,
+        })
+
+    def registrar(self, evento):
+        evento = {"ts": time.time(), "sesion": self.sesion, **evento}
+        with self._lock:
+            self._acumular(evento)
+            if self.ruta_log:
+                with open(self.ruta_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+            if self.ruta_prometheus:
+                self._escribir_prometheus()
+        if self.padre:
+            self.padre.registrar(evento)
+
+    def _acumular(self, evento):
+        if evento["tipo"] == "etapa":
+            e = self._etapas.setdefault(evento["etapa"], {"veces": 0, "segundos": 0.0})
+            e["veces"] += 1
+            e["segundos"] += evento["segundos"]
+            return
+        m = self._llamadas.setdefault(evento["modelo"], {
+            "llamadas": 0, "desde_cache": 0, "prompt_tokens": 0, "completion_tokens": 0, "segundos": 0.0, "costo": 0.0
+        })
+        m["llamadas"] += 1
+        m["desde_cache"] += int(evento["cache"])
+        for clave in ("prompt_tokens", "completion_tokens", "segundos", "costo"):
+            m[clave] += evento[clave]
+
+    def resumen(self):
+        with self._lock:
+            etapas = {k: {**v, "segundos": round(v["segundos"], 3)} for k, v in self._etapas.items()}
+            llamadas = {k: {**v, "segundos": round(v["segundos"], 3), "costo": round(v["costo"], 4)}
+                        for k, v in self._llamadas.items()}
+        return {
+            "etapas": etapas,
+            "llamadas": llamadas,
+            "costo_total": round(sum(m["costo"] for m in llamadas.values()), 4),
+            "tokens_totales": sum(m["prompt_tokens"] + m["completion_tokens"] for m in llamadas.values()),
+        }
+
+    def tabla(self):
+        # Filas listas para un DataFrame: una por etapa y una por modelo.
+        r = self.resumen()
+        filas = [{"Etapa": k, "Veces": v["veces"], "Segundos": v["segundos"], "Tokens": 0, "Costo USD": 0.0}
+                 for k, v in r["etapas"].items()]
+        filas += [{"Etapa": f"LLM {k}", "Veces": v["llamadas"], "Segundos": v["segundos"],
+                   "Tokens": v["prompt_tokens"] + v["completion_tokens"], "Costo USD": v["costo"]}
+                  for k, v in r["llamadas"].items()]
+        return filas
+
+    def _escribir_prometheus(self):
+        lineas = [
+            "# TYPE ace_etapa_segundos_total counter",
+            *(f'ace_etapa_segundos_total{{etapa="{k}"}} {v["segundos"]:.6f}' for k, v in self._etapas.items()),
+            "# TYPE ace_etapa_ejecuciones_total counter",
+            *(f'ace_etapa_ejecuciones_total{{etapa="{k}"}} {v["veces"]}' for k, v in self._etapas.items()),
+            "# TYPE ace_llm_llamadas_total counter",
+            *(f'ace_llm_llamadas_total{{modelo="{k}"}} {v["llamadas"]}' for k, v in self._llamadas.items()),
+            "# TYPE ace_llm_llamadas_cache_total counter",
+            *(f'ace_llm_llamadas_cache_total{{modelo="{k}"}} {v["desde_cache"]}' for k, v in self._llamadas.items()),
+            "# TYPE ace_llm_tokens_total counter",
+            *(f'ace_llm_tokens_total{{modelo="{k}",tipo="{t}"}} {v[t + "_tokens"]}'
+              for k, v in self._llamadas.items() for t in ("prompt", "completion")),
+            "# TYPE ace_llm_segundos_total counter",
+            *(f'ace_llm_segundos_total{{modelo="{k}"}} {v["segundos"]:.6f}' for k, v in self._llamadas.items()),
+            "# TYPE ace_llm_costo_usd_total counter",
+            *(f'ace_llm_costo_usd_total{{modelo="{k}"}} {v["costo"]:.6f}' for k, v in self._llamadas.items()),
+        ]
+        # node_exporter puede leer en cualquier momento: se escribe aparte y se reemplaza de una vez.
+        self.ruta_prometheus.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta_prometheus.with_suffix(".tmp")
+        temporal.write_text("\n".join(lineas) + "\n", encoding="utf-8")
+        os.replace(temporal, self.ruta_prometheus)
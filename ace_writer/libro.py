@@ -0,0 +1,135 @@
+import argparse
+import re
+import time
+from pathlib import Path
+
+from . import citas, exportacion, renderizado
+from .citas import clave_referencia, orden_apa
+from .lote import leer_manifiesto, ruta_salida
+from .referencias import cargar_tabla, formatear_apa
+
+# --- ESCRITURA DIRECTA DE PÁRRAFOS ---
+# python-docx inserta cada párrafo buscando el sectPr (O(n) por párrafo) y resuelve estilos por
+# nombre en cada llamada; para un libro entero se arman los <w:p> y se agregan al final del body.
+def _parrafo(texto, estilo_id=None):
+    return renderizado.parrafo_docx([(texto, False, False, False, None)], estilo_id)
+
+
+def _salto_pagina():
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    p = renderizado.parrafo_docx([])
+    r = OxmlElement("w:r")
+    br = OxmlElement("w:br")
+    br.set(qn("w:type"), "page")
+    r.append(br)
+    p.append(r)
+    return p
+
+
+# --- ENSAMBLADO ---
+def ensamblar_libro(subtemas, plantilla=None, titulo_referencias="Referencias"):
+    # `subtemas`: iterable (puede ser un generador) de dicts con "capitulo", "subtema", "texto" y
+    # opcionalmente "referencias" (sin esa clave se usan las entradas del bloque de referencias que
+    # el modelo escribió en el subtema), con los subtemas de cada capítulo seguidos (ver agrupar_por_capitulo); un
+    # capítulo que reaparece más adelante es un ValueError. Cada texto se escribe y se descarta;
+    # solo se acumulan las referencias, deduplicadas por clave. Devuelve (buffer, resumen).
+    doc = exportacion.nuevo_documento(plantilla)
+    escritor = renderizado.EscritorDocx(doc, exportacion.cargar_plantilla(plantilla)["estilos"])
+    estilos = {nombre: escritor.estilo(nombre) for nombre in ("Normal", "Reference")}
+    estilos.update({"Heading 1": escritor.estilo_titulo(1), "Heading 2": escritor.estilo_titulo(2)})
+    body = doc.element.body
+    sect_pr = body.sectPr
+    if sect_pr is not None:
+        body.remove(sect_pr)
+
+    referencias = {}
+    resumen = {"capitulos": 0, "subtemas": 0, "parrafos": 0, "referencias_recibidas": 0}
+    capitulo_actual = None
+    cerrados = set()
+    for subtema in subtemas:
+        if subtema["capitulo"] != capitulo_actual:
+            if subtema["capitulo"] in cerrados:
+                raise ValueError(f"El capítulo {subtema['capitulo']!r} reaparece después de otro; "
+                                 "agrupá los subtemas por capítulo")
+            if capitulo_actual is not None:
+                cerrados.add(capitulo_actual)
+                body.append(_salto_pagina())
+            capitulo_actual = subtema["capitulo"]
+            body.append(_parrafo(capitulo_actual, estilos["Heading 1"]))
+            resumen["capitulos"] += 1
+        body.append(_parrafo(subtema["subtema"], estilos["Heading 2"]))
+        # El modelo cierra cada subtema con su propia lista; en el libro va una sola lista global.
+        # Los títulos internos del subtema quedan por debajo de su Heading 2.
+        bloques = renderizado.preparar(subtema["texto"], subtema["subtema"])
+        propias = [renderizado.texto_plano(e) for b in bloques if b["tipo"] == "referencias" for e in b["entradas"]]
+        for elemento in escritor.elementos([b for b in bloques if b["tipo"] != "referencias"], nivel_base=3):
+            body.append(elemento)
+            resumen["parrafos"] += 1
+        recibidas = subtema.get("referencias")
+        for ref in propias if recibidas is None else recibidas:
+            referencias.setdefault(clave_referencia(ref), ref)
+            resumen["referencias_recibidas"] += 1
+        resumen["subtemas"] += 1
+
+    if referencias:
+        body.append(_salto_pagina())
+        body.append(_parrafo(titulo_referencias, estilos["Heading 1"]))
+        for ref in sorted(referencias.values(), key=orden_apa):
+            body.append(_parrafo(ref, estilos["Reference"]))
+    resumen["referencias_unicas"] = len(referencias)
+
+    if sect_pr is not None:
+        body.append(sect_pr)
+    return exportacion.a_buffer(doc), resumen
+
+
+# --- LÍNEA DE COMANDOS ---
+def agrupar_por_capitulo(entradas):
+    # [(índice en el manifiesto, entrada)] con los capítulos en el orden de su primera aparición y,
+    # dentro de cada uno, los subtemas en el orden del manifiesto.
+    capitulos = {}
+    for i, entrada in enumerate(entradas, start=1):
+        capitulos.setdefault(entrada["capitulo"], []).append((i, entrada))
+    return [par for pares in capitulos.values() for par in pares]
+
+
+def subtemas_desde_lote(manifiesto, carpeta, df_referencias=None):
+    # Lee los .md que escribe lote.py, uno por vez, agrupados por capítulo (solo se reordena el
+    # manifiesto; los textos se siguen leyendo de a uno).
+    indice = citas.indice_para(df_referencias) if df_referencias is not None else None
+    for i, entrada in agrupar_por_capitulo(leer_manifiesto(manifiesto)):
+        archivo = ruta_salida(carpeta, i, entrada)
+        if not archivo.exists():
+            continue
+        texto = archivo.read_text(encoding="utf-8")
+        texto = re.sub(r"\A#\s.*\n+", "", texto)
+        if indice is None:
+            # Sin CSV, el libro arma la lista global con las referencias que escribió el modelo.
+            yield {**entrada, "texto": texto}
+            continue
+        encontradas, _ = indice.buscar(texto)
+        yield {**entrada, "texto": texto, "referencias": formatear_apa(df_referencias.loc[sorted(encontradas)]).tolist()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Arma un único .docx con todos los subtemas generados en lote.")
+    parser.add_argument("manifiesto", help="El mismo manifiesto usado con lote.py")
+    parser.add_argument("carpeta", help="Carpeta de salida de lote.py")
+    parser.add_argument("-o", "--salida", default="libro.docx")
+    parser.add_argument("--plantilla", help="Plantilla Word (.dotx/.docx)")
+    parser.add_argument("--referencias", help="CSV de referencias para armar la lista global de citadas (sin él se usan las listas de cada subtema)")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    df = cargar_tabla(Path(args.referencias).read_bytes()) if args.referencias else None
+    buffer, resumen = ensamblar_libro(subtemas_desde_lote(args.manifiesto, args.carpeta, df), args.plantilla)
+    Path(args.salida).write_bytes(buffer.getvalue())
+    print(f"{resumen['capitulos']} capítulos, {resumen['subtemas']} subtemas, {resumen['parrafos']} párrafos, "
+          f"{resumen['referencias_unicas']} referencias únicas (de {resumen['referencias_recibidas']}) "
+          f"en {time.perf_counter() - inicio:.1f}s -> {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
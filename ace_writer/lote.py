@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from . import generacion, secciones
+from .exportacion import nombre_seguro
+from .instrumentacion import RUTA_LOG, Registro
+from .planificador import RPM, TPM, Planificador
+from .cache_respuestas import RUTA_POR_DEFECTO, CacheCompletions
+from .catalogo import RUTA_POR_DEFECTO as RUTA_CATALOGO, CatalogoBibliografico
+from .referencias import cargar_tabla, separar_referencias
+from .relevancia import PRESUPUESTO_TOKENS_REFERENCIAS, seleccionar_referencias
+from .solapamiento import RUTA_POR_DEFECTO as RUTA_SOLAPAMIENTO, IndiceSolapamiento, resumir_por_subtema
+
+CONCURRENCIA = 4
+
+
+# --- ENTRADAS ---
+def leer_manifiesto(ruta):
+    ruta = Path(ruta)
+    if ruta.suffix.lower() == ".json":
+        entradas = json.loads(ruta.read_text(encoding="utf-8"))
+    else:
+        import pandas as pd
+
+        entradas = pd.read_csv(ruta).to_dict("records")
+    return [{"capitulo": str(e["capitulo"]).strip(), "subtema": str(e["subtema"]).strip()} for e in entradas]
+
+
+def leer_referencias(ruta, catalogo=None):
+    df = cargar_tabla(Path(ruta).read_bytes())
+    if catalogo:
+        df, _ = catalogo.completar(df)
+    completas, _ = separar_referencias(df)
+    return completas
+
+
+def ruta_salida(salida, indice, entrada):
+    return Path(salida) / f"{indice:03d}_{nombre_seguro(entrada['capitulo'])}_{nombre_seguro(entrada['subtema'])}.md"
+
+
+# --- EJECUCIÓN CONCURRENTE ---
+async def _generar_uno(cliente, semaforo, indice, entrada, referencias, salida, modelo, cache, forzar, presupuesto,
+                       planificador, por_secciones, registro, solapamiento):
+    archivo = ruta_salida(salida, indice, entrada)
+    resultado = {**entrada, "archivo": str(archivo), "error": "", "segundos": 0.0}
+    async with semaforo:
+        inicio = time.perf_counter()
+        try:
+            with registro.etapa("selección de referencias"):
+                incluidas, descartadas = seleccionar_referencias(
+                    referencias, entrada["subtema"], entrada["capitulo"], presupuesto
+                )
+            resultado["referencias_incluidas"] = len(incluidas)
+            resultado["referencias_descartadas"] = len(descartadas)
+            evitar = solapamiento.pista_no_repetir(entrada["capitulo"], entrada["subtema"]) if solapamiento else ""
+            redactar = secciones.redactar_por_secciones_async if por_secciones else generacion.redactar_async
+            with registro.etapa("redacción", subtema=entrada["subtema"]):
+                texto = await redactar(
+                    cliente, entrada["subtema"], entrada["capitulo"], [r["referencia"] for r in incluidas],
+                    modelo, cache, forzar, planificador, registro, evitar=evitar
+                )
+            archivo.write_text(f"# {entrada['subtema']}\n\n{texto}\n", encoding="utf-8")
+            if solapamiento:
+                # Los subtemas que se generan a la vez no se ven entre sí; sí todos los anteriores.
+                with registro.etapa("solapamiento"):
+                    repetidas = solapamiento.buscar(texto, excluir=(entrada["capitulo"], entrada["subtema"]))
+                    solapamiento.indexar(entrada["capitulo"], entrada["subtema"], texto)
+                resultado["solapamientos"] = resumir_por_subtema(repetidas)
+        except Exception as e:
+            resultado["error"] = str(e)
+        resultado["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+async def generar_lote(entradas, referencias, salida, api_key=None, base_url=None,
+                       concurrencia=CONCURRENCIA, modelo=generacion.MODELO, cliente=None,
+                       cache=None, forzar=False, presupuesto_referencias=PRESUPUESTO_TOKENS_REFERENCIAS,
+                       planificador=None, por_secciones=False, registro=None, solapamiento=None):
+    registro = registro or Registro(ruta_log=None)
+    salida = Path(salida)
+    salida.mkdir(parents=True, exist_ok=True)
+    cliente = cliente or generacion.crear_cliente_async(api_key, base_url)
+    semaforo = asyncio.Semaphore(max(1, concurrencia))
+    tareas = [
+        _generar_uno(
+            cliente, semaforo, i, entrada, referencias, salida, modelo, cache, forzar, presupuesto_referencias, planificador,
+            por_secciones, registro, solapamiento
+        )
+        for i, entrada in enumerate(entradas, start=1)
+    ]
+    return await asyncio.gather(*tareas)
+
+
+# --- LÍNEA DE COMANDOS ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera en lote los subtemas de un eBook ACE.")
+    parser.add_argument("manifiesto", help="CSV o JSON con columnas 'capitulo' y 'subtema'")
+    parser.add_argument("referencias", help="CSV de referencias validadas")
+    parser.add_argument("-o", "--salida", default="salida_lote", help="Carpeta donde escribir un .md por subtema")
+    parser.add_argument("-c", "--concurrencia", type=int, default=CONCURRENCIA)
+    parser.add_argument("--modelo", default=generacion.MODELO)
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="Endpoint compatible con OpenAI (p. ej. un servidor stub local)")
+    parser.add_argument("--cache", default=RUTA_POR_DEFECTO, help="Archivo de cache de respuestas")
+    parser.add_argument("--sin-cache", action="store_true", help="No leer ni escribir la cache")
+    parser.add_argument("--forzar", action="store_true", help="Regenerar aunque haya respuesta cacheada")
+    parser.add_argument("--presupuesto-referencias", type=int, default=PRESUPUESTO_TOKENS_REFERENCIAS,
+                        help="Tokens máximos de referencias por prompt, las más relevantes primero (0 = sin límite)")
+    parser.add_argument("--por-secciones", action="store_true",
+                        help="Generar primero un esquema y luego todas sus secciones en paralelo")
+    parser.add_argument("--solapamiento", default=RUTA_SOLAPAMIENTO,
+                        help="Índice de oraciones de todos los subtemas generados, para detectar repeticiones entre ellos")
+    parser.add_argument("--sin-solapamiento", action="store_true", help="No consultar ni actualizar el índice")
+    parser.add_argument("--catalogo", default=RUTA_CATALOGO,
+                        help="Catálogo bibliográfico local para completar referencias incompletas")
+    parser.add_argument("--metricas", default=RUTA_LOG, help="Log JSONL de tiempos, tokens y costos")
+    parser.add_argument("--prometheus", help="Ruta de un textfile de Prometheus para node_exporter")
+    parser.add_argument("--rpm", type=int, default=RPM, help="Solicitudes por minuto permitidas")
+    parser.add_argument("--tpm", type=int, default=TPM, help="Tokens por minuto permitidos")
+    args = parser.parse_args(argv)
+
+    registro = Registro(ruta_log=args.metricas, ruta_prometheus=args.prometheus)
+    with registro.etapa("lectura de entradas"):
+        entradas = leer_manifiesto(args.manifiesto)
+        referencias = leer_referencias(args.referencias, CatalogoBibliografico(args.catalogo))
+    cache = None if args.sin_cache else CacheCompletions(args.cache)
+    planificador = Planificador(rpm=args.rpm, tpm=args.tpm)
+    solapamiento = None if args.sin_solapamiento else IndiceSolapamiento(args.solapamiento)
+    inicio = time.perf_counter()
+    resultados = asyncio.run(generar_lote(
+        entradas, referencias, args.salida,
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        base_url=args.base_url,
+        concurrencia=args.concurrencia,
+        modelo=args.modelo,
+        cache=cache,
+        forzar=args.forzar,
+        presupuesto_referencias=args.presupuesto_referencias,
+        planificador=planificador,
+        por_secciones=args.por_secciones,
+        registro=registro,
+        solapamiento=solapamiento,
+    ))
+    total = time.perf_counter() - inicio
+
+    errores = [r for r in resultados if r["error"]]
+    for r in resultados:
+        estado = f"❌ {r['error']}" if r["error"] else f"✅ {r['segundos']}s"
+        print(f"{r['capitulo']} / {r['subtema']}: {estado}")
+        for (capitulo, subtema), cantidad in r.get("solapamientos", {}).items():
+            print(f"    ♻️ {cantidad} oraciones parecidas a «{subtema}» ({capitulo})")
+    print(f"{len(resultados) - len(errores)}/{len(resultados)} subtemas generados en {total:.1f}s")
+    m = registro.resumen()
+    print(f"Modelo: {m['tokens_totales']} tokens, costo estimado US$ {m['costo_total']:.2f}")
+    p = planificador.estadisticas()
+    print(f"Planificador: {p['solicitudes']} solicitudes, {p['reintentos']} reintentos, "
+          f"espera media {p['espera_media']}s (máx. {p['espera_maxima']}s)")
+    if cache:
+        e = cache.estadisticas()
+        print(f"Cache: {e['aciertos']} aciertos, {e['fallos']} fallos ({e['entradas']} entradas, {e['bytes']} bytes)")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,201 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+RPM = 60
+TPM = 40000
+MAX_REINTENTOS = 6
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 60.0
+_ESTADOS_REINTENTABLES = {408, 409, 429}
+
+
+# --- CLIENTES COMPARTIDOS ---
+@lru_cache(maxsize=16)
+def cliente_compartido(api_key, base_url=None):
+    # Un solo cliente (y su pool de conexiones HTTP) por clave y endpoint. Los reintentos del SDK
+    # se desactivan: de eso se encarga el planificador, que conoce los límites compartidos.
+    # El SDK se importa acá y no al cargar el módulo (casi 1 s de arranque).
+    import openai
+
+    return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+_clientes_async = weakref.WeakKeyDictionary()
+_lock_clientes = threading.Lock()
+
+
+def cliente_compartido_async(api_key, base_url=None):
+    # El cliente async queda ligado a su event loop; se comparte dentro de cada loop. Los clientes
+    # se indexan por el loop mismo (no por su id, que se reutiliza) y se descartan los de loops
+    # cerrados, porque sus conexiones pueden seguir referenciando al loop y no dejarlo liberar.
+    import openai
+
+    loop = asyncio.get_running_loop()
+    with _lock_clientes:
+        for cerrado in [otro for otro in _clientes_async if otro.is_closed()]:
+            del _clientes_async[cerrado]
+        clientes = _clientes_async.setdefault(loop, {})
+        if (api_key, base_url) not in clientes:
+            clientes[(api_key, base_url)] = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        return clientes[(api_key, base_url)]
+
+
+# --- ERRORES ---
+def es_reintentable(error):
+    # Errores HTTP por su código (los del SDK y los simulados de proveedores.py); sin código,
+    # solo los de conexión del SDK.
+    estado = getattr(error, "status_code", None)
+    if isinstance(estado, int):
+        return estado in _ESTADOS_REINTENTABLES or estado >= 500
+    import openai
+
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def espera_indicada(error):
+    # Segundos pedidos por el servidor (retry-after-ms / Retry-After en segundos o fecha HTTP).
+    respuesta = getattr(error, "response", None)
+    if respuesta is None:
+        return None
+    cabeceras = respuesta.headers
+    if cabeceras.get("retry-after-ms"):
+        try:
+            return float(cabeceras["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    valor = cabeceras.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, fecha.timestamp() - time.time()) if fecha else None
+
+
+def estimar_tokens(prompt, max_tokens):
+    # La API descuenta del TPM el prompt más max_tokens; ~4 caracteres por token alcanza para planificar.
+    return len(prompt) // 4 + max_tokens
+
+
+# --- PLANIFICADOR ---
+class Planificador:
+    # Cubetas de fichas para solicitudes y tokens por minuto, compartidas entre hilos (sesiones de
+    # Streamlit) y tareas asyncio. Reintenta errores transitorios con backoff exponencial con jitter
+    # y respeta Retry-After.
+
+    def __init__(self, rpm=RPM, tpm=TPM, max_reintentos=MAX_REINTENTOS, espera_base=ESPERA_BASE,
+                 espera_maxima=ESPERA_MAXIMA):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        self._solicitudes = float(rpm)
+        self._tokens = float(tpm)
+        self._ultimo = time.monotonic()
+        self._en_cola = 0
+        self._stats = {"solicitudes": 0, "reintentos": 0, "errores": 0, "espera_total": 0.0, "espera_maxima": 0.0}
+
+    def _recargar(self, ahora):
+        transcurrido = ahora - self._ultimo
+        self._ultimo = ahora
+        self._solicitudes = min(self.rpm, self._solicitudes + transcurrido * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + transcurrido * self.tpm / 60)
+
+    def _reservar(self, tokens):
+        # Devuelve 0 si reservó capacidad o los segundos a esperar antes de volver a intentar.
+        tokens = min(tokens, self.tpm)
+        with self._lock:
+            self._recargar(time.monotonic())
+            if self._solicitudes >= 1 and self._tokens >= tokens:
+                self._solicitudes -= 1
+                self._tokens -= tokens
+                return 0.0
+            falta_solicitudes = max(0.0, 1 - self._solicitudes) * 60 / self.rpm
+            falta_tokens = max(0.0, tokens - self._tokens) * 60 / self.tpm
+            return max(falta_solicitudes, falta_tokens, 0.01)
+
+    def _backoff(self, intento, error):
+        indicada = espera_indicada(error)
+        if indicada is not None:
+            return min(indicada, self.espera_maxima)
+        # "full jitter": uniforme entre 0 y el tope exponencial
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def _registrar_espera(self, segundos):
+        with self._lock:
+            self._stats["espera_total"] += segundos
+            self._stats["espera_maxima"] = max(self._stats["espera_maxima"], segundos)
+
+    def _contar(self, clave, cantidad=1):
+        with self._lock:
+            self._stats[clave] += cantidad
+
+    def _entrar_cola(self, delta):
+        with self._lock:
+            self._en_cola += delta
+
+    def ejecutar(self, funcion, tokens_estimados):
+        intento = 0
+        while True:
+            inicio = time.monotonic()
+            self._entrar_cola(1)
+            try:
+                while (espera := self._reservar(tokens_estimados)) > 0:
+                    time.sleep(espera)
+            finally:
+                self._entrar_cola(-1)
+            self._registrar_espera(time.monotonic() - inicio)
+            self._contar("solicitudes")
+            try:
+                return funcion()
+            except Exception as e:
+                if not es_reintentable(e) or intento >= self.max_reintentos:
+                    self._contar("errores")
+                    raise
+                self._contar("reintentos")
+                time.sleep(self._backoff(intento, e))
+                intento += 1
+
+    async def ejecutar_async(self, funcion, tokens_estimados):
+        # `funcion` devuelve una corutina nueva en cada intento.
+        intento = 0
+        while True:
+            inicio = time.monotonic()
+            self._entrar_cola(1)
+            try:
+                while (espera := self._reservar(tokens_estimados)) > 0:
+                    await asyncio.sleep(espera)
+            finally:
+                self._entrar_cola(-1)
+            self._registrar_espera(time.monotonic() - inicio)
+            self._contar("solicitudes")
+            try:
+                return await funcion()
+            except Exception as e:
+                if not es_reintentable(e) or intento >= self.max_reintentos:
+                    self._contar("errores")
+                    raise
+                self._contar("reintentos")
+                await asyncio.sleep(self._backoff(intento, e))
+                intento += 1
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["en_cola"] = self._en_cola
+        stats["espera_media"] = round(stats["espera_total"] / stats["solicitudes"], 3) if stats["solicitudes"] else 0.0
+        stats["espera_total"] = round(stats["espera_total"], 3)
+        stats["espera_maxima"] = round(stats["espera_maxima"], 3)
+        return stats
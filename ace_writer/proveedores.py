@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+
+from .cache_respuestas import clave_completion
+from .planificador import cliente_compartido, cliente_compartido_async
+
+# Proveedores de completions intercambiables, con la misma forma que el cliente de OpenAI
+# (`cliente.chat.completions.create(...)`, con o sin stream), para medir y probar la generación
+# sin red ni costo. Se eligen con variables de entorno, así las apps y lote.py no cambian:
+#   ACE_PROVEEDOR=openai (por defecto) | grabar | reproducir | sintetico
+#   ACE_GRABACION=ruta del JSONL de respuestas grabadas
+#   ACE_SINTETICO="latencia=0.8,tokens_por_segundo=40,errores=0.05,cortes=0,palabras=900,semilla=1"
+#   ACE_REPRODUCIR="tiempos=0" (responder al instante) o "velocidad=2" (el doble de rápido)
+PROVEEDORES = ("openai", "grabar", "reproducir", "sintetico")
+RUTA_GRABACION = ".cache_ace/grabacion.jsonl"
+LATENCIA = 0.8
+TOKENS_POR_SEGUNDO = 40.0
+PALABRAS = 900
+PALABRAS_POR_PARRAFO = 90
+PALABRAS_POR_VISUAL = 500
+_FRAGMENTO = re.compile(r"\s*\S+")
+_VOCABULARIO = (
+    "el entrenamiento de fuerza mejora la potencia muscular en deportistas de resistencia cuando se "
+    "controla el volumen la intensidad y la densidad de la carga semanal según la respuesta individual "
+    "del sistema neuromuscular la fatiga acumulada reduce la velocidad de ejecución y por eso conviene "
+    "monitorear cada serie con indicadores objetivos como la pérdida de velocidad el esfuerzo percibido "
+    "y la frecuencia cardíaca durante el periodo competitivo los entrenadores ajustan la periodización "
+    "para sostener las adaptaciones metabólicas y estructurales que favorecen el rendimiento"
+).split()
+
+
+class GrabacionFaltante(LookupError):
+    pass
+
+
+class ErrorSimulado(Exception):
+    # Misma forma que los errores HTTP del SDK (status_code y response.headers), así el
+    # planificador los reintenta igual que a un 429 o un 5xx reales.
+
+    def __init__(self, mensaje, status_code=None, retry_after=None):
+        super().__init__(mensaje)
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+# --- RESPUESTAS CON LA FORMA DEL SDK ---
+def _respuesta(texto, prompt_tokens, completion_tokens):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=texto), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+    )
+
+
+def _chunk(delta=None, usage=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))] if delta else [], usage=usage)
+
+
+def _prompt(parametros):
+    return "\n".join(m["content"] for m in parametros["messages"])
+
+
+def _clave(parametros):
+    # La misma clave que la cache de respuestas: una grabación sirve las mismas llamadas.
+    return clave_completion(_prompt(parametros), parametros["model"], parametros.get("temperature"),
+                            parametros.get("max_tokens"))
+
+
+def _tokens_prompt(parametros):
+    return len(_prompt(parametros)) // 4
+
+
+class FlujoSimulado:
+    # Stream de chunks con la latencia al primer token y el ritmo pedidos; `corte` (índice de
+    # fragmento) simula una conexión que se cae a mitad de respuesta.
+
+    def __init__(self, fragmentos, usage, ttft=0.0, intervalo=0.0, corte=None):
+        self.fragmentos = fragmentos
+        self.usage = usage
+        self.ttft = ttft
+        self.intervalo = intervalo
+        self.corte = corte
+        self.cerrado = False
+
+    def __iter__(self):
+        # El ritmo se mide contra el reloj y no con un sleep por fragmento, que se atrasaría.
+        inicio = time.monotonic() + self.ttft
+        time.sleep(self.ttft)
+        for i, fragmento in enumerate(self.fragmentos):
+            if self.cerrado:
+                return
+            if i == self.corte:
+                raise ErrorSimulado("Conexión cortada a mitad de la respuesta (simulado)")
+            adelanto = inicio + i * self.intervalo - time.monotonic()
+            if adelanto > 0.001:
+                time.sleep(adelanto)
+            yield _chunk(fragmento)
+        yield _chunk(usage=self.usage)
+
+    def close(self):
+        self.cerrado = True
+
+
+class _Proveedor:
+    # Expone `crear(**parametros)` de la subclase con la forma del SDK (cliente.chat.completions.create).
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+
+class ClienteAsincrono:
+    # Versión async de cualquier proveedor (la usa lote.py): cada llamada corre en un hilo.
+
+    def __init__(self, proveedor):
+        async def crear(**parametros):
+            return await asyncio.to_thread(proveedor.crear, **parametros)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=crear))
+
+
+# --- GRABACIÓN Y REPRODUCCIÓN ---
+class Grabacion:
+    # JSONL de respuestas completas, una por línea, direccionadas por la clave de la llamada.
+    # Si la misma llamada se grabó más de una vez, vale la última.
+
+    def __init__(self, ruta=RUTA_GRABACION):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        respuestas = {}
+        if self.ruta.exists():
+            with self.ruta.open(encoding="utf-8") as f:
+                for linea in f:
+                    if linea.strip():
+                        registro = json.loads(linea)
+                        respuestas[registro["clave"]] = registro
+        return respuestas
+
+    def agregar(self, registro):
+        linea = json.dumps(registro, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            with self.ruta.open("a", encoding="utf-8") as f:
+                f.write(linea)
+
+
+class ClienteGrabador(_Proveedor):
+    # Pasa cada llamada al cliente real y guarda la respuesta con su uso de tokens y sus tiempos.
+    # Como en la cache, solo se graban los streams que terminaron completos.
+
+    def __init__(self, cliente, ruta=RUTA_GRABACION):
+        super().__init__()
+        self.cliente = cliente
+        self.grabacion = Grabacion(ruta)
+
+    def _guardar(self, parametros, texto, usage, ttft, duracion):
+        self.grabacion.agregar({
+            "clave": _clave(parametros), "modelo": parametros["model"], "max_tokens": parametros.get("max_tokens"),
+            "texto": texto, "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "ttft": round(ttft, 3), "duracion": round(duracion, 3), "creado": time.time(),
+        })
+
+    def crear(self, **parametros):
+        inicio = time.perf_counter()
+        respuesta = self.cliente.chat.completions.create(**parametros)
+        if not parametros.get("stream"):
+            duracion = time.perf_counter() - inicio
+            self._guardar(parametros, respuesta.choices[0].message.content, respuesta.usage, duracion, duracion)
+            return respuesta
+        return _FlujoGrabado(self, parametros, respuesta, inicio)
+
+
+class _FlujoGrabado:
+    def __init__(self, grabador, parametros, flujo, inicio):
+        self.grabador = grabador
+        self.parametros = parametros
+        self.flujo = flujo
+        self.inicio = inicio
+
+    def __iter__(self):
+        fragmentos, usage, ttft = [], None, None
+        for chunk in self.flujo:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if ttft is None:
+                    ttft = time.perf_counter() - self.inicio
+                fragmentos.append(chunk.choices[0].delta.content)
+            yield chunk
+        duracion = time.perf_counter() - self.inicio
+        self.grabador._guardar(self.parametros, "".join(fragmentos), usage, ttft or duracion, duracion)
+
+    def close(self):
+        self.flujo.close()
+
+
+class ClienteReproductor(_Proveedor):
+    # Sirve las respuestas grabadas sin red. Con `tiempos` reproduce la latencia al primer token y
+    # la duración originales (escaladas por `velocidad`); sin ellos responde al instante.
+
+    def __init__(self, ruta=RUTA_GRABACION, tiempos=True, velocidad=1.0):
+        super().__init__()
+        self.ruta = ruta
+        self.respuestas = Grabacion(ruta).cargar()
+        self.tiempos = tiempos
+        self.velocidad = velocidad
+
+    def crear(self, **parametros):
+        clave = _clave(parametros)
+        registro = self.respuestas.get(clave)
+        if registro is None:
+            raise GrabacionFaltante(f"No hay respuesta grabada para esta llamada ({clave[:12]}) en {self.ruta}; "
+                                    "grabala antes con ACE_PROVEEDOR=grabar")
+        factor = 1 / self.velocidad if self.tiempos else 0.0
+        usage = SimpleNamespace(prompt_tokens=registro["prompt_tokens"], completion_tokens=registro["completion_tokens"])
+        if not parametros.get("stream"):
+            time.sleep(registro["duracion"] * factor)
+            return _respuesta(registro["texto"], usage.prompt_tokens, usage.completion_tokens)
+        fragmentos = _FRAGMENTO.findall(registro["texto"])
+        generando = max(registro["duracion"] - registro["ttft"], 0.0)
+        return FlujoSimulado(fragmentos, usage, registro["ttft"] * factor,
+                             generando * factor / max(len(fragmentos) - 1, 1))
+
+
+# --- PROVEEDOR SINTÉTICO ---
+def texto_sintetico(palabras, rng):
+    # Markdown con la forma de una redacción ACE: subtítulos, párrafos y un recurso visual cada
+    # 500 palabras. Párrafos distintos entre sí para que la continuación no los descarte como repetidos.
+    partes, escritas, parrafos = [], 0, 0
+    while escritas < palabras:
+        if parrafos % 3 == 0:
+            partes.append(f"## Sección {parrafos // 3 + 1}: {' '.join(rng.sample(_VOCABULARIO, 3))}")
+        n = max(1, min(PALABRAS_POR_PARRAFO + rng.randint(-20, 20), palabras - escritas))
+        oracion = " ".join(rng.choice(_VOCABULARIO) for _ in range(n))
+        partes.append(oracion[0].upper() + oracion[1:] + ".")
+        antes, escritas, parrafos = escritas, escritas + n, parrafos + 1
+        if escritas // PALABRAS_POR_VISUAL > antes // PALABRAS_POR_VISUAL:
+            partes.append(f"📊 Sugerencia de recurso visual: gráfico de {' '.join(rng.sample(_VOCABULARIO, 4))}")
+    return "\n\n".join(partes)
+
+
+class ClienteSintetico(_Proveedor):
+    # Genera texto al azar (determinista por prompt y semilla) con la latencia al primer token y
+    # el ritmo de tokens pedidos. `errores`: probabilidad de que la llamada falle con un 429/5xx
+    # (los reintenta el planificador); `cortes`: probabilidad de que el stream se corte a mitad.
+
+    def __init__(self, latencia=LATENCIA, tokens_por_segundo=TOKENS_POR_SEGUNDO, errores=0.0, cortes=0.0,
+                 palabras=PALABRAS, semilla=0):
+        super().__init__()
+        self.latencia = latencia
+        self.tokens_por_segundo = tokens_por_segundo
+        self.errores = errores
+        self.cortes = cortes
+        self.palabras = palabras
+        self.semilla = semilla
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _tirar(self):
+        with self._lock:
+            return self._azar.random()
+
+    def crear(self, **parametros):
+        if self._tirar() < self.errores:
+            time.sleep(self.latencia / 4)
+            estado = (429, 500, 503)[int(self._tirar() * 3)]
+            raise ErrorSimulado(f"Error {estado} simulado", status_code=estado)
+        semilla = hashlib.sha256(f"{self.semilla}:{_clave(parametros)}".encode("utf-8")).hexdigest()
+        palabras = min(self.palabras, int((parametros.get("max_tokens") or self.palabras) * 0.75))
+        texto = texto_sintetico(palabras, random.Random(semilla))
+        fragmentos = _FRAGMENTO.findall(texto)
+        usage = SimpleNamespace(prompt_tokens=_tokens_prompt(parametros), completion_tokens=len(fragmentos))
+        intervalo = 1 / self.tokens_por_segundo if self.tokens_por_segundo else 0.0
+        if not parametros.get("stream"):
+            time.sleep(self.latencia + len(fragmentos) * intervalo)
+            return _respuesta(texto, usage.prompt_tokens, usage.completion_tokens)
+        corte = random.randrange(len(fragmentos)) if fragmentos and self._tirar() < self.cortes else None
+        return FlujoSimulado(fragmentos, usage, self.latencia, intervalo, corte)
+
+
+# --- SELECCIÓN ---
+def leer_opciones(texto):
+    # "latencia=0.8,errores=0.05" -> {"latencia": 0.8, "errores": 0.05}
+    opciones = {}
+    for par in filter(None, (p.strip() for p in (texto or "").split(","))):
+        nombre, _, valor = par.partition("=")
+        opciones[nombre.strip()] = int(valor) if nombre.strip() in ("palabras", "semilla") else float(valor)
+    return opciones
+
+
+@lru_cache(maxsize=16)
+def _proveedor(tipo, api_key, base_url, ruta, opciones):
+    # Uno por configuración, compartido entre hilos como el cliente de OpenAI: la grabación se
+    # lee una sola vez y las escrituras pasan por el mismo lock.
+    if tipo == "grabar":
+        return ClienteGrabador(cliente_compartido(api_key, base_url), ruta)
+    if tipo == "reproducir":
+        return ClienteReproductor(ruta, **leer_opciones(opciones))
+    if tipo == "sintetico":
+        return ClienteSintetico(**leer_opciones(opciones))
+    raise ValueError(f"Proveedor desconocido: {tipo!r} (opciones: {', '.join(PROVEEDORES)})")
+
+
+def crear_cliente(api_key, base_url=None, asincrono=False):
+    tipo = os.environ.get("ACE_PROVEEDOR", "openai")
+    if tipo == "openai":
+        return cliente_compartido_async(api_key, base_url) if asincrono else cliente_compartido(api_key, base_url)
+    variable = {"reproducir": "ACE_REPRODUCIR", "sintetico": "ACE_SINTETICO"}.get(tipo)
+    opciones = os.environ.get(variable, "") if variable else ""
+    proveedor = _proveedor(tipo, api_key, base_url, os.environ.get("ACE_GRABACION", RUTA_GRABACION), opciones)
+    return ClienteAsincrono(proveedor) if asincrono else proveedor
@@ -0,0 +1,162 @@
+import re
+from bisect import bisect_right
+
+import numpy as np
+
+UMBRAL = 0.85
+# Por encima de este número de oraciones se usa MinHash/LSH para generar candidatos.
+LIMITE_EXACTO = 2000
+BLOQUE = 1000
+# 32 bandas x 4 filas: umbral LSH ~0.42 de Jaccard, holgado frente a coseno 0.85 para no perder pares.
+PERMUTACIONES = 128
+FILAS_POR_BANDA = 4
+# Términos presentes en más de esta fracción de oraciones (artículos, preposiciones...) no entran
+# en las firmas: inflan el Jaccard entre oraciones no relacionadas y llenan las cubetas.
+MAX_FRECUENCIA_DOCUMENTAL = 0.01
+# Cubetas más grandes se ignoran en esa banda; los duplicados reales coinciden en otras bandas.
+MAX_CUBETA = 500
+_PRIMO = (1 << 31) - 1
+_FIN_ORACION = re.compile(r'(?<=[.!?])\s+')
+
+
+def dividir_oraciones(texto):
+    return [o for o in _FIN_ORACION.split(texto) if o.strip()]
+
+
+def _oraciones_con_posicion(texto):
+    # Las mismas oraciones que dividir_oraciones, con la posición de cada una en el texto.
+    oraciones, inicios = [], []
+    inicio = 0
+    for corte in [*_FIN_ORACION.finditer(texto), None]:
+        fin = corte.start() if corte else len(texto)
+        if texto[inicio:fin].strip():
+            oraciones.append(texto[inicio:fin])
+            inicios.append(inicio)
+        inicio = corte.end() if corte else fin
+    return oraciones, inicios
+
+
+def _vectorizar(oraciones):
+    # sklearn tarda casi 2 s en importarse: se carga recién cuando hay texto que analizar.
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    try:
+        return TfidfVectorizer().fit_transform(oraciones)
+    except ValueError:
+        # vocabulario vacío: ninguna oración tiene términos comparables
+        return None
+
+
+# --- BÚSQUEDA EXACTA POR BLOQUES ---
+def _pares_exactos(X, umbral, bloque=BLOQUE):
+    # X está normalizada en L2, así que X·Xᵀ es la similitud coseno; se calcula de a bloques de
+    # filas y en formato disperso para no materializar la matriz N×N.
+    filas, columnas, valores = [], [], []
+    XT = X.T.tocsr()
+    for inicio in range(0, X.shape[0], bloque):
+        S = (X[inicio:inicio + bloque] @ XT).tocoo()
+        i = S.row + inicio
+        mascara = (S.col > i) & (S.data > umbral)
+        filas.append(i[mascara])
+        columnas.append(S.col[mascara])
+        valores.append(S.data[mascara])
+    return np.concatenate(filas), np.concatenate(columnas), np.concatenate(valores)
+
+
+# --- MINHASH / LSH ---
+def _conjuntos_minhash(X):
+    # Devuelve (indices, indptr) en formato CSR con los términos de cada oración que entran
+    # en la firma. Oraciones hechas solo de términos frecuentes conservan su conjunto completo.
+    n = X.shape[0]
+    frecuencia = np.bincount(X.indices, minlength=X.shape[1])
+    raro = frecuencia[X.indices] <= max(2, MAX_FRECUENCIA_DOCUMENTAL * n)
+    fila = np.repeat(np.arange(n), np.diff(X.indptr))
+    tiene_raros = np.bincount(fila, weights=raro, minlength=n) > 0
+    conservar = raro | ~tiene_raros[fila]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(fila[conservar], minlength=n))])
+    return X.indices[conservar], indptr
+
+
+def firmas_minhash(indices, indptr, permutaciones, semilla):
+    rng = np.random.default_rng(semilla)
+    a = rng.integers(1, _PRIMO, size=permutaciones, dtype=np.int64)
+    b = rng.integers(0, _PRIMO, size=permutaciones, dtype=np.int64)
+    indices = indices.astype(np.int64)
+    firmas = np.empty((len(indptr) - 1, permutaciones), dtype=np.int64)
+    # Se procesa de a grupos de permutaciones para acotar la memoria a O(nnz · grupo).
+    grupo = 16
+    for k in range(0, permutaciones, grupo):
+        h = (a[k:k + grupo, None] * indices[None, :] + b[k:k + grupo, None]) % _PRIMO
+        firmas[:, k:k + grupo] = np.minimum.reduceat(h, indptr[:-1], axis=1).T
+    return firmas
+
+
+def _candidatos_lsh(firmas, filas_por_banda):
+    n = firmas.shape[0]
+    claves = []
+    for inicio in range(0, firmas.shape[1], filas_por_banda):
+        _, etiquetas = np.unique(firmas[:, inicio:inicio + filas_por_banda], axis=0, return_inverse=True)
+        orden = np.argsort(etiquetas, kind="stable")
+        cortes = np.flatnonzero(np.diff(etiquetas[orden])) + 1
+        for cubeta in np.split(orden, cortes):
+            if len(cubeta) < 2 or len(cubeta) > MAX_CUBETA:
+                continue
+            i, j = np.triu_indices(len(cubeta), k=1)
+            claves.append(cubeta[i] * n + cubeta[j])
+    if not claves:
+        vacio = np.array([], dtype=np.int64)
+        return vacio, vacio
+    claves = np.unique(np.concatenate(claves))
+    return claves // n, claves % n
+
+
+def _pares_lsh(X, umbral, permutaciones=PERMUTACIONES, filas_por_banda=FILAS_POR_BANDA, semilla=0):
+    # Solo oraciones con términos pueden tener firma; se trabaja sobre ese subconjunto.
+    indices = np.flatnonzero(np.diff(X.indptr) > 0)
+    Xn = X[indices].tocsr()
+    firmas = firmas_minhash(*_conjuntos_minhash(Xn), permutaciones, semilla)
+    a, b = _candidatos_lsh(firmas, filas_por_banda)
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    similitudes = np.asarray(Xn[a].multiply(Xn[b]).sum(axis=1)).ravel()
+    mascara = similitudes > umbral
+    return indices[a[mascara]], indices[b[mascara]], similitudes[mascara]
+
+
+# --- API ---
+def pares_redundantes(oraciones, umbral=UMBRAL, metodo="auto"):
+    if len(oraciones) < 2:
+        return []
+    X = _vectorizar(oraciones)
+    if X is None:
+        return []
+    if metodo == "auto":
+        metodo = "exacto" if len(oraciones) <= LIMITE_EXACTO else "lsh"
+    if metodo == "exacto":
+        filas, columnas, valores = _pares_exactos(X, umbral)
+    elif metodo == "lsh":
+        filas, columnas, valores = _pares_lsh(X, umbral)
+    else:
+        raise ValueError(f"Método de redundancia desconocido: {metodo}")
+    orden = np.lexsort((columnas, filas))
+    return [
+        {"i": int(i), "j": int(j), "oracion_a": oraciones[i], "oracion_b": oraciones[j], "similitud": round(float(s), 3)}
+        for i, j, s in zip(filas[orden], columnas[orden], valores[orden])
+    ]
+
+
+def detectar_redundancias(texto, umbral=UMBRAL, metodo="auto"):
+    return pares_redundantes(dividir_oraciones(texto), umbral, metodo)
+
+
+def detectar_redundancias_por_segmentos(texto, segmentos, umbral=UMBRAL, metodo="auto"):
+    # La detección corre una vez sobre el texto entero (una frase repetida en dos segmentos también
+    # cuenta); cada oración del par se ubica en su segmento (ver segmentos.dividir_en_segmentos)
+    # solo para mostrarlo.
+    oraciones, inicios = _oraciones_con_posicion(texto)
+    desplazamientos = [s["desplazamiento"] for s in segmentos]
+
+    def segmento(i):
+        return segmentos[max(bisect_right(desplazamientos, inicios[i]) - 1, 0)]["indice"] if segmentos else 0
+
+    return [{**par, "segmento_a": segmento(par["i"]), "segmento": segmento(par["j"])}
+            for par in pares_redundantes(oraciones, umbral, metodo)]
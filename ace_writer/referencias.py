@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+
+COLUMNAS_CANONICAS = ["Autores", "Año", "Título del artículo", "Journal", "Volumen", "Páginas", "DOI"]
+COLUMNAS_REQUERIDAS = ["Autores", "Año", "Título del artículo", "Journal"]
+
+# Alias aceptados por columna, comparados sin tildes, mayúsculas ni espacios.
+ALIAS = {
+    "Autores": ["autores", "autor", "author", "authors", "autor(es)"],
+    "Año": ["año", "anio", "ano", "year", "fecha"],
+    "Título del artículo": ["título del artículo", "título", "titulo", "title", "título del articulo"],
+    "Journal": ["journal", "revista", "fuente", "source", "publicación"],
+    "Volumen": ["volumen", "volume", "vol", "vol."],
+    "Páginas": ["páginas", "paginas", "pages", "pp", "pp."],
+    "DOI": ["doi", "url doi", "enlace doi"],
+}
+
+MAX_TABLAS_CACHEADAS = 8
+_tablas = OrderedDict()
+# Las sesiones de Streamlit corren en hilos distintos y comparten la cache.
+_lock_tablas = threading.Lock()
+
+
+def _clave_columna(nombre):
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode()
+    return " ".join(sin_tildes.casefold().split())
+
+
+_CANONICA_POR_ALIAS = {
+    _clave_columna(alias): canonica
+    for canonica, aliases in ALIAS.items()
+    for alias in aliases
+}
+
+
+# --- NORMALIZACIÓN ---
+def normalizar_columnas(df):
+    renombres = {}
+    for col in df.columns:
+        canonica = _CANONICA_POR_ALIAS.get(_clave_columna(col))
+        if canonica and canonica not in renombres.values():
+            renombres[col] = canonica
+    df = df.rename(columns=renombres)
+    for col in COLUMNAS_CANONICAS:
+        if col not in df.columns:
+            df[col] = pd.NA
+        valores = df[col].astype("string").str.strip()
+        df[col] = valores.mask(valores == "")
+    # pandas lee años con vacíos como float ("2021.0")
+    df["Año"] = df["Año"].str.replace(r"\.0$", "", regex=True)
+    return df
+
+
+def cargar_tabla(datos):
+    # Acepta bytes o un archivo subido; la tabla normalizada se reutiliza mientras el contenido
+    # no cambie, así los reruns de Streamlit no vuelven a parsear el CSV. Se entrega una copia:
+    # quien la llame puede modificarla sin alterar la versión cacheada.
+    if hasattr(datos, "getvalue"):
+        datos = datos.getvalue()
+    clave = hashlib.sha256(datos).hexdigest()
+    with _lock_tablas:
+        if clave in _tablas:
+            _tablas.move_to_end(clave)
+            return _tablas[clave].copy()
+    df = normalizar_columnas(pd.read_csv(BytesIO(datos)))
+    df.attrs["sha256"] = clave
+    with _lock_tablas:
+        _tablas[clave] = df
+        if len(_tablas) > MAX_TABLAS_CACHEADAS:
+            _tablas.popitem(last=False)
+    return df.copy()
+
+
+# --- CLASIFICACIÓN Y FORMATO ---
+def mascara_completas(df, requeridas=COLUMNAS_REQUERIDAS):
+    return df[list(requeridas)].notna().all(axis=1)
+
+
+def clasificar(df, requeridas=COLUMNAS_REQUERIDAS):
+    mascara = mascara_completas(df, requeridas)
+    return df[mascara], df[~mascara]
+
+
+def normalizar_doi(doi):
+    doi = doi.str.replace(r"^(https?://)?(dx\.)?doi\.org/", "", regex=True, case=False)
+    return doi.where(doi.str.match(r"https?://", na=False), "https://doi.org/" + doi)
+
+
+def _parte(serie, prefijo=""):
+    return (prefijo + serie).fillna("")
+
+
+def formatear_apa(df):
+    if df.empty:
+        return pd.Series([], index=df.index, dtype="string")
+    ref = (
+        df["Autores"].fillna("") + " (" + df["Año"].fillna("s. f.") + "). "
+        + df["Título del artículo"].fillna("") + _parte(df["Journal"], ". ")
+        + _parte(df["Volumen"], ", ") + _parte(df["Páginas"], ", ") + "."
+        + _parte(normalizar_doi(df["DOI"]), " ")
+    )
+    return ref.str.strip()
+
+
+def describir_incompletas(incompletas):
+    return [f"Fila {i+1}: {fila}" for i, fila in zip(incompletas.index, incompletas.to_dict("records"))]
+
+
+def separar_referencias(df):
+    # `df` ya normalizado (ver cargar_tabla); devuelve strings APA y descripciones de filas incompletas.
+    completas, incompletas = clasificar(df)
+    return formatear_apa(completas).tolist(), describir_incompletas(incompletas)
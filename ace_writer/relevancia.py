@@ -0,0 +1,37 @@
+import numpy as np
+
+from .segmentos import contar_tokens
+
+PRESUPUESTO_TOKENS_REFERENCIAS = 1500
+
+
+def puntuar_referencias(referencias, subtema, capitulo=""):
+    # Similitud coseno TF-IDF entre cada referencia y la consulta; el subtema pesa el doble que el capítulo.
+    if not referencias:
+        return np.array([])
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    consulta = f"{subtema} {subtema} {capitulo}"
+    try:
+        X = TfidfVectorizer(strip_accents="unicode", sublinear_tf=True).fit_transform(list(referencias) + [consulta])
+    except ValueError:
+        return np.zeros(len(referencias))
+    return (X[:-1] @ X[-1].T).toarray().ravel()
+
+
+def seleccionar_referencias(referencias, subtema, capitulo="", presupuesto_tokens=PRESUPUESTO_TOKENS_REFERENCIAS,
+                            contar=contar_tokens):
+    # Ordena por relevancia y empaqueta en `presupuesto_tokens` (cada referencia ocupa su línea).
+    # Devuelve (incluidas, descartadas): listas de dicts con la posición original, el puntaje y los tokens.
+    puntajes = puntuar_referencias(referencias, subtema, capitulo)
+    incluidas, descartadas = [], []
+    usados = 0
+    for i in np.argsort(-puntajes, kind="stable"):
+        tokens = contar(referencias[i]) + 1
+        item = {"posicion": int(i), "referencia": referencias[i], "puntaje": round(float(puntajes[i]), 3), "tokens": tokens}
+        if not presupuesto_tokens or usados + tokens <= presupuesto_tokens:
+            incluidas.append(item)
+            usados += tokens
+        else:
+            descartadas.append(item)
+    return incluidas, descartadas
@@ -0,0 +1,452 @@
+import html
+import re
+
+from . import citas
+from .validacion import PATRON_REFERENCIAS, PATRON_VISUAL
+
+_ENCABEZADO = re.compile(r"^(#{1,6})\s+(.*?)[\s#]*$")
+_CERCO = re.compile(r"^\s*(```|~~~)")
+_ITEM = re.compile(r"^(\s*)([-*+•]|\d+[.)])\s+(.*)$")
+_CITA_BLOQUE = re.compile(r"^\s*>\s?(.*)$")
+_REGLA = re.compile(r"^\s*(?:[-*_]\s*){3,}$")
+_SEPARADOR_TABLA = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_INLINE = re.compile(r"`([^`]+)`|\[([^\]]+)\]\(([^)\s]+)\)|\*\*|\*|(?<!\w)__|__(?!\w)|(?<!\w)_|_(?!\w)")
+_MARCAS = {"**": "negrita", "__": "negrita", "*": "cursiva", "_": "cursiva"}
+# Estilos de la plantilla para cada tipo de bloque (con "Normal" si la plantilla no los tiene).
+ESTILOS_BLOQUE = {"lista": "List Bullet", "lista_numerada": "List Number", "cita": "Quote", "tabla": "Table Grid"}
+FUENTE_CODIGO = "Consolas"
+
+
+# --- TEXTO EN LÍNEA ---
+def parsear_en_linea(texto):
+    # Lista de tramos (texto, negrita, cursiva, codigo, enlace). Una marca de énfasis sin cierre
+    # queda como texto literal, igual que una rodeada de espacios ("3 * 4"). Lineal en la longitud del texto.
+    fichas = [f for f in _INLINE.finditer(texto)
+              if f.group(0) not in _MARCAS or not (_espacio(texto, f.start() - 1) and _espacio(texto, f.end()))]
+    abiertas = {}
+    for f in fichas:
+        if f.group(0) in _MARCAS:
+            abiertas[f.group(0)] = abiertas.get(f.group(0), 0) + 1
+    # Con una cantidad impar de una marca, su última aparición no abre nada.
+    sueltas = {marca for marca, n in abiertas.items() if n % 2}
+    vistas = {}
+    tramos = []
+    estado = {"negrita": False, "cursiva": False}
+    ultimo = 0
+
+    def agregar(fragmento, codigo=False, enlace=None):
+        if fragmento:
+            tramos.append((fragmento, estado["negrita"], estado["cursiva"], codigo, enlace))
+
+    for f in fichas:
+        agregar(texto[ultimo:f.start()])
+        ultimo = f.end()
+        marca = f.group(0)
+        if f.group(1) is not None:
+            agregar(f.group(1), codigo=True)
+        elif f.group(2) is not None:
+            agregar(f.group(2), enlace=f.group(3))
+        else:
+            vistas[marca] = vistas.get(marca, 0) + 1
+            if marca in sueltas and vistas[marca] == abiertas[marca]:
+                agregar(marca)
+            else:
+                estado[_MARCAS[marca]] = not estado[_MARCAS[marca]]
+    agregar(texto[ultimo:])
+    return tramos
+
+
+def _espacio(texto, i):
+    return i < 0 or i >= len(texto) or texto[i].isspace()
+
+
+def texto_plano(tramos):
+    return "".join(t[0] for t in tramos)
+
+
+# --- MARKDOWN -> REPRESENTACIÓN INTERMEDIA ---
+def _celdas(linea):
+    return [c.strip() for c in linea.strip().strip("|").split("|")]
+
+
+def parsear(texto):
+    # Una sola pasada por las líneas. Devuelve una lista de bloques (dicts con "tipo"):
+    # titulo, parrafo, lista, cita, visual, tabla, codigo y referencias.
+    # `tabla` y `referencias` son el bloque abierto de cada tipo (o None): las filas y entradas se
+    # agregan a ese bloque, no al último de la lista.
+    bloques = []
+    parrafo = []
+    nivel_referencias = None
+    referencias = None
+    codigo = None
+    tabla = None
+
+    def cerrar_parrafo():
+        if parrafo:
+            bloques.append({"tipo": "parrafo", "contenido": parsear_en_linea(" ".join(parrafo))})
+            parrafo.clear()
+
+    for linea in texto.splitlines():
+        if codigo is not None:
+            if _CERCO.match(linea):
+                bloques.append({"tipo": "codigo", "lineas": codigo})
+                codigo = None
+            else:
+                codigo.append(linea)
+            continue
+        encabezado = _ENCABEZADO.match(linea)
+        # Una tabla sigue mientras lleguen filas con "|"; cualquier otro bloque la cierra.
+        if tabla is not None and "|" in linea and not (encabezado or _CERCO.match(linea) or _ITEM.match(linea)
+                                                       or _CITA_BLOQUE.match(linea)):
+            tabla["filas"].append([parsear_en_linea(c) for c in _celdas(linea)])
+            continue
+        tabla = None
+        if _CERCO.match(linea):
+            cerrar_parrafo()
+            codigo = []
+            continue
+        if not linea.strip():
+            cerrar_parrafo()
+            continue
+        if PATRON_REFERENCIAS.match(linea):
+            cerrar_parrafo()
+            nivel_referencias = len(encabezado.group(1)) if encabezado else 0
+            titulo = encabezado.group(2) if encabezado else linea
+            referencias = {"tipo": "referencias", "titulo": titulo.strip(" *_:"), "entradas": []}
+            bloques.append(referencias)
+            continue
+        if encabezado and nivel_referencias is not None and not (nivel_referencias and len(encabezado.group(1)) > nivel_referencias):
+            nivel_referencias = referencias = None
+        if nivel_referencias is not None:
+            item = _ITEM.match(linea)
+            referencias["entradas"].append(parsear_en_linea((item.group(3) if item else linea).strip()))
+            continue
+        if encabezado:
+            cerrar_parrafo()
+            bloques.append({"tipo": "titulo", "nivel": len(encabezado.group(1)),
+                            "contenido": parsear_en_linea(encabezado.group(2).strip())})
+            continue
+        if _SEPARADOR_TABLA.match(linea) and len(parrafo) == 1 and "|" in parrafo[0]:
+            # La línea anterior era el encabezado de una tabla.
+            tabla = {"tipo": "tabla", "filas": [[parsear_en_linea(c) for c in _celdas(parrafo[0])]], "encabezado": True}
+            bloques.append(tabla)
+            parrafo.clear()
+            continue
+        if _REGLA.match(linea):
+            cerrar_parrafo()
+            continue
+        item = _ITEM.match(linea)
+        if item:
+            cerrar_parrafo()
+            ordenada = item.group(2)[0].isdigit()
+            elemento = {"nivel": len(item.group(1).expandtabs(4)) // 2, "contenido": parsear_en_linea(item.group(3))}
+            if bloques and bloques[-1]["tipo"] == "lista" and bloques[-1]["ordenada"] == ordenada:
+                bloques[-1]["items"].append(elemento)
+            else:
+                bloques.append({"tipo": "lista", "ordenada": ordenada, "items": [elemento]})
+            continue
+        cita = _CITA_BLOQUE.match(linea)
+        if cita:
+            cerrar_parrafo()
+            if bloques and bloques[-1]["tipo"] == "cita":
+                bloques[-1]["lineas"].append(cita.group(1))
+            else:
+                bloques.append({"tipo": "cita", "lineas": [cita.group(1)]})
+            continue
+        if PATRON_VISUAL.match(linea):
+            cerrar_parrafo()
+            bloques.append({"tipo": "visual", "contenido": parsear_en_linea(linea.strip())})
+            continue
+        if bloques and bloques[-1]["tipo"] == "lista" and not parrafo and linea.startswith(("  ", "\t")):
+            # Continuación de un ítem de lista.
+            bloques[-1]["items"][-1]["contenido"].extend(parsear_en_linea(" " + linea.strip()))
+            continue
+        parrafo.append(linea.strip())
+    cerrar_parrafo()
+    if codigo is not None:
+        bloques.append({"tipo": "codigo", "lineas": codigo})
+    for b in bloques:
+        if b["tipo"] == "cita":
+            b["contenido"] = parsear_en_linea(" ".join(l.strip() for l in b.pop("lineas")))
+    return bloques
+
+
+def preparar(texto, titulo=None, sin_referencias=False):
+    # Bloques listos para exportar un subtema: sin el título repetido al comienzo (el exportador ya
+    # pone el suyo) y, si se pide, sin el bloque de referencias del modelo.
+    bloques = parsear(texto)
+    if titulo and bloques and bloques[0]["tipo"] == "titulo" and _igual(texto_plano(bloques[0]["contenido"]), titulo):
+        bloques = bloques[1:]
+    if sin_referencias:
+        bloques = [b for b in bloques if b["tipo"] != "referencias"]
+    return bloques
+
+
+def _igual(a, b):
+    return " ".join(re.findall(r"\w+", citas.normalizar(a))) == " ".join(re.findall(r"\w+", citas.normalizar(b)))
+
+
+def _nivel_minimo(bloques):
+    return min((b["nivel"] for b in bloques if b["tipo"] == "titulo"), default=1)
+
+
+# --- MARKDOWN ---
+def _md_en_linea(tramos):
+    partes = []
+    for texto, negrita, cursiva, codigo, enlace in tramos:
+        if codigo:
+            texto = f"`{texto}`"
+        elif enlace:
+            texto = f"[{texto}]({enlace})"
+        if cursiva:
+            texto = f"*{texto}*"
+        if negrita:
+            texto = f"**{texto}**"
+        partes.append(texto)
+    return "".join(partes)
+
+
+def a_markdown(bloques, nivel_base=2):
+    # Los títulos se reubican para que el más alto del texto quede en `nivel_base`.
+    desplazamiento = nivel_base - _nivel_minimo(bloques)
+    partes = []
+    for b in bloques:
+        tipo = b["tipo"]
+        if tipo == "titulo":
+            partes.append("#" * min(max(b["nivel"] + desplazamiento, 1), 6) + " " + _md_en_linea(b["contenido"]))
+        elif tipo in ("parrafo", "visual"):
+            partes.append(_md_en_linea(b["contenido"]))
+        elif tipo == "cita":
+            partes.append("> " + _md_en_linea(b["contenido"]))
+        elif tipo == "lista":
+            partes.append("\n".join(
+                "  " * i["nivel"] + (f"{n}. " if b["ordenada"] else "- ") + _md_en_linea(i["contenido"])
+                for n, i in enumerate(b["items"], start=1)
+            ))
+        elif tipo == "tabla":
+            filas = ["| " + " | ".join(_md_en_linea(c) for c in fila) + " |" for fila in b["filas"]]
+            filas.insert(1, "|" + "---|" * len(b["filas"][0]))
+            partes.append("\n".join(filas))
+        elif tipo == "codigo":
+            partes.append("```\n" + "\n".join(b["lineas"]) + "\n```")
+        elif tipo == "referencias":
+            partes.append("#" * nivel_base + " " + b["titulo"])
+            partes.extend(_md_en_linea(e) for e in b["entradas"])
+    return "\n\n".join(partes) + "\n"
+
+
+# --- HTML ---
+def _html_en_linea(tramos):
+    partes = []
+    for texto, negrita, cursiva, codigo, enlace in tramos:
+        texto = html.escape(texto)
+        if codigo:
+            texto = f"<code>{texto}</code>"
+        elif enlace:
+            texto = f'<a href="{html.escape(enlace)}">{texto}</a>'
+        if cursiva:
+            texto = f"<em>{texto}</em>"
+        if negrita:
+            texto = f"<strong>{texto}</strong>"
+        partes.append(texto)
+    return "".join(partes)
+
+
+def _html_lista(b):
+    # Las sublistas van dentro del <li> del ítem anterior.
+    etiqueta = "ol" if b["ordenada"] else "ul"
+    partes, nivel = [f"<{etiqueta}>"], 0
+    for i, item in enumerate(b["items"]):
+        destino = min(max(item["nivel"], 0), nivel + 1) if i else 0
+        if destino > nivel:
+            partes.append(f"<{etiqueta}>")
+            nivel = destino
+        else:
+            if i:
+                partes.append("</li>")
+            while nivel > destino:
+                partes.append(f"</{etiqueta}></li>")
+                nivel -= 1
+        partes.append(f"<li>{_html_en_linea(item['contenido'])}")
+    partes.append("</li>")
+    partes.extend(f"</{etiqueta}></li>" for _ in range(nivel))
+    partes.append(f"</{etiqueta}>")
+    return "".join(partes)
+
+
+def a_html(bloques, nivel_base=2):
+    desplazamiento = nivel_base - _nivel_minimo(bloques)
+    partes = []
+    for b in bloques:
+        tipo = b["tipo"]
+        if tipo == "titulo":
+            n = min(max(b["nivel"] + desplazamiento, 1), 6)
+            partes.append(f"<h{n}>{_html_en_linea(b['contenido'])}</h{n}>")
+        elif tipo == "parrafo":
+            partes.append(f"<p>{_html_en_linea(b['contenido'])}</p>")
+        elif tipo == "visual":
+            partes.append(f'<p class="visual"><em>{_html_en_linea(b["contenido"])}</em></p>')
+        elif tipo == "cita":
+            partes.append(f"<blockquote>{_html_en_linea(b['contenido'])}</blockquote>")
+        elif tipo == "lista":
+            partes.append(_html_lista(b))
+        elif tipo == "tabla":
+            filas = []
+            for i, fila in enumerate(b["filas"]):
+                celda = "th" if i == 0 and b["encabezado"] else "td"
+                filas.append("<tr>" + "".join(f"<{celda}>{_html_en_linea(c)}</{celda}>" for c in fila) + "</tr>")
+            partes.append("<table>" + "".join(filas) + "</table>")
+        elif tipo == "codigo":
+            partes.append(f"<pre><code>{html.escape(chr(10).join(b['lineas']))}</code></pre>")
+        elif tipo == "referencias":
+            partes.append(f"<h{nivel_base}>{html.escape(b['titulo'])}</h{nivel_base}>")
+            partes.extend(f'<p class="referencia">{_html_en_linea(e)}</p>' for e in b["entradas"])
+    return "\n".join(partes)
+
+
+def documento_html(titulo, cuerpo):
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(titulo)}</title>
+<style>
+body {{ font-family: Georgia, serif; max-width: 46em; margin: 2em auto; line-height: 1.5; }}
+.visual {{ color: #555; }}
+.referencia {{ padding-left: 2em; text-indent: -2em; }}
+table {{ border-collapse: collapse; }} th, td {{ border: 1px solid #999; padding: .3em .6em; }}
+</style>
+</head>
+<body>
+{cuerpo}
+</body>
+</html>
+"""
+
+
+# --- DOCX ---
+# Como en libro.py, los <w:p> se arman a mano y se agregan al final del body: python-docx busca
+# el sectPr en cada inserción y resuelve los estilos por nombre en cada llamada.
+class EscritorDocx:
+    # `estilos`: nombres de estilo que tiene la plantilla (exportacion.cargar_plantilla(...)["estilos"]).
+
+    def __init__(self, doc, estilos):
+        self.body = doc.element.body
+        self._ids = {nombre: doc.styles[nombre].style_id for nombre in estilos
+                     if nombre.startswith("Heading") or nombre in ("Normal", "Reference", *ESTILOS_BLOQUE.values())}
+
+    def estilo(self, nombre, defecto="Normal"):
+        return self._ids.get(nombre) or self._ids.get(defecto) or self._ids.get("Normal")
+
+    def estilo_titulo(self, nivel):
+        # Si la plantilla no tiene ese nivel, el más profundo que sí tenga.
+        for n in range(nivel, 0, -1):
+            if f"Heading {n}" in self._ids:
+                return self._ids[f"Heading {n}"]
+        return self.estilo("Normal")
+
+    def escribir(self, bloques, nivel_base=2, titulo_referencias=None):
+        # Todos los elementos se arman primero y se insertan juntos antes del sectPr.
+        elementos = list(self.elementos(bloques, nivel_base, titulo_referencias))
+        sect_pr = self.body.sectPr
+        if sect_pr is not None:
+            self.body.remove(sect_pr)
+        self.body.extend(elementos)
+        if sect_pr is not None:
+            self.body.append(sect_pr)
+
+    def elementos(self, bloques, nivel_base=2, titulo_referencias=None):
+        desplazamiento = nivel_base - _nivel_minimo(bloques)
+        for b in bloques:
+            tipo = b["tipo"]
+            if tipo == "titulo":
+                yield parrafo_docx(b["contenido"], self.estilo_titulo(max(b["nivel"] + desplazamiento, 1)))
+            elif tipo == "parrafo":
+                yield parrafo_docx(b["contenido"], self.estilo("Normal"))
+            elif tipo == "visual":
+                yield parrafo_docx([(t[0], t[1], True, t[3], t[4]) for t in b["contenido"]], self.estilo("Normal"))
+            elif tipo == "cita":
+                yield parrafo_docx(b["contenido"], self.estilo(ESTILOS_BLOQUE["cita"]))
+            elif tipo == "lista":
+                clave = "lista_numerada" if b["ordenada"] else "lista"
+                estilo = self._ids.get(ESTILOS_BLOQUE[clave])
+                for n, item in enumerate(b["items"], start=1):
+                    if estilo:
+                        yield parrafo_docx(item["contenido"], estilo)
+                    else:
+                        prefijo = "    " * item["nivel"] + (f"{n}. " if b["ordenada"] else "• ")
+                        yield parrafo_docx([(prefijo, False, False, False, None)] + item["contenido"], self.estilo("Normal"))
+            elif tipo == "tabla":
+                yield self._tabla(b)
+            elif tipo == "codigo":
+                for linea in b["lineas"] or [""]:
+                    yield parrafo_docx([(linea, False, False, True, None)], self.estilo("Normal"))
+            elif tipo == "referencias":
+                yield parrafo_docx([(titulo_referencias or b["titulo"], False, False, False, None)],
+                                   self.estilo_titulo(nivel_base))
+                for entrada in b["entradas"]:
+                    yield parrafo_docx(entrada, self.estilo("Reference"))
+
+    def _tabla(self, b):
+        from docx.oxml import OxmlElement
+        from docx.oxml.ns import qn
+
+        tabla = OxmlElement("w:tbl")
+        propiedades = OxmlElement("w:tblPr")
+        if ESTILOS_BLOQUE["tabla"] in self._ids:
+            estilo = OxmlElement("w:tblStyle")
+            estilo.set(qn("w:val"), self._ids[ESTILOS_BLOQUE["tabla"]])
+            propiedades.append(estilo)
+        ancho = OxmlElement("w:tblW")
+        ancho.set(qn("w:w"), "0")
+        ancho.set(qn("w:type"), "auto")
+        propiedades.append(ancho)
+        tabla.append(propiedades)
+        columnas = max(len(f) for f in b["filas"])
+        grilla = OxmlElement("w:tblGrid")
+        for _ in range(columnas):
+            grilla.append(OxmlElement("w:gridCol"))
+        tabla.append(grilla)
+        for i, fila in enumerate(b["filas"]):
+            tr = OxmlElement("w:tr")
+            for celda in fila + [[]] * (columnas - len(fila)):
+                tc = OxmlElement("w:tc")
+                if i == 0 and b["encabezado"]:
+                    celda = [(t[0], True, t[2], t[3], t[4]) for t in celda]
+                tc.append(parrafo_docx(celda, self.estilo("Normal")))
+                tr.append(tc)
+            tabla.append(tr)
+        return tabla
+
+
+def parrafo_docx(tramos, estilo_id=None):
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    p = OxmlElement("w:p")
+    if estilo_id:
+        ppr = OxmlElement("w:pPr")
+        pstyle = OxmlElement("w:pStyle")
+        pstyle.set(qn("w:val"), estilo_id)
+        ppr.append(pstyle)
+        p.append(ppr)
+    for texto, negrita, cursiva, codigo, _ in tramos:
+        r = OxmlElement("w:r")
+        if negrita or cursiva or codigo:
+            rpr = OxmlElement("w:rPr")
+            if codigo:
+                fuentes = OxmlElement("w:rFonts")
+                fuentes.set(qn("w:ascii"), FUENTE_CODIGO)
+                fuentes.set(qn("w:hAnsi"), FUENTE_CODIGO)
+                rpr.append(fuentes)
+            if negrita:
+                rpr.append(OxmlElement("w:b"))
+            if cursiva:
+                rpr.append(OxmlElement("w:i"))
+            r.append(rpr)
+        t = OxmlElement("w:t")
+        t.text = texto
+        t.set(qn("xml:space"), "preserve")
+        r.append(t)
+        p.append(r)
+    return p
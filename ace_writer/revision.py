@@ -0,0 +1,29 @@
+from . import citas, exportacion, referencias, renderizado
+
+
+# --- REVISIÓN DE TEXTOS YA GENERADOS ---
+def validar_citas(tabla):
+    return referencias.clasificar(tabla, requeridas=['DOI', 'Título del artículo', 'Journal'])
+
+
+def extraer_citas(segmentos, df_referencias):
+    encontradas, _ = citas.indice_para(df_referencias).buscar_por_segmentos(segmentos)
+    return encontradas
+
+
+def construir_referencias_apa(filas_citadas, df_referencias):
+    referencias_usadas = df_referencias[df_referencias.index.isin(list(filas_citadas))]
+    referencias_apa = referencias.formatear_apa(referencias_usadas).tolist()
+    return referencias_apa, len(referencias_apa)
+
+
+def exportar_a_word(texto, referencias, plantilla, nombre_archivo):
+    doc = exportacion.nuevo_documento(plantilla)
+    escritor = renderizado.EscritorDocx(doc, exportacion.cargar_plantilla(plantilla)["estilos"])
+    escritor.escribir(renderizado.preparar(texto, nombre_archivo, sin_referencias=True))
+    doc.add_paragraph("\nAplicación práctica para el entrenador:")
+    doc.add_paragraph("(Completar bloque de aplicación práctica aquí.)")
+    doc.add_paragraph("\nReferencias:")
+    for ref in referencias:
+        doc.add_paragraph(ref, style='Normal')
+    return exportacion.a_buffer(doc)
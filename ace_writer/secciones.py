@@ -0,0 +1,198 @@
+import asyncio
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from . import generacion
+from .relevancia import seleccionar_referencias
+from .validacion import PALABRAS_POR_VISUAL, PATRON_VISUAL
+
+SECCIONES_MINIMAS = 4
+SECCIONES_MAXIMAS = 6
+MAX_TOKENS_ESQUEMA = 800
+PALABRAS_MINIMAS_SECCION = 300
+TOKENS_POR_PALABRA = 2.5
+PRESUPUESTO_TOKENS_SECCION = 600
+REFERENCIAS_MINIMAS_SECCION = 3
+CONCURRENCIA = 6
+MARCA_VISUAL = "📊 Recurso visual sugerido:"
+_VIÑETA = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+# --- ESQUEMA ---
+def construir_prompt_esquema(subtema, capitulo, evitar=""):
+    no_repetir = f"\nEstos temas ya están desarrollados en otros subtemas; no les dediques secciones:\n{evitar}\n" if evitar else ""
+    return f"""Actuás como editor científico del Proyecto eBooks ACE.
+Armá el esquema del subtema "{subtema}", parte del capítulo "{capitulo}" de un e-book científico para entrenadores.
+
+Devolvé entre {SECCIONES_MINIMAS} y {SECCIONES_MAXIMAS} secciones en orden, una por línea, con este formato exacto y nada más:
+Título de la sección | idea clave; idea clave; idea clave
+{no_repetir}"""
+
+
+def parsear_esquema(texto):
+    # Tolera viñetas, numeración y encabezados markdown; sin "|" la línea entera es el título.
+    # Si el modelo agrega un preámbulo ("Este es el esquema:"), se descarta: cuando hay líneas con
+    # "|" solo cuentan esas, y si no, cuando hay viñetas o encabezados solo cuentan esas.
+    lineas = [l.strip() for l in texto.splitlines() if l.strip()]
+    con_separador = [l for l in lineas if "|" in l]
+    marcadas = [l for l in lineas if l.startswith("#") or _VIÑETA.match(l)]
+    secciones = []
+    for linea in con_separador or marcadas or lineas:
+        linea = _VIÑETA.sub("", linea.lstrip("#").strip()).strip("* ")
+        if not linea:
+            continue
+        titulo, _, puntos = linea.partition("|")
+        titulo = titulo.strip().strip("*").strip()
+        if titulo:
+            secciones.append({"titulo": titulo, "puntos": [p.strip() for p in puntos.split(";") if p.strip()]})
+    return secciones[:SECCIONES_MAXIMAS]
+
+
+# --- SECCIONES ---
+def planificar_secciones(secciones, referencias, subtema, palabras_objetivo=generacion.PALABRAS_MINIMAS,
+                         presupuesto_tokens=PRESUPUESTO_TOKENS_SECCION):
+    # Reparte palabras, recursos visuales y referencias entre las secciones. Los visuales se asignan
+    # según la posición acumulada de cada sección, así el total respeta 1 cada 500 palabras.
+    palabras = max(PALABRAS_MINIMAS_SECCION, math.ceil(palabras_objetivo / max(len(secciones), 1)))
+    plan = []
+    for i, seccion in enumerate(secciones):
+        consulta = f"{seccion['titulo']} {' '.join(seccion['puntos'])}"
+        incluidas, _ = seleccionar_referencias(referencias, consulta, subtema, presupuesto_tokens)
+        relevantes = [r for r in incluidas if r["puntaje"] > 0] or incluidas[:REFERENCIAS_MINIMAS_SECCION]
+        plan.append({
+            **seccion,
+            "indice": i,
+            "palabras": palabras,
+            "visuales": (i + 1) * palabras // PALABRAS_POR_VISUAL - i * palabras // PALABRAS_POR_VISUAL,
+            "referencias": [r["referencia"] for r in sorted(relevantes, key=lambda r: r["posicion"])],
+        })
+    return plan
+
+
+def construir_prompt_seccion(subtema, capitulo, seccion, plan):
+    esquema = "\n".join(f"{s['indice'] + 1}. {s['titulo']}" for s in plan)
+    puntos = "\n".join(f"– {p}" for p in seccion["puntos"]) or "– (a criterio del redactor)"
+    visuales = (f"– Incluir exactamente {seccion['visuales']} sugerencia(s) de recurso visual, cada una en su propia "
+                f"línea con el formato \"{MARCA_VISUAL} …\"" if seccion["visuales"] else
+                "– No incluir sugerencias de recursos visuales")
+    return f"""Actuás como redactor científico del Proyecto eBooks ACE.
+Estás redactando una sola sección del subtema "{subtema}" (capítulo "{capitulo}"). Esquema completo, para no invadir las demás secciones:
+{esquema}
+
+✍️ Redactá solo la sección {seccion['indice'] + 1}: "{seccion['titulo']}"
+Ideas clave:
+{puntos}
+
+📌 Requisitos:
+– Unas {seccion['palabras']} palabras, sin repetir el título de la sección ni introducir el subtema desde cero
+– Podés usar subtítulos de nivel 3 (###)
+{visuales}
+– Citar en formato APA solo las referencias de esta lista; no agregar sección de referencias
+
+📚 Referencias para esta sección:
+{chr(10).join(seccion['referencias']) or "(ninguna: no citar)"}
+
+Tono técnico claro, orientado a entrenadores, con ejemplos prácticos.
+"""
+
+
+def _max_tokens(seccion):
+    return min(generacion.MAX_TOKENS_BASE, int(seccion["palabras"] * TOKENS_POR_PALABRA))
+
+
+def aplicar_regla_visuales(texto, palabras_por_visual=PALABRAS_POR_VISUAL):
+    # Sobre el texto ya unido: a lo sumo una sugerencia visual por cada tramo de 500 palabras.
+    parrafos, palabras, tramos = [], 0, set()
+    for parrafo in generacion.dividir_parrafos(texto):
+        if PATRON_VISUAL.match(parrafo):
+            tramo = palabras // palabras_por_visual
+            if tramo in tramos:
+                continue
+            tramos.add(tramo)
+        else:
+            palabras += generacion.contar_palabras(parrafo)
+        parrafos.append(parrafo)
+    return "\n\n".join(parrafos)
+
+
+def unir_secciones(plan, textos):
+    partes = []
+    for seccion, texto in zip(plan, textos):
+        texto = re.sub(r"\A\s*#{1,3}\s*" + re.escape(seccion["titulo"]) + r"\s*\n", "", texto.strip(), flags=re.I)
+        partes.append(f"## {seccion['titulo']}\n\n{texto.strip()}")
+    return aplicar_regla_visuales("\n\n".join(partes))
+
+
+# --- GENERACIÓN ---
+def _en_vivo(cliente, prompt, max_tokens, etapa, metricas, al_fragmento=None, **opciones):
+    m = {"etapa": etapa}
+    metricas.append(m)
+    texto = ""
+    for fragmento in generacion.completar_en_vivo(cliente, prompt, max_tokens, metricas=m, **opciones):
+        texto += fragmento
+        if al_fragmento:
+            al_fragmento(texto)
+    return texto
+
+
+def redactar_por_secciones(cliente, subtema, capitulo, referencias, modelo=generacion.MODELO, cache=None, forzar=False,
+                           planificador=None, registro=None, concurrencia=CONCURRENCIA, al_terminar_seccion=None,
+                           evitar="", al_avanzar=None, metricas=None):
+    # Versión con hilos para la app: una llamada corta para el esquema y luego todas las secciones a
+    # la vez, con streaming. `al_terminar_seccion(listas, total)` permite mostrar el avance;
+    # `al_avanzar(texto)` recibe, desde los hilos de las secciones, el borrador con todo lo llegado
+    # hasta el momento, y `metricas` se llena con una entrada por llamada (como en generacion.redactar).
+    # Si una sección falla o `al_avanzar` lanza una excepción (cancelación), las secciones que aún no
+    # empezaron no se piden y la excepción se propaga.
+    metricas = [] if metricas is None else metricas
+    opciones = dict(modelo=modelo, cache=cache, forzar=forzar, planificador=planificador, registro=registro)
+    esquema = _en_vivo(cliente, construir_prompt_esquema(subtema, capitulo, evitar), MAX_TOKENS_ESQUEMA, "esquema",
+                       metricas, **opciones)
+    plan = planificar_secciones(parsear_esquema(esquema), referencias, subtema)
+    if not plan:
+        raise ValueError("El modelo no devolvió un esquema utilizable")
+    parciales = [""] * len(plan)
+    lock = threading.Lock()
+
+    def al_fragmento(indice, texto):
+        # Bajo el lock para que los borradores lleguen en orden aunque vengan de hilos distintos.
+        with lock:
+            parciales[indice] = texto
+            al_avanzar("\n\n".join(f"## {s['titulo']}\n\n{t.strip()}" for s, t in zip(plan, parciales) if t))
+
+    textos = [None] * len(plan)
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        futuros = {
+            pool.submit(_en_vivo, cliente, construir_prompt_seccion(subtema, capitulo, s, plan), _max_tokens(s),
+                        f"sección {s['indice'] + 1}", metricas,
+                        partial(al_fragmento, s["indice"]) if al_avanzar else None, **opciones): s["indice"]
+            for s in plan
+        }
+        try:
+            for listas, futuro in enumerate(as_completed(futuros), start=1):
+                textos[futuros[futuro]] = futuro.result()
+                if al_terminar_seccion:
+                    al_terminar_seccion(listas, len(plan))
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+    return unir_secciones(plan, textos)
+
+
+async def redactar_por_secciones_async(cliente, subtema, capitulo, referencias, modelo=generacion.MODELO, cache=None,
+                                       forzar=False, planificador=None, registro=None, evitar=""):
+    esquema = await generacion.completar_async(cliente, construir_prompt_esquema(subtema, capitulo, evitar),
+                                               MAX_TOKENS_ESQUEMA, modelo, cache, forzar, planificador, registro)
+    plan = planificar_secciones(parsear_esquema(esquema), referencias, subtema)
+    if not plan:
+        raise ValueError("El modelo no devolvió un esquema utilizable")
+    textos = await asyncio.gather(*[
+        generacion.completar_async(cliente, construir_prompt_seccion(subtema, capitulo, s, plan), _max_tokens(s),
+                                   modelo, cache, forzar, planificador, registro)
+        for s in plan
+    ])
+    return unir_secciones(plan, textos)
@@ -0,0 +1,114 @@
+import math
+import re
+from functools import lru_cache
+
+MODELO_TOKENS = "gpt-4"
+MAX_TOKENS_SEGMENTO = 4000
+_ENCABEZADO = re.compile(r"^\s{0,3}#{1,6}\s")
+_FIN_ORACION = re.compile(r"(?<=[.!?])\s+")
+
+
+# --- TOKENIZADOR ---
+@lru_cache(maxsize=8)
+def codificador(modelo=MODELO_TOKENS):
+    import tiktoken
+
+    return tiktoken.encoding_for_model(modelo)
+
+
+def contar_tokens(texto, modelo=MODELO_TOKENS):
+    return len(codificador(modelo).encode(texto))
+
+
+# --- BLOQUES ---
+def _bloques(texto):
+    # Párrafos (líneas seguidas sin línea en blanco) y encabezados markdown, con su posición.
+    bloques = []
+    inicio = fin = None
+    pos = 0
+    for linea in texto.splitlines(keepends=True):
+        contenido = linea.strip()
+        if not contenido or _ENCABEZADO.match(linea):
+            if inicio is not None:
+                bloques.append({"inicio": inicio, "fin": fin, "encabezado": False})
+                inicio = None
+            if contenido:
+                bloques.append({"inicio": pos, "fin": pos + len(linea.rstrip()), "encabezado": True})
+        else:
+            if inicio is None:
+                inicio = pos
+            fin = pos + len(linea.rstrip())
+        pos += len(linea)
+    if inicio is not None:
+        bloques.append({"inicio": inicio, "fin": fin, "encabezado": False})
+    return bloques
+
+
+def _partir_bloque(texto, bloque, max_tokens, contar):
+    # Un párrafo más largo que el presupuesto se parte por oraciones y, si una oración sola
+    # tampoco entra, por palabras en trozos parejos.
+    piezas = []
+    inicio = bloque["inicio"]
+    for corte in _FIN_ORACION.finditer(texto, bloque["inicio"], bloque["fin"]):
+        piezas.append((inicio, corte.start()))
+        inicio = corte.end()
+    piezas.append((inicio, bloque["fin"]))
+
+    resultado = []
+    for inicio, fin in piezas:
+        tokens = contar(texto[inicio:fin])
+        if tokens <= max_tokens:
+            resultado.append({"inicio": inicio, "fin": fin, "encabezado": False, "tokens": tokens})
+            continue
+        palabras = list(re.finditer(r"\S+", texto[inicio:fin]))
+        partes = math.ceil(tokens / max_tokens) + 1
+        por_parte = math.ceil(len(palabras) / partes)
+        for k in range(0, len(palabras), por_parte):
+            grupo = palabras[k:k + por_parte]
+            a, b = inicio + grupo[0].start(), inicio + grupo[-1].end()
+            resultado.append({"inicio": a, "fin": b, "encabezado": False, "tokens": contar(texto[a:b])})
+    return resultado
+
+
+# --- SEGMENTACIÓN ---
+def dividir_en_segmentos(texto, max_tokens=MAX_TOKENS_SEGMENTO, contar=contar_tokens):
+    # Empaqueta párrafos consecutivos en segmentos de hasta `max_tokens`. Se prefiere cortar en
+    # un encabezado cuando el segmento ya va por la mitad del presupuesto, y un encabezado nunca
+    # queda huérfano al final de un segmento. Cada segmento es un dict con su texto, su
+    # desplazamiento en el texto original y sus tokens.
+    segmentos = []
+    actual = []
+    tokens_actual = 0
+
+    def cerrar():
+        nonlocal actual, tokens_actual
+        arrastre = []
+        while actual and actual[-1]["encabezado"] and len(actual) > 1:
+            arrastre.insert(0, actual.pop())
+        if actual:
+            inicio, fin = actual[0]["inicio"], actual[-1]["fin"]
+            segmentos.append({
+                "indice": len(segmentos),
+                "texto": texto[inicio:fin],
+                "desplazamiento": inicio,
+                "tokens": sum(b["tokens"] + 1 for b in actual) - 1,
+            })
+        actual = arrastre
+        tokens_actual = sum(b["tokens"] + 1 for b in actual)
+
+    for bloque in _bloques(texto):
+        bloque["tokens"] = contar(texto[bloque["inicio"]:bloque["fin"]])
+        piezas = [bloque] if bloque["tokens"] <= max_tokens else _partir_bloque(texto, bloque, max_tokens, contar)
+        for pieza in piezas:
+            # +1 por el separador de párrafo ("\n\n" es un token)
+            excede = tokens_actual + pieza["tokens"] + 1 > max_tokens
+            corte_natural = pieza["encabezado"] and tokens_actual >= max_tokens // 2
+            if actual and (excede or corte_natural):
+                cerrar()
+                # lo arrastrado (encabezados) tampoco puede hacer que se pase del presupuesto
+                if actual and tokens_actual + pieza["tokens"] + 1 > max_tokens:
+                    cerrar()
+            actual.append(pieza)
+            tokens_actual += pieza["tokens"] + 1
+    cerrar()
+    return segmentos
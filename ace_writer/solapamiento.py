@@ -0,0 +1,223 @@
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from . import citas, generacion
+from .redundancia import dividir_oraciones, firmas_minhash
+
+RUTA_POR_DEFECTO = ".cache_ace/solapamiento.sqlite"
+# 16 bandas x 4 filas: umbral LSH ~0.5 de Jaccard, por debajo del umbral de reporte.
+PERMUTACIONES = 64
+FILAS_POR_BANDA = 4
+SEMILLA = 17
+UMBRAL_JACCARD = 0.6
+MIN_TERMINOS = 5
+MAX_SUBTEMAS_PISTA = 3
+MAX_LINEAS_PISTA = 8
+# Palabras funcionales: no distinguen una oración de otra y harían coincidir las que no se parecen.
+VACIAS = frozenset("""
+a al algo ante como con contra cual cuando de del desde donde durante e el ella ellas ellos en entre era es esa
+ese eso esta este esto estos fue ha hacia han hasta la las le les lo los mas mediante muy no o otra otro para
+pero por porque puede pueden que se segun ser si sin sino sobre son su sus tambien tanto te tiene tienen un una
+uno unos y ya
+""".split())
+_COEFICIENTE_BANDA = np.uint64(0x9E3779B97F4A7C15)
+
+
+# --- TÉRMINOS Y FIRMAS ---
+def terminos(oracion):
+    # Palabras de contenido sin tildes ni mayúsculas, como enteros estables entre procesos.
+    palabras = re.findall(r"\w{3,}", citas.normalizar(oracion))
+    return sorted({zlib.crc32(p.encode()) & 0x7FFFFFFF for p in palabras if p not in VACIAS})
+
+
+def _firmas(conjuntos):
+    indptr = np.concatenate([[0], np.cumsum([len(c) for c in conjuntos])])
+    indices = np.fromiter((t for c in conjuntos for t in c), dtype=np.int64, count=int(indptr[-1]))
+    return firmas_minhash(indices, indptr, PERMUTACIONES, SEMILLA)
+
+
+def _bandas(firmas):
+    # Cada banda de FILAS_POR_BANDA mínimos se condensa en un entero de 64 bits (aritmética
+    # modular de uint64, determinista) para indexarla en SQLite.
+    valores = np.zeros((firmas.shape[0], PERMUTACIONES // FILAS_POR_BANDA), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(FILAS_POR_BANDA):
+            valores = valores * _COEFICIENTE_BANDA + firmas[:, k::FILAS_POR_BANDA].astype(np.uint64)
+    return valores.view(np.int64)
+
+
+def _oraciones_con_firma(texto):
+    oraciones, conjuntos, posiciones = [], [], []
+    for i, oracion in enumerate(dividir_oraciones(texto)):
+        conjunto = terminos(oracion)
+        if len(conjunto) >= MIN_TERMINOS:
+            oraciones.append(oracion.strip())
+            conjuntos.append(conjunto)
+            posiciones.append(i)
+    if not oraciones:
+        return [], [], np.empty((0, PERMUTACIONES), dtype=np.int64)
+    return oraciones, posiciones, _firmas(conjuntos)
+
+
+# --- ÍNDICE PERSISTENTE ---
+class IndiceSolapamiento:
+    # Índice en disco (SQLite) de las oraciones de todos los subtemas generados: firmas MinHash y
+    # sus bandas LSH. Insertar un subtema es incremental (regenerarlo reemplaza sus oraciones) y
+    # consultar un texto nuevo solo mira las oraciones que comparten alguna banda.
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.ruta), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS subtemas (
+                id INTEGER PRIMARY KEY,
+                capitulo TEXT NOT NULL,
+                subtema TEXT NOT NULL,
+                esquema TEXT NOT NULL,
+                creado REAL NOT NULL,
+                UNIQUE (capitulo, subtema)
+            );
+            CREATE TABLE IF NOT EXISTS oraciones (
+                id INTEGER PRIMARY KEY,
+                subtema INTEGER NOT NULL REFERENCES subtemas(id),
+                posicion INTEGER NOT NULL,
+                texto TEXT NOT NULL,
+                firma BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_oraciones_subtema ON oraciones(subtema);
+            CREATE TABLE IF NOT EXISTS bandas (
+                banda INTEGER NOT NULL,
+                valor INTEGER NOT NULL,
+                oracion INTEGER NOT NULL,
+                PRIMARY KEY (banda, valor, oracion)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_bandas_oracion ON bandas(oracion);
+        """)
+        self._conn.commit()
+
+    def indexar(self, capitulo, subtema, texto, esquema=None):
+        if esquema is None:
+            esquema = generacion.esquema_cubierto(generacion.dividir_parrafos(texto)) if texto.strip() else ""
+        oraciones, posiciones, firmas = _oraciones_con_firma(texto)
+        bandas = _bandas(firmas)
+        with self._lock:
+            self._borrar(capitulo, subtema)
+            cursor = self._conn.execute(
+                "INSERT INTO subtemas (capitulo, subtema, esquema, creado) VALUES (?, ?, ?, ?)",
+                (capitulo, subtema, esquema, time.time())
+            )
+            id_subtema = cursor.lastrowid
+            for oracion, posicion, firma, valores in zip(oraciones, posiciones, firmas, bandas):
+                id_oracion = self._conn.execute(
+                    "INSERT INTO oraciones (subtema, posicion, texto, firma) VALUES (?, ?, ?, ?)",
+                    (id_subtema, posicion, oracion, firma.astype(np.int64).tobytes())
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO bandas (banda, valor, oracion) VALUES (?, ?, ?)",
+                    ((b, int(v), id_oracion) for b, v in enumerate(valores))
+                )
+            self._conn.commit()
+        return len(oraciones)
+
+    def _borrar(self, capitulo, subtema):
+        fila = self._conn.execute(
+            "SELECT id FROM subtemas WHERE capitulo = ? AND subtema = ?", (capitulo, subtema)
+        ).fetchone()
+        if fila is None:
+            return
+        self._conn.execute(
+            "DELETE FROM bandas WHERE oracion IN (SELECT id FROM oraciones WHERE subtema = ?)", (fila[0],)
+        )
+        self._conn.execute("DELETE FROM oraciones WHERE subtema = ?", (fila[0],))
+        self._conn.execute("DELETE FROM subtemas WHERE id = ?", (fila[0],))
+
+    def eliminar(self, capitulo, subtema):
+        with self._lock:
+            self._borrar(capitulo, subtema)
+            self._conn.commit()
+
+    def buscar(self, texto, excluir=None, umbral=UMBRAL_JACCARD):
+        # Devuelve una lista de dicts con la oración nueva, su posición en el texto, la oración
+        # previa parecida, el subtema de donde viene y el Jaccard estimado. `excluir` es un par
+        # (capitulo, subtema) para no compararse con una versión anterior del mismo subtema.
+        oraciones, posiciones, firmas = _oraciones_con_firma(texto)
+        if not oraciones:
+            return []
+        bandas = _bandas(firmas)
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS consulta (i INTEGER, banda INTEGER, valor INTEGER)")
+            self._conn.execute("DELETE FROM consulta")
+            self._conn.executemany(
+                "INSERT INTO consulta VALUES (?, ?, ?)",
+                ((i, b, int(v)) for i, valores in enumerate(bandas) for b, v in enumerate(valores))
+            )
+            candidatos = self._conn.execute("""
+                SELECT DISTINCT c.i, o.texto, o.firma, s.capitulo, s.subtema
+                FROM consulta c
+                JOIN bandas b ON b.banda = c.banda AND b.valor = c.valor
+                JOIN oraciones o ON o.id = b.oracion
+                JOIN subtemas s ON s.id = o.subtema
+                WHERE NOT (s.capitulo = ? AND s.subtema = ?)
+            """, excluir or ("", "")).fetchall()
+            self._conn.commit()
+        mejores = {}
+        for i, previa, firma, capitulo, subtema in candidatos:
+            similitud = float(np.mean(np.frombuffer(firma, dtype=np.int64) == firmas[i]))
+            if similitud >= umbral and similitud > mejores.get(i, {}).get("similitud", 0):
+                mejores[i] = {
+                    "posicion": posiciones[i],
+                    "oracion": oraciones[i],
+                    "oracion_previa": previa,
+                    "capitulo": capitulo,
+                    "subtema": subtema,
+                    "similitud": round(similitud, 3),
+                }
+        return [mejores[i] for i in sorted(mejores)]
+
+    def subtemas(self):
+        with self._lock:
+            filas = self._conn.execute("SELECT capitulo, subtema, esquema FROM subtemas ORDER BY id").fetchall()
+        return [{"capitulo": c, "subtema": s, "esquema": e} for c, s, e in filas]
+
+    def pista_no_repetir(self, capitulo, subtema, max_subtemas=MAX_SUBTEMAS_PISTA):
+        # Lo ya cubierto en los subtemas indexados más cercanos al que se va a generar, para
+        # agregarlo al prompt. Vacío si no hay ninguno relacionado.
+        from .relevancia import puntuar_referencias
+
+        previos = [s for s in self.subtemas() if (s["capitulo"], s["subtema"]) != (capitulo, subtema) and s["esquema"]]
+        if not previos:
+            return ""
+        puntajes = puntuar_referencias([f"{s['subtema']} {s['esquema']}" for s in previos], subtema, capitulo)
+        elegidos = [previos[i] for i in np.argsort(-puntajes, kind="stable")[:max_subtemas] if puntajes[i] > 0]
+        bloques = []
+        for s in elegidos:
+            lineas = s["esquema"].splitlines()
+            encabezados = [linea for linea in lineas if linea.startswith("#")]
+            lineas = (encabezados if len(encabezados) >= 3 else lineas)[:MAX_LINEAS_PISTA]
+            bloques.append(f"«{s['subtema']}» ({s['capitulo']}):\n" + "\n".join(lineas))
+        return "\n\n".join(bloques)
+
+    def estadisticas(self):
+        with self._lock:
+            subtemas, oraciones = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM subtemas), (SELECT COUNT(*) FROM oraciones)"
+            ).fetchone()
+        return {"subtemas": subtemas, "oraciones": oraciones}
+
+
+def resumir_por_subtema(solapamientos):
+    # {(capitulo, subtema): cantidad de oraciones repetidas}, de mayor a menor.
+    conteo = {}
+    for s in solapamientos:
+        clave = (s["capitulo"], s["subtema"])
+        conteo[clave] = conteo.get(clave, 0) + 1
+    return dict(sorted(conteo.items(), key=lambda item: -item[1]))
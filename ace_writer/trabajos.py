@@ -0,0 +1,228 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import generacion, secciones
+from .instrumentacion import Registro
+
+RUTA_POR_DEFECTO = ".cache_ace/trabajos.sqlite"
+TRABAJADORES = 4
+# El texto parcial se persiste a lo sumo cada tantos segundos mientras llega el stream.
+INTERVALO_PARCIAL = 0.5
+ACTIVOS = ("pendiente", "en_curso")
+TERMINADOS = ("listo", "error", "cancelado", "interrumpido")
+
+
+class TrabajoCancelado(Exception):
+    pass
+
+
+def propietario_de(api_key):
+    # Identifica a quien escribe sin guardar la clave: los trabajos se listan por este hash.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12] if api_key else ""
+
+
+class ColaTrabajos:
+    # Cola de generaciones con un pool de hilos y un registro durable en SQLite. Cada trabajo guarda
+    # su estado, el hash del prompt, el texto parcial mientras se genera, el resultado, las métricas
+    # y el uso de tokens; la interfaz solo consulta la base, así que un refresco del navegador o una
+    # reconexión no pierden nada. Los trabajos que quedaron a medias al caerse el proceso se retoman
+    # con `reanudar` cuando su dueño vuelve a dar la clave (las llamadas ya completas salen de la
+    # cache de respuestas). Las claves de API viven solo en memoria.
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO, trabajadores=TRABAJADORES, cache=None, planificador=None,
+                 solapamiento=None, registro=None):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self.cache = cache
+        self.planificador = planificador
+        self.solapamiento = solapamiento
+        self.registro = registro
+        self._lock = threading.Lock()
+        self._claves = {}
+        self._cancelados = set()
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="ace-trabajo")
+        self._conn = sqlite3.connect(str(self.ruta), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                propietario TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                parametros TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                parcial TEXT NOT NULL DEFAULT '',
+                resultado TEXT,
+                error TEXT,
+                progreso TEXT NOT NULL DEFAULT '',
+                metricas TEXT NOT NULL DEFAULT '[]',
+                solapamientos TEXT NOT NULL DEFAULT '[]',
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                costo REAL NOT NULL DEFAULT 0,
+                creado REAL NOT NULL,
+                iniciado REAL,
+                terminado REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_propietario ON trabajos(propietario, creado)")
+        self._conn.commit()
+
+    # --- ESCRITURA ---
+    def _actualizar(self, id_trabajo, **campos):
+        asignaciones = ", ".join(f"{c} = ?" for c in campos)
+        with self._lock:
+            self._conn.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), id_trabajo))
+            self._conn.commit()
+
+    def enviar(self, parametros, api_key, registro=None):
+        # `parametros`: subtema, capitulo, referencias y, opcionales, modelo, forzar, por_secciones.
+        # El hash del prompt se calcula al correr, cuando ya se conoce la pista de solapamiento.
+        id_trabajo = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO trabajos (id, propietario, estado, parametros, prompt_hash, creado) VALUES (?, ?, ?, ?, ?, ?)",
+                (id_trabajo, propietario_de(api_key), "pendiente", json.dumps(parametros, ensure_ascii=False), "",
+                 time.time())
+            )
+            self._conn.commit()
+            self._claves[id_trabajo] = api_key
+        self._pool.submit(self._correr, id_trabajo, registro or self.registro)
+        return id_trabajo
+
+    def cancelar(self, id_trabajo):
+        with self._lock:
+            self._cancelados.add(id_trabajo)
+
+    def reanudar(self, api_key=None):
+        # Trabajos activos en la base que no están corriendo en este proceso (quedaron a medias al
+        # caerse el servidor). Con una clave se vuelven a encolar solo los de su dueño; los de otros
+        # esperan a que su dueño vuelva. Sin clave, todos quedan como interrumpidos con su texto parcial.
+        # Un trabajo forzado se retoma sin `forzar`: lo que ya regeneró quedó en la cache y no se vuelve a pagar.
+        propietario = propietario_de(api_key)
+        consulta = f"SELECT id, parametros FROM trabajos WHERE estado IN ({', '.join('?' * len(ACTIVOS))})"
+        argumentos = ACTIVOS
+        if api_key:
+            consulta += " AND propietario = ?"
+            argumentos = (*ACTIVOS, propietario)
+        with self._lock:
+            filas = [f for f in self._conn.execute(consulta + " ORDER BY creado", argumentos)
+                     if f["id"] not in self._claves]
+            ids = [f["id"] for f in filas]
+            if api_key:
+                self._claves.update(dict.fromkeys(ids, api_key))
+        for fila in filas:
+            id_trabajo = fila["id"]
+            if api_key:
+                parametros = json.loads(fila["parametros"])
+                campos = {}
+                if parametros.get("forzar"):
+                    campos["parametros"] = json.dumps({**parametros, "forzar": False}, ensure_ascii=False)
+                self._actualizar(id_trabajo, estado="pendiente", **campos)
+                self._pool.submit(self._correr, id_trabajo, self.registro)
+            else:
+                self._actualizar(id_trabajo, estado="interrumpido", terminado=time.time(),
+                                 error="El servidor se reinició sin clave de API; volvé a enviarlo")
+        return len(ids)
+
+    # --- EJECUCIÓN ---
+    def _correr(self, id_trabajo, registro_padre):
+        trabajo = self.obtener(id_trabajo)
+        parametros = trabajo["parametros"]
+        registro = Registro(ruta_log=None, padre=registro_padre)
+        metricas = []
+        ultimo = [0.0]
+        parcial = [trabajo["parcial"]]
+
+        def al_avanzar(texto, progreso=None):
+            if texto is not None:
+                parcial[0] = texto
+            if id_trabajo in self._cancelados:
+                raise TrabajoCancelado()
+            ahora = time.monotonic()
+            if progreso is not None or ahora - ultimo[0] >= INTERVALO_PARCIAL:
+                ultimo[0] = ahora
+                campos = {"parcial": texto} if texto is not None else {}
+                if progreso is not None:
+                    campos["progreso"] = progreso
+                self._actualizar(id_trabajo, **campos)
+
+        self._actualizar(id_trabajo, estado="en_curso", iniciado=time.time())
+        try:
+            cliente = generacion.crear_cliente(self._claves[id_trabajo])
+            comunes = dict(modelo=parametros.get("modelo", generacion.MODELO), cache=self.cache,
+                           forzar=parametros.get("forzar", False), planificador=self.planificador, registro=registro)
+            subtema, capitulo, referencias = parametros["subtema"], parametros["capitulo"], parametros["referencias"]
+            evitar = self.solapamiento.pista_no_repetir(capitulo, subtema) if self.solapamiento else ""
+            if parametros.get("por_secciones"):
+                # El prompt del esquema junto con las referencias que después se reparten entre secciones.
+                prompt = "\n".join([secciones.construir_prompt_esquema(subtema, capitulo, evitar), *referencias])
+            else:
+                prompt = generacion.construir_prompt(subtema, capitulo, referencias, evitar)
+            self._actualizar(id_trabajo, prompt_hash=hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+            if parametros.get("por_secciones"):
+                texto = secciones.redactar_por_secciones(
+                    cliente, subtema, capitulo, referencias, **comunes,
+                    evitar=evitar, al_avanzar=al_avanzar, metricas=metricas,
+                    al_terminar_seccion=lambda listas, total: al_avanzar(None, f"{listas}/{total} secciones")
+                )
+            else:
+                texto = generacion.redactar(
+                    cliente, subtema, capitulo, referencias, **comunes,
+                    evitar=evitar, al_avanzar=al_avanzar, metricas=metricas
+                )
+            solapamientos = []
+            if self.solapamiento and texto:
+                clave = (capitulo, subtema)
+                solapamientos = self.solapamiento.buscar(texto, excluir=clave)
+                self.solapamiento.indexar(*clave, texto)
+            estado, campos = "listo", {"resultado": texto, "parcial": texto,
+                                       "solapamientos": json.dumps(solapamientos, ensure_ascii=False)}
+        except TrabajoCancelado:
+            estado, campos = "cancelado", {"resultado": parcial[0], "parcial": parcial[0]}
+        except Exception as e:
+            estado, campos = "error", {"error": str(e)}
+        uso = registro.resumen()["llamadas"].values()
+        self._actualizar(
+            id_trabajo, estado=estado, terminado=time.time(), metricas=json.dumps(metricas),
+            prompt_tokens=sum(m["prompt_tokens"] for m in uso), completion_tokens=sum(m["completion_tokens"] for m in uso),
+            costo=sum(m["costo"] for m in uso), **campos
+        )
+        with self._lock:
+            self._claves.pop(id_trabajo, None)
+            self._cancelados.discard(id_trabajo)
+
+    # --- CONSULTA ---
+    def _a_dict(self, fila):
+        trabajo = dict(fila)
+        for campo in ("parametros", "metricas", "solapamientos"):
+            trabajo[campo] = json.loads(trabajo[campo])
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        return self._a_dict(fila) if fila else None
+
+    def listar(self, propietario=None, limite=20):
+        consulta = "SELECT * FROM trabajos"
+        argumentos = ()
+        if propietario is not None:
+            consulta += " WHERE propietario = ?"
+            argumentos = (propietario,)
+        with self._lock:
+            filas = self._conn.execute(consulta + " ORDER BY creado DESC LIMIT ?", (*argumentos, limite)).fetchall()
+        return [self._a_dict(f) for f in filas]
+
+    def estadisticas(self):
+        with self._lock:
+            filas = self._conn.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall()
+        conteo = {estado: 0 for estado in ACTIVOS + TERMINADOS}
+        conteo.update({estado: n for estado, n in filas})
+        return conteo
@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .citas import apellido_principal, normalizar, vacio
+
+PALABRAS_POR_VISUAL = 500
+PATRON_VISUAL = re.compile(r"^[\s>*_#-]*(?:📊|🖼️|📈)?\s*\**\s*(?:recurso|sugerencia)\s+(?:de\s+recurso\s+)?visual", re.I)
+_ENCABEZADO = re.compile(r"^(#{1,6})\s+(.*?)[\s#]*$")
+PATRON_REFERENCIAS = re.compile(
+    r"^(?:#{1,6}\s*)?[*_]*\s*(?:referencias|bibliograf[ií]a|references)(?:\s+(?:bibliogr[aá]ficas|apa\s*7?))?\s*[*_]*\s*:?\s*[*_]*\s*$",
+    re.I
+)
+_CERCO = re.compile(r"^\s*(```|~~~)")
+_SEPARADOR = re.compile(r"^\s*(?:[-*_]\s*){3,}$|^\s*\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_ENLACE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)|https?://\S+")
+_PALABRA = re.compile(r"\w+(?:[-'’.]\w+)*")
+_VIÑETA = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+# Citas en el texto: "(García, 2020; Pérez et al., 2019a)" y "García y Pérez (2020)".
+_MAYUSCULA = r"[A-ZÁÉÍÓÚÑÜ][\w'’-]+"
+_ANIOS = r"\d{4}[a-z]?(?:\s*,\s*\d{4}[a-z]?)*"
+_PARENTESIS = re.compile(r"\(([^()]*?\d{4}[a-z]?)\)")
+_PARTE_CITA = re.compile(
+    rf"^\s*(?:(?:p\.\s*ej\.|e\.\s*g\.|ver|véase|cf\.),?\s*)?(?P<autores>.*?{_MAYUSCULA}.*?),?\s+(?P<anios>{_ANIOS})\s*$"
+)
+_NARRATIVA = re.compile(
+    rf"(?P<autores>(?:{_MAYUSCULA}\s+){{0,2}}{_MAYUSCULA})(?:\s+et\s+al\.?)?"
+    rf"(?:\s+(?:y|&|and)\s+{_MAYUSCULA})?\s+\((?P<anios>{_ANIOS})\)"
+)
+_ENTRADA_ANIO = re.compile(r"\((\d{4}[a-z]?|s\.\s*f\.)\)")
+
+
+# --- CLAVES DE CITA ---
+def clave_cita(autores, anio):
+    # (apellido del primer autor normalizado, año): la misma forma que usa citas.IndiceCitas.
+    return normalizar(apellido_principal(autores)).strip(), normalizar(str(anio)).strip()
+
+
+def claves_de_tabla(df):
+    # Claves de todas las filas de una tabla normalizada (ver referencias.cargar_tabla).
+    return {
+        clave_cita(autores, anio)
+        for autores, anio in zip(df["Autores"], df["Año"])
+        if not vacio(autores) and not vacio(anio)
+    }
+
+
+def _primer_autor(autores):
+    autores = re.sub(r"\s+et\s+al\.?", "", autores)
+    return re.split(r"\s*(?:&|;|\by\b|\band\b)\s*", autores)[0].strip(" ,")
+
+
+def citas_de_linea(linea):
+    # [(autores tal como aparecen, año)] de las citas de una línea, en orden de aparición.
+    if "(" not in linea:
+        return []
+    encontradas = []
+    for parentesis in _PARENTESIS.finditer(linea):
+        for parte in parentesis.group(1).split(";"):
+            m = _PARTE_CITA.match(parte)
+            if m:
+                encontradas.append((parentesis.start(), _primer_autor(m.group("autores")), m.group("anios")))
+    for m in _NARRATIVA.finditer(linea):
+        encontradas.append((m.start(), m.group("autores"), m.group("anios")))
+    return [(autores, anio.strip()) for _, autores, anios in sorted(encontradas) for anio in anios.split(",")]
+
+
+def _resolver(autores, anio, conocidas):
+    # "Según García Pérez" puede ser "García Pérez" o "Pérez": gana el sufijo más largo conocido;
+    # si ninguno lo es, la última palabra (el apellido más probable).
+    palabras = normalizar(autores).split()
+    anio = normalizar(anio)
+    for i in range(len(palabras)):
+        clave = (" ".join(palabras[i:]), anio)
+        if clave in conocidas or (clave[0], anio[:4]) in conocidas:
+            return clave if clave in conocidas else (clave[0], anio[:4])
+    return (palabras[-1] if palabras else "", anio)
+
+
+# --- VALIDADOR ---
+class Validador:
+    # Recorre el manuscrito una sola vez, línea por línea (se le puede ir pasando el texto a medida
+    # que llega), y arma un informe: palabras reales del cuerpo (sin marcado, encabezados, recursos
+    # visuales ni bloque de referencias), árbol de encabezados, densidad de recursos visuales, citas
+    # por sección y referencias no citadas o inexistentes. `claves_tabla` son las claves de
+    # `claves_de_tabla(df)`; sin ellas no se informa contra el CSV.
+
+    def __init__(self, claves_tabla=None, palabras_por_visual=PALABRAS_POR_VISUAL):
+        self.claves_tabla = claves_tabla
+        self.palabras_por_visual = palabras_por_visual
+        self._resto = ""
+        self._linea = 0
+        self._en_codigo = False
+        self._nivel_referencias = None
+        self.palabras = 0
+        self.palabras_brutas = 0
+        self.secciones = [{"nivel": 0, "titulo": "", "linea": 0, "padre": None, "palabras": 0, "citas": 0, "visuales": 0}]
+        self.visuales = []
+        self.citas = []
+        self.entradas = []
+
+    def alimentar(self, fragmento):
+        lineas = (self._resto + fragmento).split("\n")
+        self._resto = lineas.pop()
+        for linea in lineas:
+            self._procesar(linea)
+        return self
+
+    def _procesar(self, linea):
+        self._linea += 1
+        self.palabras_brutas += len(linea.split())
+        if _CERCO.match(linea):
+            self._en_codigo = not self._en_codigo
+            return
+        if self._en_codigo or not linea.strip() or _SEPARADOR.match(linea):
+            return
+        encabezado = _ENCABEZADO.match(linea)
+        if PATRON_REFERENCIAS.match(linea):
+            self._nivel_referencias = len(encabezado.group(1)) if encabezado else 0
+            return
+        if encabezado:
+            nivel = len(encabezado.group(1))
+            # Un encabezado del mismo nivel o superior que "Referencias" cierra el bloque.
+            if self._nivel_referencias is not None and not (self._nivel_referencias and nivel > self._nivel_referencias):
+                self._nivel_referencias = None
+            if self._nivel_referencias is None:
+                self._abrir_seccion(nivel, encabezado.group(2).strip(" *_"))
+                return
+        if self._nivel_referencias is not None:
+            self._entrada(linea)
+            return
+        seccion = self.secciones[-1]
+        if PATRON_VISUAL.match(linea):
+            seccion["visuales"] += 1
+            self.visuales.append({"linea": self._linea, "palabras_previas": self.palabras, "seccion": len(self.secciones) - 1})
+            return
+        texto = _ENLACE.sub(lambda m: m.group(1) or "", _VIÑETA.sub("", linea))
+        n = len(_PALABRA.findall(texto))
+        self.palabras += n
+        seccion["palabras"] += n
+        for autores, anio in citas_de_linea(texto):
+            seccion["citas"] += 1
+            self.citas.append({"autores": autores, "anio": anio, "linea": self._linea, "seccion": len(self.secciones) - 1})
+
+    def _abrir_seccion(self, nivel, titulo):
+        padre = len(self.secciones) - 1
+        while padre and self.secciones[padre]["nivel"] >= nivel:
+            padre = self.secciones[padre]["padre"]
+        self.secciones.append({"nivel": nivel, "titulo": titulo, "linea": self._linea, "padre": padre,
+                               "palabras": 0, "citas": 0, "visuales": 0})
+
+    def _entrada(self, linea):
+        entrada = _VIÑETA.sub("", linea).strip()
+        anio = _ENTRADA_ANIO.search(entrada)
+        if anio and len(_PALABRA.findall(entrada)) > 2:
+            self.entradas.append({"texto": entrada, "autores": entrada[:anio.start()], "anio": anio.group(1),
+                                  "linea": self._linea})
+
+    # --- INFORME ---
+    def cerrar(self):
+        if self._resto:
+            self._procesar(self._resto)
+            self._resto = ""
+        problemas = []
+        secciones = self._estructura(problemas)
+        visuales = self._visuales(problemas)
+        citas, referencias = self._citas(problemas)
+        return {
+            "palabras": self.palabras,
+            "palabras_brutas": self.palabras_brutas,
+            "secciones": secciones,
+            "visuales": visuales,
+            "citas": citas,
+            "referencias": referencias,
+            "problemas": problemas,
+        }
+
+    def _estructura(self, problemas):
+        secciones = []
+        for i, s in enumerate(self.secciones):
+            if i == 0 and not s["palabras"] and not s["citas"] and not s["visuales"]:
+                continue
+            secciones.append({**s, "densidad_citas": round(100 * s["citas"] / s["palabras"], 2) if s["palabras"] else 0.0})
+        encabezados = self.secciones[1:]
+        if not encabezados and self.palabras >= self.palabras_por_visual:
+            problemas.append({"tipo": "sin_encabezados", "linea": 0, "detalle": "El texto no tiene subtítulos"})
+        previo = None
+        for i, s in enumerate(encabezados, start=1):
+            if (previo is None and s["nivel"] > 2) or (previo is not None and s["nivel"] > previo + 1):
+                problemas.append({"tipo": "nivel_salteado", "linea": s["linea"],
+                                  "detalle": f"«{s['titulo']}» es de nivel {s['nivel']} después de un nivel {previo or 0}"})
+            siguiente = self.secciones[i + 1] if i + 1 < len(self.secciones) else None
+            if not s["palabras"] and (siguiente is None or siguiente["nivel"] <= s["nivel"]):
+                problemas.append({"tipo": "seccion_vacia", "linea": s["linea"], "detalle": f"«{s['titulo']}» no tiene texto"})
+            previo = s["nivel"]
+        if sum(s["nivel"] == 1 for s in encabezados) > 1:
+            problemas.append({"tipo": "varios_titulos", "linea": 0, "detalle": "Hay más de un encabezado de nivel 1"})
+        return secciones
+
+    def _visuales(self, problemas):
+        tramos = [0] * (self.palabras // self.palabras_por_visual + 1)
+        for v in self.visuales:
+            tramo = min(v["palabras_previas"] // self.palabras_por_visual, len(tramos) - 1)
+            tramos[tramo] += 1
+            if tramos[tramo] == 2:
+                problemas.append({"tipo": "visual_de_mas", "linea": v["linea"],
+                                  "detalle": f"Más de un recurso visual entre las palabras {tramo * self.palabras_por_visual} "
+                                             f"y {(tramo + 1) * self.palabras_por_visual}"})
+        esperadas = self.palabras // self.palabras_por_visual
+        if len(self.visuales) < esperadas:
+            problemas.append({"tipo": "faltan_visuales", "linea": 0,
+                              "detalle": f"{len(self.visuales)} recursos visuales para {self.palabras} palabras (se esperan {esperadas})"})
+        return {"cantidad": len(self.visuales), "esperadas": esperadas, "por_tramo": tramos,
+                "lineas": [v["linea"] for v in self.visuales]}
+
+    def _citas(self, problemas):
+        conocidas = set(self.claves_tabla or ())
+        entradas = []
+        for e in self.entradas:
+            autores = apellido_principal(e["autores"]) if e["autores"].strip() else ""
+            clave = _resolver(autores, e["anio"], conocidas) if autores else ("", "")
+            entradas.append({**e, "clave": clave})
+        conocidas |= {e["clave"] for e in entradas}
+        citadas = {}
+        for c in self.citas:
+            clave = _resolver(c["autores"], c["anio"], conocidas)
+            citadas.setdefault(clave, []).append(c["linea"])
+
+        def en(clave, claves):
+            return clave in claves or (clave[0], clave[1][:4]) in claves
+
+        claves_entradas = {e["clave"] for e in entradas}
+        sin_entrada = [k for k in citadas if entradas and not en(k, claves_entradas)]
+        no_citadas = [e for e in entradas if not en(e["clave"], citadas)]
+        sin_referencia, fantasma = [], []
+        if self.claves_tabla is not None:
+            sin_referencia = [k for k in citadas if not en(k, self.claves_tabla)]
+            fantasma = [e for e in entradas if not en(e["clave"], self.claves_tabla)]
+        if self.citas and not entradas:
+            problemas.append({"tipo": "sin_referencias", "linea": 0, "detalle": "Hay citas pero no hay sección de referencias"})
+        for k in sin_entrada:
+            problemas.append({"tipo": "cita_sin_entrada", "linea": citadas[k][0], "detalle": f"{k[0]} ({k[1]}) no figura en las referencias"})
+        for k in sin_referencia:
+            problemas.append({"tipo": "cita_fantasma", "linea": citadas[k][0], "detalle": f"{k[0]} ({k[1]}) no está en la tabla de referencias"})
+        for e in no_citadas:
+            problemas.append({"tipo": "referencia_no_citada", "linea": e["linea"], "detalle": e["texto"][:120]})
+        for e in fantasma:
+            problemas.append({"tipo": "referencia_fantasma", "linea": e["linea"], "detalle": e["texto"][:120]})
+        citas = {
+            "total": len(self.citas),
+            "distintas": len(citadas),
+            "por_100_palabras": round(100 * len(self.citas) / self.palabras, 2) if self.palabras else 0.0,
+            "sin_entrada": [list(k) for k in sin_entrada],
+            "sin_referencia": [list(k) for k in sin_referencia],
+        }
+        referencias = {
+            "listadas": len(entradas),
+            "no_citadas": [e["texto"] for e in no_citadas],
+            "fantasma": [e["texto"] for e in fantasma],
+        }
+        return citas, referencias
+
+
+def validar(texto, claves_tabla=None):
+    return Validador(claves_tabla).alimentar(texto).cerrar()
+
+
+def contar_palabras_cuerpo(texto):
+    return validar(texto)["palabras"]
+
+
+# --- LOTE ---
+def validar_archivo(ruta, claves_tabla=None):
+    validador = Validador(claves_tabla)
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            validador.alimentar(linea)
+    return {"archivo": str(ruta), **validador.cerrar()}
+
+
+def _validar_archivo(argumentos):
+    return validar_archivo(*argumentos)
+
+
+def validar_lote(rutas, claves_tabla=None, procesos=None):
+    # Un proceso por núcleo: la validación es solo CPU. Devuelve los informes en el orden de `rutas`.
+    rutas = [str(r) for r in rutas]
+    if len(rutas) < 2 or procesos == 1:
+        return [validar_archivo(r, claves_tabla) for r in rutas]
+    with ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+        return list(pool.map(_validar_archivo, [(r, claves_tabla) for r in rutas], chunksize=8))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida manuscritos en markdown contra las reglas del prompt ACE.")
+    parser.add_argument("archivos", nargs="+", help="Archivos .md o carpetas con archivos .md")
+    parser.add_argument("-r", "--referencias", help="CSV de referencias para detectar citas y referencias inexistentes")
+    parser.add_argument("--json", help="Escribir los informes completos en este archivo JSON Lines")
+    parser.add_argument("-p", "--procesos", type=int, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    rutas = []
+    for a in args.archivos:
+        rutas.extend(sorted(Path(a).glob("*.md")) if Path(a).is_dir() else [Path(a)])
+    claves = None
+    if args.referencias:
+        from .referencias import cargar_tabla
+
+        claves = claves_de_tabla(cargar_tabla(Path(args.referencias).read_bytes()))
+    informes = validar_lote(rutas, claves, args.procesos)
+    for informe in informes:
+        estado = "✅" if not informe["problemas"] else f"⚠️ {len(informe['problemas'])} problemas"
+        print(f"{informe['archivo']}: {informe['palabras']} palabras, {len(informe['secciones'])} secciones, "
+              f"{informe['visuales']['cantidad']}/{informe['visuales']['esperadas']} visuales, "
+              f"{informe['citas']['total']} citas — {estado}")
+        for p in informe["problemas"]:
+            print(f"    [{p['tipo']}] línea {p['linea']}: {p['detalle']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            for informe in informes:
+                f.write(json.dumps(informe, ensure_ascii=False) + "\n")
+    return 1 if any(i["problemas"] for i in informes) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,147 +1,261 @@
 
+import os
+
 import streamlit as st
 import pandas as pd
-import openai
-from docx import Document
-import tempfile
-import os
-import re
+
+from ace_writer import citas, exportacion, trabajos, validacion
+from ace_writer.catalogo import CatalogoBibliografico
+from ace_writer.cache_respuestas import CacheCompletions
+from ace_writer.instrumentacion import Registro
+from ace_writer.planificador import Planificador
+from ace_writer.referencias import cargar_tabla, clasificar, describir_incompletas, formatear_apa
+from ace_writer.relevancia import PRESUPUESTO_TOKENS_REFERENCIAS, seleccionar_referencias
+from ace_writer.solapamiento import IndiceSolapamiento, resumir_por_subtema
+from ace_writer.trabajos import ColaTrabajos, propietario_de
 
 st.set_page_config(page_title="ACE Writer Mini – Versión Final", layout="wide")
 st.title("🧠 ACE Writer Mini – Generador de capítulos científicos")
 
 # Inicialización de estado
-for key in ["clave_ok", "redaccion", "citadas", "subtema", "referencias_completas", "referencias_incompletas"]:
+for key in ["clave_ok", "redaccion", "citadas", "subtema", "referencias_completas", "referencias_incompletas", "metricas_llamadas",
+            "solapamientos"]:
     if key not in st.session_state:
-        st.session_state[key] = [] if "referencias" in key or key == "citadas" else ""
+        st.session_state[key] = [] if "referencias" in key or key in ("citadas", "metricas_llamadas", "solapamientos") else ""
+
+@st.cache_resource
+def obtener_cache():
+    return CacheCompletions()
+
+# Un solo planificador por proceso: los límites de la API son por cuenta, no por sesión.
+@st.cache_resource
+def obtener_planificador():
+    return Planificador()
+
+@st.cache_resource
+def obtener_indice_solapamiento():
+    return IndiceSolapamiento()
+
+# Totales del proceso (para el textfile de Prometheus); cada sesión lleva además su propio desglose.
+@st.cache_resource
+def obtener_registro_proceso():
+    return Registro(ruta_log=None, ruta_prometheus=os.environ.get("ACE_PROMETHEUS_TEXTFILE"))
+
+# Los trabajos sobreviven a la sesión que los envió: la cola es del proceso y su estado está en disco.
+@st.cache_resource
+def obtener_cola():
+    return ColaTrabajos(cache=obtener_cache(), planificador=obtener_planificador(),
+                        solapamiento=obtener_indice_solapamiento(), registro=obtener_registro_proceso())
+
+@st.cache_resource
+def obtener_catalogo():
+    return CatalogoBibliografico()
+
+cache = obtener_cache()
+catalogo = obtener_catalogo()
+planificador = obtener_planificador()
+solapamiento = obtener_indice_solapamiento()
+cola = obtener_cola()
+if "registro" not in st.session_state:
+    st.session_state["registro"] = Registro(padre=obtener_registro_proceso())
+registro = st.session_state["registro"]
 
 # Paso 0 – API Key
 api_key = st.text_input("🔐 Clave OpenAI", type="password")
 if api_key.startswith("sk-"):
     st.session_state["clave_ok"] = True
     st.success("✅ Clave válida")
+    # Con la clave de vuelta se retoman los trabajos de este usuario que cortó un reinicio del servidor.
+    if st.session_state.get("reanudados") != propietario_de(api_key):
+        st.session_state["reanudados"] = propietario_de(api_key)
+        if retomados := cola.reanudar(api_key):
+            st.info(f"🔁 Se retomaron {retomados} trabajo(s) que quedaron a medias")
 
 # Paso 1 – Plantilla Word
 st.subheader("Paso 1 – Subí tu plantilla Word (.dotx)")
 plantilla = st.file_uploader("📂 Plantilla Word", type=["dotx"])
 if plantilla:
-    doc = Document(plantilla)
-    requeridos = ["Heading 1", "Heading 2", "Normal", "Reference"]
-    encontrados = [s.name for s in doc.styles]
-    validacion = [{"Estilo": s, "Presente": "✅" if s in encontrados else "❌"} for s in requeridos]
+    validacion = exportacion.validar_estilos(plantilla)
     st.dataframe(pd.DataFrame(validacion))
 
 # Paso 2 – Cargar referencias
 st.subheader("Paso 2 – Subí tu archivo .csv con referencias")
 archivo_csv = st.file_uploader("📄 Archivo .csv", type=["csv"])
 referencias_seleccionadas = []
+filas_seleccionadas = []
+df = None
 
 if archivo_csv:
-    df = pd.read_csv(archivo_csv)
-    columnas = ["Autores", "Año", "Título del artículo", "Journal"]
-    completas, incompletas = [], []
-
-    for i, row in df.iterrows():
-        if any(pd.isna(row.get(col, "")) or str(row[col]).strip() == "" for col in columnas):
-            ref = f"Fila {i+1}: {row.to_dict()}"
-            incompletas.append(ref)
-            continue
-        ref = f"{row['Autores']} ({row['Año']}). {row['Título del artículo']}. {row['Journal']}."
-        if "DOI" in row and pd.notna(row["DOI"]):
-            ref += f" https://doi.org/{row['DOI']}"
-        completas.append(ref)
+    with registro.etapa("lectura CSV"):
+        df = cargar_tabla(archivo_csv)
+    # Los campos vacíos (DOI, revista, título...) se completan con el catálogo local antes de clasificar.
+    if catalogo.version:
+        with registro.etapa("catálogo"):
+            df, completadas = catalogo.completar(df)
+        if completadas:
+            with st.expander(f"🔎 {len(completadas)} referencias completadas con el catálogo local"):
+                st.dataframe(pd.DataFrame([{**c, "campos": ", ".join(c["campos"])} for c in completadas]), hide_index=True)
+    df_completas, df_incompletas = clasificar(df)
+    completas = formatear_apa(df_completas).tolist()
+    incompletas = describir_incompletas(df_incompletas)
 
     referencias_seleccionadas.extend(completas)
+    filas_seleccionadas.extend(df_completas.index)
     st.success(f"✅ {len(completas)} referencias completas agregadas automáticamente.")
     if incompletas:
         st.warning(f"⚠️ {len(incompletas)} referencias incompletas detectadas.")
         seleccionar_todas = st.checkbox("Seleccionar todas las incompletas")
-        for i, ref in enumerate(incompletas):
+        for i, (fila, ref) in enumerate(zip(df_incompletas.index, incompletas)):
             if seleccionar_todas or st.checkbox(ref, key=f"incomp_{i}"):
                 referencias_seleccionadas.append(ref)
+                filas_seleccionadas.append(fila)
 
 # Paso 3 – Ingreso del subtítulo
 st.subheader("Paso 3 – Ingresá el subtítulo del subtema")
 st.session_state["subtema"] = st.text_input("✏️ Subtema del capítulo", value=st.session_state["subtema"])
 
 # Paso 4 – Redacción con GPT
-def redactar_con_gpt(subtema, capitulo, referencias, api_key):
-    prompt = f"""Actuás como redactor científico del Proyecto eBooks ACE.
-Tu tarea es redactar el subtema titulado "{subtema}", parte del capítulo "{capitulo}" de un e-book científico.
-
-📌 Requisitos:
-– Redactar un texto científicamente sólido y bien estructurado. El mínimo es de 1500 palabras reales, pero si el tema se agota correctamente con menos, se puede entregar así.
-– Incluir 1 sugerencia de recurso visual cada 500 palabras
-– Usar solo las referencias proporcionadas
-– Cerrar con sección de referencias APA 7, solo si fueron citadas
-
-📚 Lista de referencias válidas:
-{chr(10).join(referencias)}
-
-Redactá con tono técnico claro, orientado a entrenadores, usando ejemplos prácticos y subtítulos jerárquicos.
-"""
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        with st.spinner("✍️ Generando texto..."):
-            r1 = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=4096
-            )
-        base = r1.choices[0].message.content
-        if len(base.split()) >= 1500:
-            return base
-
-        extend = f"Extendé este texto sin repetir ideas hasta superar 1500 palabras:\n\n{base}"
-        with st.spinner("🔁 Ampliando..."):
-            r2 = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": extend}],
-                temperature=0.7,
-                max_tokens=3000
-            )
-        extra = r2.choices[0].message.content
-        if base in extra:
-            extra = extra.replace(base, "")
-        return base + "\n\n" + extra
-    except Exception as e:
-        st.error("❌ Error al generar redacción: " + str(e))
-        return ""
-
-# Botón para generar redacción
+en_vivo = st.checkbox("⚡ Mostrar el texto a medida que se genera (streaming)", value=True)
+forzar = st.checkbox("🔄 Forzar regeneración (ignorar respuestas guardadas)")
+por_secciones = st.checkbox("🧩 Generar por secciones en paralelo (primero un esquema, sin tope de 1500 palabras)")
+capitulo = "Capítulo auto-generado"
+presupuesto = st.number_input("📏 Tokens máximos de referencias en el prompt (0 = sin límite)",
+                              min_value=0, value=PRESUPUESTO_TOKENS_REFERENCIAS, step=250)
+
+# Las referencias más relevantes para el subtema entran primero hasta agotar el presupuesto.
+referencias_prompt, filas_prompt = referencias_seleccionadas, filas_seleccionadas
+if referencias_seleccionadas and st.session_state["subtema"]:
+    with registro.etapa("selección de referencias"):
+        incluidas, descartadas = seleccionar_referencias(
+            referencias_seleccionadas, st.session_state["subtema"], capitulo, presupuesto
+        )
+    referencias_prompt = [r["referencia"] for r in incluidas]
+    filas_prompt = [filas_seleccionadas[r["posicion"]] for r in incluidas]
+    with st.expander(f"📚 Referencias en el prompt: {len(incluidas)} incluidas · {len(descartadas)} descartadas por presupuesto"):
+        tabla = [{"Incluida": "✅", **r} for r in incluidas] + [{"Incluida": "❌", **r} for r in descartadas]
+        st.dataframe(pd.DataFrame(tabla)[["Incluida", "puntaje", "tokens", "referencia"]])
+
+# La generación corre como trabajo en segundo plano: la página solo envía y consulta, así que
+# un refresco o una reconexión no la cortan (el id queda en la URL para volver a engancharse).
 if st.button("🚀 Generar redacción"):
     if st.session_state["clave_ok"] and st.session_state["subtema"] and referencias_seleccionadas:
-        texto = redactar_con_gpt(st.session_state["subtema"], "Capítulo auto-generado", referencias_seleccionadas, api_key)
-        st.session_state["redaccion"] = texto
-        citas = []
-        for ref in referencias_seleccionadas:
-            apellido = ref.split(",")[0]
-            if apellido.lower() in texto.lower():
-                citas.append(ref)
-        st.session_state["citadas"] = list(set(citas))
+        st.session_state["trabajo"] = cola.enviar({
+            "subtema": st.session_state["subtema"],
+            "capitulo": capitulo,
+            "referencias": referencias_prompt,
+            "forzar": forzar,
+            "por_secciones": por_secciones,
+        }, api_key, registro=registro)
+        st.query_params["trabajo"] = st.session_state["trabajo"]
+        st.session_state["redaccion"] = ""
+        st.session_state["metricas_llamadas"] = []
+        st.session_state["solapamientos"] = []
+
+def cargar_resultado(trabajo):
+    st.session_state["redaccion"] = trabajo["resultado"] or ""
+    st.session_state["metricas_llamadas"] = trabajo["metricas"]
+    st.session_state["solapamientos"] = trabajo["solapamientos"]
+    st.session_state["citadas"] = []
+    st.session_state["citas_menciones"] = 0
+    # Las citas se buscan contra el CSV cargado; tras un refresco hay que volver a subirlo.
+    if df is not None and st.session_state["redaccion"]:
+        with registro.etapa("detección de citas"):
+            encontradas, _ = citas.indice_para(df).buscar(st.session_state["redaccion"])
+        citadas = [fila for fila in filas_prompt if fila in encontradas]
+        st.session_state["citadas"] = formatear_apa(df.loc[citadas]).tolist()
+        st.session_state["citas_menciones"] = sum(encontradas[fila]["conteo"] for fila in citadas)
+    st.session_state["trabajo_cargado"] = trabajo["id"]
+
+@st.fragment(run_every=1)
+def seguir_trabajo(id_trabajo):
+    trabajo = cola.obtener(id_trabajo)
+    if trabajo is None:
+        return
+    if trabajo["estado"] in trabajos.ACTIVOS:
+        st.subheader("🧾 Redacción generada")
+        estado = "⏳ En cola" if trabajo["estado"] == "pendiente" else "✍️ Generando"
+        st.info(f"{estado}... {trabajo['progreso']}".strip())
+        if st.button("⏹️ Cancelar"):
+            cola.cancelar(id_trabajo)
+        if en_vivo and trabajo["parcial"]:
+            st.markdown(trabajo["parcial"] + "▌")
+        return
+    cargar_resultado(trabajo)
+    st.rerun()
+
+id_trabajo = st.session_state.get("trabajo") or st.query_params.get("trabajo")
+trabajo = cola.obtener(id_trabajo) if id_trabajo else None
+if trabajo:
+    st.session_state["trabajo"] = id_trabajo
+    # Solo se consulta periódicamente mientras el trabajo no terminó o aún no se trajo su resultado.
+    if trabajo["estado"] in trabajos.ACTIVOS or st.session_state.get("trabajo_cargado") != id_trabajo:
+        seguir_trabajo(id_trabajo)
+    elif trabajo["error"]:
+        st.error("❌ Error al generar redacción: " + trabajo["error"])
+    elif trabajo["estado"] == "cancelado":
+        st.warning("⏹️ Generación cancelada; se conserva el texto parcial.")
 
 # Paso 5 – Mostrar texto
 if st.session_state.get("redaccion"):
     st.subheader("🧾 Redacción generada")
     st.text_area("Texto", value=st.session_state["redaccion"], height=500)
-    st.markdown(f"📊 Palabras: **{len(st.session_state['redaccion'].split())}**")
-    st.markdown(f"📚 Citas detectadas: **{len(st.session_state['citadas'])}**")
+    with registro.etapa("validación"):
+        informe = validacion.validar(st.session_state["redaccion"], validacion.claves_de_tabla(df) if df is not None else None)
+    st.markdown(f"📊 Palabras: **{informe['palabras']}** (sin títulos, marcado ni referencias) · "
+                f"🖼️ Recursos visuales: **{informe['visuales']['cantidad']}** de {informe['visuales']['esperadas']} esperados")
+    with st.expander(f"🧪 Validación: {len(informe['problemas'])} problemas"):
+        st.dataframe(pd.DataFrame([
+            {"Sección": "  " * max(s["nivel"] - 1, 0) + (s["titulo"] or "(antes del primer título)"), "Palabras": s["palabras"],
+             "Citas": s["citas"], "Citas c/100 palabras": s["densidad_citas"], "Visuales": s["visuales"]}
+            for s in informe["secciones"]
+        ]), hide_index=True)
+        for p in informe["problemas"]:
+            st.caption(f"⚠️ línea {p['linea']}: {p['detalle']}")
+    st.markdown(f"📚 Citas detectadas: **{len(st.session_state['citadas'])}** referencias ({st.session_state.get('citas_menciones', 0)} menciones en el texto)")
+    if st.session_state["solapamientos"]:
+        resumen = resumir_por_subtema(st.session_state["solapamientos"])
+        with st.expander(f"♻️ {len(st.session_state['solapamientos'])} oraciones parecidas a otros subtemas ya generados"):
+            for (cap, sub), cantidad in resumen.items():
+                st.markdown(f"- **{sub}** ({cap}): {cantidad} oraciones")
+            for s in st.session_state["solapamientos"]:
+                st.caption(f"«{s['oracion']}» ≈ «{s['oracion_previa']}» — {s['subtema']} ({s['similitud']:.2f})")
+    for m in st.session_state["metricas_llamadas"]:
+        if m.get("cache"):
+            st.caption(f"💾 {m['etapa']}: respuesta recuperada de la cache (sin costo)")
+            continue
+        st.caption(f"⏱️ {m['etapa']}: primer token en {m['ttft']} s · {m['tokens']} tokens · {m['tokens_por_segundo']} tokens/s · {m['duracion']} s en total")
 
-# Paso 6 – Exportar a Word
+# Paso 6 – Exportar (Word con los estilos de la plantilla, Markdown o HTML)
+FORMATOS = {"Word (.docx)": "docx", "Markdown (.md)": "md", "HTML (.html)": "html"}
 if st.session_state.get("redaccion"):
-    if st.button("💾 Exportar a Word"):
-        doc = Document(plantilla) if plantilla else Document()
-        doc.add_heading(st.session_state["subtema"], level=1)
-        doc.add_paragraph(st.session_state["redaccion"])
-        doc.add_page_break()
-        doc.add_heading("Referencias citadas", level=2)
-        for ref in st.session_state["citadas"]:
-            doc.add_paragraph(ref)
-
-        safe_name = re.sub(r'[^a-zA-Z0-9_-]', '_', st.session_state["subtema"].strip()) or "ACEWriter"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".docx")
-        doc.save(temp_file.name)
-        with open(temp_file.name, "rb") as f:
-            st.download_button("📥 Descargar Word", data=f, file_name=f"{safe_name}.docx")
-        os.unlink(temp_file.name)
+    formato = FORMATOS[st.radio("Formato", list(FORMATOS), horizontal=True)]
+    if st.button("💾 Exportar"):
+        with registro.etapa(f"exportación {formato}"):
+            datos = exportacion.exportar(
+                formato, plantilla, st.session_state["subtema"], st.session_state["redaccion"], st.session_state["citadas"]
+            )
+        safe_name = exportacion.nombre_seguro(st.session_state["subtema"])
+        st.download_button("📥 Descargar", data=datos, file_name=f"{safe_name}.{formato}")
+
+with st.sidebar:
+    e = cache.estadisticas()
+    st.markdown("### 💾 Cache de respuestas")
+    st.caption(f"Aciertos: {e['aciertos']} · Fallos: {e['fallos']} · Entradas: {e['entradas']} ({e['bytes'] / 1024:.0f} KB)")
+    p = planificador.estadisticas()
+    st.markdown("### 🚦 Cola de solicitudes")
+    st.caption(f"En cola: {p['en_cola']} · Espera media: {p['espera_media']} s · Reintentos: {p['reintentos']} · Errores: {p['errores']}")
+    m = registro.resumen()
+    st.markdown("### ⏱️ Tiempos y costos de la sesión")
+    st.caption(f"Tokens: {m['tokens_totales']} · Costo estimado: US$ {m['costo_total']:.4f}")
+    if m["etapas"] or m["llamadas"]:
+        st.dataframe(pd.DataFrame(registro.tabla()), hide_index=True)
+    st.markdown("### 📋 Trabajos")
+    t = cola.estadisticas()
+    st.caption(f"Pendientes: {t['pendiente']} · En curso: {t['en_curso']} · Listos: {t['listo']} · Con error: {t['error']}")
+    for previo in cola.listar(propietario_de(api_key), limite=10) if api_key else []:
+        etiqueta = f"{previo['parametros']['subtema'][:40]} · {previo['estado']}"
+        if st.button(etiqueta, key=f"trabajo_{previo['id']}"):
+            st.session_state["trabajo"] = previo["id"]
+            st.query_params["trabajo"] = previo["id"]
+            st.session_state["trabajo_cargado"] = None
+            st.rerun()
@@ -1,115 +1,139 @@
+import os
+
 import streamlit as st
 import pandas as pd
-import docx
-from docx.shared import Pt
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
-from io import BytesIO
-import re
-import tiktoken
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# --- FUNCIONES AUXILIARES ---
-def contar_tokens(texto):
-    enc = tiktoken.encoding_for_model("gpt-4")
-    return len(enc.encode(texto))
-
-def contar_palabras(texto):
-    return len(texto.split())
-
-def detectar_redundancias(texto, umbral=0.85):
-    oraciones = re.split(r'(?<=[.!?])\s+', texto)
-    vectorizer = TfidfVectorizer().fit_transform(oraciones)
-    sim_matrix = cosine_similarity(vectorizer)
-    redundantes = set()
-    for i in range(len(sim_matrix)):
-        for j in range(i+1, len(sim_matrix)):
-            if sim_matrix[i, j] > umbral:
-                redundantes.add(oraciones[j])
-    return list(redundantes)
-
-def validar_citas(tabla):
-    completas, incompletas = [], []
-    for _, fila in tabla.iterrows():
-        if pd.notnull(fila['DOI']) and pd.notnull(fila['Título del artículo']) and pd.notnull(fila['Journal']):
-            completas.append(fila)
-        else:
-            incompletas.append(fila)
-    return pd.DataFrame(completas), pd.DataFrame(incompletas)
-
-def extraer_apellidos_citados(texto):
-    return list(set(re.findall(r'\(([^\)]+), \d{4}\)', texto)))
-
-def construir_referencias_apa(apellidos_usados, df_referencias):
-    referencias_usadas = df_referencias[df_referencias['Autores'].isin(apellidos_usados)]
-    referencias_apa = []
-    for _, fila in referencias_usadas.iterrows():
-        ref = f"{fila['Autores']} ({fila['Año']}). {fila['Título del artículo']}. {fila['Journal']}, {fila['Volumen']}, {fila['Páginas']}. {fila['DOI']}"
-        referencias_apa.append(ref)
-    return referencias_apa, len(referencias_apa)
-
-def exportar_a_word(texto, referencias, plantilla, nombre_archivo):
-    doc = docx.Document(plantilla)
-    doc.add_paragraph(texto)
-    doc.add_paragraph("\nAplicación práctica para el entrenador:")
-    doc.add_paragraph("(Completar bloque de aplicación práctica aquí.)")
-    doc.add_paragraph("\nReferencias:")
-    for ref in referencias:
-        doc.add_paragraph(ref, style='Normal')
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+
+from ace_writer import referencias, validacion
+from ace_writer.catalogo import CatalogoBibliografico
+from ace_writer.instrumentacion import Registro
+from ace_writer.redundancia import detectar_redundancias_por_segmentos
+from ace_writer.revision import construir_referencias_apa, exportar_a_word, extraer_citas, validar_citas
+from ace_writer.segmentos import MAX_TOKENS_SEGMENTO, contar_tokens, dividir_en_segmentos
+
+MAX_ENTRADAS_CACHE = 16
+
+@st.cache_resource
+def obtener_catalogo():
+    return CatalogoBibliografico()
+
+@st.cache_resource
+def obtener_registro_proceso():
+    return Registro(ruta_log=None, ruta_prometheus=os.environ.get("ACE_PROMETHEUS_TEXTFILE"))
+
+# --- ANÁLISIS MEMOIZADO ---
+# Streamlit vuelve a ejecutar la página en cada clic. Cada etapa se cachea por el contenido de sus
+# entradas (texto pegado, bytes del CSV o de la plantilla): si solo cambió la selección de
+# referencias, nada de lo pesado se recalcula.
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def analizar_texto(texto):
+    return {"segmentos": dividir_en_segmentos(texto), "tokens": contar_tokens(texto)}
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner="Buscando frases redundantes...")
+def buscar_redundancias(texto):
+    return detectar_redundancias_por_segmentos(texto, analizar_texto(texto)["segmentos"])
+
+# `version_catalogo` entra en la clave: si se importa otro volcado, las tablas se vuelven a completar.
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def leer_referencias(datos_csv, version_catalogo):
+    df, completadas = obtener_catalogo().completar(referencias.cargar_tabla(datos_csv))
+    completas, incompletas = validar_citas(df)
+    return df, completas, incompletas, completadas
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def citas_del_texto(texto, datos_csv, version_catalogo):
+    df, _, _, _ = leer_referencias(datos_csv, version_catalogo)
+    return extraer_citas(analizar_texto(texto)["segmentos"], df)
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def validar_manuscrito(texto, datos_csv, version_catalogo):
+    df, _, _, _ = leer_referencias(datos_csv, version_catalogo)
+    return validacion.validar(texto, validacion.claves_de_tabla(df))
+
+@st.cache_data(max_entries=4, show_spinner="Armando el Word...")
+def generar_word(texto, referencias_apa, datos_plantilla, subtitulo):
+    return exportar_a_word(texto, referencias_apa, datos_plantilla, subtitulo).getvalue()
 
 # --- INTERFAZ PRINCIPAL ---
 st.title("AsyncWriter Mini V38")
 
+if "registro" not in st.session_state:
+    st.session_state["registro"] = Registro(padre=obtener_registro_proceso())
+registro = st.session_state["registro"]
+
 subtitulo = st.text_input("Subtítulo del tema (usado como nombre del archivo Word)")
 archivo_csv = st.file_uploader("Cargar archivo de referencias (.csv)", type="csv")
 plantilla_word = st.file_uploader("Cargar plantilla Word (.dotx)", type="dotx")
 texto_generado = st.text_area("Pega aquí el texto generado por GPT", height=300)
 
 if archivo_csv and plantilla_word and texto_generado and subtitulo:
-    token_count = contar_tokens(texto_generado)
-    word_count = contar_palabras(texto_generado)
-    st.write(f"Palabras totales del texto: {word_count}")
+    version_catalogo = obtener_catalogo().version
+    with registro.etapa("validación"):
+        informe = validar_manuscrito(texto_generado, archivo_csv.getvalue(), version_catalogo)
+    word_count = informe["palabras"]
+    st.write(f"Palabras del cuerpo (sin títulos, marcado ni referencias): {word_count}")
 
     if word_count < 1500:
         st.warning("El texto tiene menos de 1500 palabras. Asegúrate de que haya agotado las fuentes o justifica su brevedad.")
-
-    if token_count > 4000:
-        st.error("El texto excede los 4000 tokens. Por favor, divídelo en partes.")
-    else:
-        redundancias = detectar_redundancias(texto_generado)
-        if redundancias:
-            st.warning(f"Se detectaron {len(redundancias)} posibles frases redundantes en el texto.")
-            with st.expander("Ver frases redundantes"):
-                for r in redundancias:
-                    st.text(f"- {r}")
-
-        df = pd.read_csv(archivo_csv)
-        completas, incompletas = validar_citas(df)
-        st.success(f"Referencias completas: {len(completas)} | Incompletas: {len(incompletas)}")
-
-        seleccionadas = []
-        if not incompletas.empty:
-            st.write("### Referencias incompletas disponibles para selección manual")
-            seleccionadas = st.multiselect("Selecciona manualmente o haz clic en el botón para seleccionar todas:", list(incompletas['Autores']))
-            if st.button("Seleccionar todas"):
-                seleccionadas = list(incompletas['Autores'])
-
-        referencias_validas = pd.concat([
-            completas,
-            incompletas[incompletas['Autores'].isin(seleccionadas)]
-        ])
-
-        apellidos_en_texto = extraer_apellidos_citados(texto_generado)
-        referencias_apa, usadas = construir_referencias_apa(apellidos_en_texto, referencias_validas)
-
-        st.write(f"Citas usadas: {usadas} de {len(referencias_validas)} disponibles")
-
-        buffer_word = exportar_a_word(texto_generado, referencias_apa, plantilla_word, subtitulo)
-        st.download_button("Descargar Word generado", data=buffer_word, file_name=f"{subtitulo}.docx")
+    if informe["problemas"]:
+        st.warning(f"La validación encontró {len(informe['problemas'])} problemas de estructura, recursos visuales o citas.")
+        with st.expander("Ver informe de validación"):
+            st.dataframe(pd.DataFrame([
+                {"Sección": "  " * max(s["nivel"] - 1, 0) + (s["titulo"] or "(antes del primer título)"), "Palabras": s["palabras"],
+                 "Citas": s["citas"], "Citas c/100 palabras": s["densidad_citas"], "Visuales": s["visuales"]}
+                for s in informe["secciones"]
+            ]), hide_index=True)
+            for p in informe["problemas"]:
+                st.text(f"- línea {p['linea']}: {p['detalle']}")
+
+    with registro.etapa("segmentación"):
+        analisis = analizar_texto(texto_generado)
+    segmentos = analisis["segmentos"]
+    if len(segmentos) > 1:
+        st.info(f"El texto ({analisis['tokens']} tokens) se analiza en {len(segmentos)} segmentos de hasta {MAX_TOKENS_SEGMENTO} tokens, cortados en títulos y párrafos.")
+
+    with registro.etapa("redundancias"):
+        redundancias = buscar_redundancias(texto_generado)
+    if redundancias:
+        st.warning(f"Se detectaron {len(redundancias)} pares de frases posiblemente redundantes en el texto.")
+        with st.expander("Ver frases redundantes"):
+            for r in redundancias:
+                lugar = f"segmento {r['segmento'] + 1}" if r["segmento_a"] == r["segmento"] else f"segmento {r['segmento'] + 1}, repite al {r['segmento_a'] + 1}"
+                st.text(f"- [{lugar} · {r['similitud']:.2f}] \"{r['oracion_b']}\"\n    repite a: \"{r['oracion_a']}\"")
+
+    with registro.etapa("lectura CSV"):
+        df, completas, incompletas, completadas = leer_referencias(archivo_csv.getvalue(), version_catalogo)
+    st.success(f"Referencias completas: {len(completas)} | Incompletas: {len(incompletas)}")
+    if completadas:
+        st.info(f"{len(completadas)} referencias se completaron automáticamente con el catálogo local.")
+
+    seleccionadas = []
+    if not incompletas.empty:
+        st.write("### Referencias incompletas disponibles para selección manual")
+        seleccionadas = st.multiselect("Selecciona manualmente o haz clic en el botón para seleccionar todas:", list(incompletas['Autores']))
+        if st.button("Seleccionar todas"):
+            seleccionadas = list(incompletas['Autores'])
+
+    referencias_validas = pd.concat([
+        completas,
+        incompletas[incompletas['Autores'].isin(seleccionadas)]
+    ])
+
+    with registro.etapa("detección de citas"):
+        citas_en_texto = citas_del_texto(texto_generado, archivo_csv.getvalue(), version_catalogo)
+    referencias_apa, usadas = construir_referencias_apa(citas_en_texto, referencias_validas)
+
+    st.write(f"Citas usadas: {usadas} de {len(referencias_validas)} disponibles")
+
+    # El .docx se arma solo cuando se pide, no en cada rerun.
+    if st.button("Preparar Word"):
+        with registro.etapa("exportación Word"):
+            datos_word = generar_word(texto_generado, referencias_apa, plantilla_word.getvalue(), subtitulo)
+        st.download_button("Descargar Word generado", data=datos_word, file_name=f"{subtitulo}.docx")
 else:
     st.info("Por favor, carga todos los elementos requeridos y escribe el subtítulo.")
+
+with st.sidebar:
+    st.markdown("### ⏱️ Tiempos de la sesión")
+    tabla_tiempos = registro.tabla()
+    if tabla_tiempos:
+        st.dataframe(pd.DataFrame(tabla_tiempos), hide_index=True)
@@ -0,0 +1,31 @@
+import argparse
+import time
+
+from corpus import generar_oraciones  # agrega la raíz del repo al path
+
+from ace_writer.redundancia import pares_redundantes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Escalado de la detección de redundancias.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 5000, 10000, 20000, 50000])
+    parser.add_argument("--metodo", default="lsh", choices=["lsh", "exacto", "auto"])
+    parser.add_argument("--umbral", type=float, default=0.85)
+    args = parser.parse_args(argv)
+
+    # Las dependencias pesadas se importan en la primera llamada: se calientan fuera de la medición.
+    pares_redundantes(generar_oraciones(50), args.umbral, args.metodo)
+    referencia = None
+    print(f"{'oraciones':>10} {'segundos':>10} {'pares':>8} {'µs/oración':>12}")
+    for n in args.tamanos:
+        oraciones = generar_oraciones(n)
+        inicio = time.perf_counter()
+        pares = pares_redundantes(oraciones, args.umbral, args.metodo)
+        segundos = time.perf_counter() - inicio
+        por_oracion = segundos / n * 1e6
+        referencia = referencia or por_oracion
+        print(f"{n:>10} {segundos:>10.2f} {len(pares):>8} {por_oracion:>12.1f}  (x{por_oracion / referencia:.2f})")
+
+
+if __name__ == "__main__":
+    main()
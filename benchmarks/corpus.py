@@ -0,0 +1,153 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Generadores de datos sintéticos para los benchmarks: texto científico en español (markdown con
+# subtítulos, citas APA, recursos visuales y bloque de referencias) y tablas de referencias del
+# tamaño que se pida. Todo es determinista por semilla, así los resultados son comparables.
+PALABRAS_FUNCIONALES = "de la el en y que los las del se con por un una para es al lo como más".split()
+RAICES = (
+    "entrenamiento fuerza velocidad potencia carga serie repetición descanso fatiga músculo tendón "
+    "adaptación rendimiento atleta sesión intensidad volumen frecuencia sprint salto perfil hipertrofia "
+    "recuperación lactato umbral periodización evaluación protocolo variable efecto estudio muestra"
+).split()
+APELLIDOS = (
+    "García Rodríguez González Fernández López Martínez Sánchez Pérez Gómez Martín Jiménez Ruiz "
+    "Hernández Díaz Moreno Muñoz Álvarez Romero Alonso Gutiérrez Navarro Torres Domínguez Vázquez "
+    "Ramos Gil Ramírez Serrano Blanco Molina Morales Suárez Ortega Delgado Castro Ortiz Rubio Marín "
+    "Sanz Núñez Iglesias Medina Garrido Cortés Castillo Santos Lozano Guerrero Cano Prieto Méndez "
+    "Cruz Calvo Gallego Vidal León Márquez Herrera Peña Flores Cabrera Campos Vega Fuentes Carrasco"
+).split()
+INICIALES = "ABCDEFGHIJLMNOPRSTV"
+REVISTAS = [
+    "Journal of Strength and Conditioning Research", "Revista Internacional de Ciencias del Deporte",
+    "Sports Medicine", "European Journal of Applied Physiology", "Apunts Educación Física y Deportes",
+    "International Journal of Sports Physiology and Performance", "Retos", "Journal of Sports Sciences",
+]
+COLUMNAS_REQUERIDAS = ["Autores", "Año", "Título del artículo", "Journal"]
+PALABRAS_POR_VISUAL = 500
+
+
+# --- VOCABULARIO Y ORACIONES ---
+def generar_vocabulario(tamano=20000, semilla=0):
+    # Términos técnicos sintéticos (raíz + sufijo) con frecuencia tipo Zipf, más palabras funcionales.
+    rng = random.Random(semilla)
+    sufijos = ["", "al", "ico", "ción", "idad", "ivo", "ante", "ado", "ismo", "ista"]
+    terminos = list(dict.fromkeys(
+        f"{rng.choice(RAICES)}{rng.choice(sufijos)}{rng.randrange(1000)}" for _ in range(tamano)
+    ))
+    return terminos, [1 / (rango + 1) for rango in range(len(terminos))]
+
+
+def generar_oraciones(n, proporcion_duplicadas=0.01, semilla=0):
+    rng = random.Random(semilla)
+    terminos, pesos = generar_vocabulario(semilla=semilla)
+    oraciones = []
+    for _ in range(n):
+        if oraciones and rng.random() < proporcion_duplicadas:
+            # casi duplicado: una oración anterior con una palabra cambiada
+            palabras = rng.choice(oraciones).rstrip(".").split()
+            palabras[rng.randrange(len(palabras))] = rng.choice(terminos)
+            oraciones.append(" ".join(palabras) + ".")
+            continue
+        largo = rng.randint(12, 24)
+        contenido = rng.choices(terminos, weights=pesos, k=largo // 2)
+        funcionales = rng.choices(PALABRAS_FUNCIONALES, k=largo - len(contenido))
+        palabras = [p for par in zip(funcionales, contenido) for p in par] + funcionales[len(contenido):]
+        oraciones.append(" ".join(palabras).capitalize() + ".")
+    return oraciones
+
+
+# --- TABLAS DE REFERENCIAS ---
+def _autores(rng):
+    # Apellidos simples o compuestos ("García-Ramos"), de uno a tres autores.
+    nombres = []
+    for _ in range(rng.choice((1, 2, 2, 3))):
+        apellido = rng.choice(APELLIDOS)
+        if rng.random() < 0.3:
+            apellido += "-" + rng.choice(APELLIDOS)
+        nombres.append(f"{apellido}, {rng.choice(INICIALES)}.")
+    return nombres[0] if len(nombres) == 1 else ", ".join(nombres[:-1]) + ", & " + nombres[-1]
+
+
+def generar_tabla_referencias(n, proporcion_incompletas=0.1, semilla=0):
+    # DataFrame ya normalizado como lo deja referencias.cargar_tabla (columnas canónicas, strings).
+    import pandas as pd
+
+    from ace_writer.referencias import normalizar_columnas
+
+    rng = random.Random(semilla)
+    terminos, _ = generar_vocabulario(2000, semilla)
+    filas = []
+    con_anio_vacio = False
+    for i in range(n):
+        fila = {
+            "Autores": _autores(rng),
+            "Año": str(rng.randint(1990, 2024)),
+            "Título del artículo": " ".join(rng.choice(terminos) for _ in range(rng.randint(6, 14))).capitalize(),
+            "Journal": rng.choice(REVISTAS),
+            "Volumen": str(rng.randint(1, 60)),
+            "Páginas": f"{(p := rng.randint(1, 900))}-{p + rng.randint(5, 20)}",
+            "DOI": f"https://doi.org/10.{rng.randint(1000, 9999)}/ace.{i}",
+        }
+        if rng.random() < proporcion_incompletas:
+            fila[rng.choice(COLUMNAS_REQUERIDAS)] = None
+            # La primera incompleta siempre queda sin año ni DOI: el índice de citas tiene que saltarla.
+            if not con_anio_vacio:
+                fila["Año"] = fila["DOI"] = None
+                con_anio_vacio = True
+        filas.append(fila)
+    return normalizar_columnas(pd.DataFrame(filas, columns=list(filas[0]) if filas else None))
+
+
+def tabla_a_csv(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+# --- MANUSCRITOS ---
+def _cita(rng, autores, anio):
+    from ace_writer.citas import apellido_principal
+
+    apellido = apellido_principal(autores)
+    forma = rng.random()
+    if forma < 0.5:
+        return f"({apellido}, {anio})"
+    if forma < 0.8:
+        return f"{apellido} et al. ({anio})"
+    return f"({apellido} et al., {anio})"
+
+
+def generar_texto(n_oraciones, df=None, proporcion_citas=0.3, oraciones_por_parrafo=5, parrafos_por_seccion=3,
+                  semilla=0):
+    # Markdown con la forma de una redacción ACE. Si se pasa una tabla, una parte de las oraciones
+    # cita alguna de sus filas completas y el texto cierra con la lista APA de las citadas.
+    rng = random.Random(semilla)
+    oraciones = generar_oraciones(n_oraciones, semilla=semilla)
+    citables = []
+    if df is not None and len(df):
+        completas = df[df[COLUMNAS_REQUERIDAS].notna().all(axis=1)]
+        citables = list(zip(completas.index, completas["Autores"], completas["Año"]))
+    partes, citadas, palabras, visuales = ["# Subtema sintético"], set(), 0, 0
+    for p, inicio in enumerate(range(0, len(oraciones), oraciones_por_parrafo)):
+        if p % parrafos_por_seccion == 0:
+            partes.append(f"## Sección {p // parrafos_por_seccion + 1}")
+        parrafo = []
+        for oracion in oraciones[inicio:inicio + oraciones_por_parrafo]:
+            if citables and rng.random() < proporcion_citas:
+                fila, autores, anio = rng.choice(citables)
+                citadas.add(fila)
+                oracion = oracion[:-1] + " " + _cita(rng, autores, anio) + "."
+            parrafo.append(oracion)
+            palabras += oracion.count(" ") + 1
+        partes.append(" ".join(parrafo))
+        if palabras // PALABRAS_POR_VISUAL > visuales:
+            visuales = palabras // PALABRAS_POR_VISUAL
+            partes.append(f"📊 Sugerencia de recurso visual: gráfico de {rng.choice(RAICES)} por {rng.choice(RAICES)}")
+    if citadas:
+        from ace_writer.referencias import formatear_apa
+
+        partes.append("## Referencias")
+        partes.extend(formatear_apa(df.loc[sorted(citadas)]).tolist())
+    return "\n\n".join(partes)
@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from corpus import generar_tabla_referencias, generar_texto
+
+# Benchmarks de los caminos de CPU de la app (sin red): cada uno se mide sobre datos sintéticos de
+# varios tamaños, se guarda en JSON y se compara contra una línea base para detectar regresiones.
+#   python benchmarks/suite.py correr -o resultados.json
+#   python benchmarks/suite.py comparar resultados.json            (contra la línea base de su escala)
+#   python benchmarks/suite.py correr --base benchmarks/linea_base.json
+#   python benchmarks/suite.py correr --tokenizador aproximado     (sin la codificación de tiktoken)
+LINEAS_BASE = {
+    "rapida": Path(__file__).resolve().parent / "linea_base.json",
+    "completa": Path(__file__).resolve().parent / "linea_base_completa.json",
+}
+ESCALAS = {
+    "rapida": {"filas": [10, 1000, 10000], "oraciones": [100, 1000, 5000]},
+    "completa": {"filas": [10, 1000, 10000, 100000], "oraciones": [100, 1000, 10000, 50000]},
+}
+REPETICIONES = 5
+# Una medición se corta antes si ya lleva este tiempo (los tamaños grandes no repiten tanto).
+PRESUPUESTO_SEGUNDOS = 10.0
+TOLERANCIA = 0.25
+# Diferencias menores que esta (en segundos) son ruido aunque la proporción sea grande.
+MINIMO_ABSOLUTO = 0.005
+FALLAS = ("regresion", "omitido", "faltante")
+SINGULAR = {"filas": "fila", "oraciones": "oración"}
+FILAS_TEXTO = 300
+ORACIONES_TEXTO = 2000
+TOKENIZADORES = ("tiktoken", "aproximado")
+# Casos cuyos tiempos solo se comparan contra una línea base medida con el mismo tokenizador.
+DEPENDEN_DEL_TOKENIZADOR = {"contar_tokens"}
+
+
+# --- TOKENIZADOR ---
+class CodificadorAproximado:
+    # Para medir sin la codificación de tiktoken (la baja de la red la primera vez): trozos como los
+    # del pre-tokenizador de cl100k, con las palabras cortadas cada 4 letras. Solo se usa si se pide
+    # con --tokenizador aproximado, y queda registrado en los resultados.
+    name = "aproximado"
+    _TROZO = re.compile(r" ?[^\W\d_]{1,4}| ?\d{1,3}| ?[^\w\s]+|\s+(?!\S)|\s+")
+
+    def encode(self, texto):
+        return self._TROZO.findall(texto)
+
+
+def usar_tokenizador(nombre):
+    # Con "aproximado", contar_tokens (y quien lo use) cuenta con CodificadorAproximado en este proceso.
+    if nombre == "aproximado":
+        from ace_writer import segmentos
+
+        aproximado = CodificadorAproximado()
+        segmentos.codificador = lambda modelo=segmentos.MODELO_TOKENS: aproximado
+
+
+# --- CASOS ---
+# Cada caso: unidad de tamaño, cómo preparar los datos (fuera de la medición) y qué medir.
+def _redundancias(n):
+    from ace_writer.redundancia import detectar_redundancias
+
+    texto = generar_texto(n)
+    return lambda: detectar_redundancias(texto)
+
+
+def _validar_citas(n):
+    from ace_writer.revision import validar_citas
+
+    df = generar_tabla_referencias(n)
+    return lambda: validar_citas(df)
+
+
+def _paso2_referencias(n):
+    # Lo que hace la app al subir el CSV: leer y normalizar, clasificar, formatear y describir.
+    from ace_writer import referencias
+    from ace_writer.referencias import cargar_tabla, clasificar, describir_incompletas, formatear_apa
+    from corpus import tabla_a_csv
+
+    datos = tabla_a_csv(generar_tabla_referencias(n))
+
+    def medir():
+        # Sin la tabla cacheada por hash: se mide la lectura del CSV como en la primera carga.
+        referencias._tablas.clear()
+        completas, incompletas = clasificar(cargar_tabla(datos))
+        return formatear_apa(completas).tolist(), describir_incompletas(incompletas)
+    return medir
+
+
+def _citas_por_filas(n):
+    # Sucesor de extraer_apellidos_citados: índice Aho–Corasick de la tabla y una pasada por el texto.
+    from ace_writer.citas import IndiceCitas
+
+    df = generar_tabla_referencias(n)
+    texto = generar_texto(ORACIONES_TEXTO, df)
+    return lambda: IndiceCitas(df).buscar(texto)
+
+
+def _citas_por_oraciones(n):
+    from ace_writer.citas import IndiceCitas
+
+    df = generar_tabla_referencias(FILAS_TEXTO)
+    texto = generar_texto(n, df)
+    return lambda: IndiceCitas(df).buscar(texto)
+
+
+def _construir_referencias_apa(n):
+    from ace_writer.revision import construir_referencias_apa
+
+    df = generar_tabla_referencias(n)
+    citadas = set(df.index[::2])
+    return lambda: construir_referencias_apa(citadas, df)
+
+
+def _contar_tokens(n):
+    # Con el tokenizador elegido en correr(); la codificación se carga fuera de la medición.
+    from ace_writer import segmentos
+    from ace_writer.segmentos import contar_tokens
+
+    texto = generar_texto(n)
+    segmentos.codificador()
+    return lambda: contar_tokens(texto)
+
+
+def _exportar_a_word(n):
+    from ace_writer.referencias import formatear_apa
+    from ace_writer.revision import exportar_a_word
+
+    df = generar_tabla_referencias(FILAS_TEXTO)
+    texto = generar_texto(n, df)
+    referencias = formatear_apa(df).tolist()
+    return lambda: exportar_a_word(texto, referencias, None, "Subtema sintético")
+
+
+CASOS = {
+    "detectar_redundancias": ("oraciones", _redundancias),
+    "validar_citas": ("filas", _validar_citas),
+    "paso2_referencias": ("filas", _paso2_referencias),
+    "citas_en_texto_filas": ("filas", _citas_por_filas),
+    "citas_en_texto_oraciones": ("oraciones", _citas_por_oraciones),
+    "construir_referencias_apa": ("filas", _construir_referencias_apa),
+    "contar_tokens": ("oraciones", _contar_tokens),
+    "exportar_a_word": ("oraciones", _exportar_a_word),
+}
+
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones=REPETICIONES, presupuesto=PRESUPUESTO_SEGUNDOS):
+    # Una corrida de calentamiento (imports diferidos, caches de regex) y luego hasta `repeticiones`
+    # mediciones; se informa el mínimo, que es el menos afectado por el ruido de la máquina.
+    funcion()
+    tiempos = []
+    inicio = time.perf_counter()
+    while len(tiempos) < repeticiones and (not tiempos or time.perf_counter() - inicio < presupuesto):
+        t = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t)
+    return {"segundos": min(tiempos), "mediana": statistics.median(tiempos), "repeticiones": len(tiempos)}
+
+
+def maquina(tokenizador="tiktoken"):
+    return {"python": platform.python_version(), "plataforma": platform.platform(),
+            "procesador": platform.processor() or platform.machine(), "nucleos": os.cpu_count(),
+            "tokenizador": tokenizador}
+
+
+def correr(casos=None, escala="rapida", repeticiones=REPETICIONES, tokenizador="tiktoken"):
+    # Un caso que falla en un tamaño queda como omitido en ese tamaño y se prueban los demás;
+    # `comparar` lo cuenta como regresión si la línea base sí lo midió.
+    casos = list(casos or CASOS)
+    usar_tokenizador(tokenizador)
+    resultados = {}
+    for nombre in casos:
+        unidad, preparar = CASOS[nombre]
+        for n in ESCALAS[escala][unidad]:
+            clave = f"{nombre}/{n}"
+            try:
+                medicion = medir(preparar(n), repeticiones)
+            except Exception as e:
+                resultados[clave] = {"unidad": unidad, "tamano": n, "omitido": f"{type(e).__name__}: {e}"}
+                print(f"{clave:<40} omitido ({type(e).__name__}: {e})", file=sys.stderr)
+                continue
+            resultados[clave] = {"unidad": unidad, "tamano": n, **medicion,
+                                 "us_por_unidad": round(medicion["segundos"] / n * 1e6, 2)}
+            print(f"{clave:<40} {medicion['segundos']:>10.4f}s {resultados[clave]['us_por_unidad']:>12.2f} µs/{SINGULAR[unidad]}")
+    return {"fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"), "escala": escala,
+            "maquina": maquina(tokenizador), "casos": casos, "resultados": resultados}
+
+
+# --- COMPARACIÓN ---
+def comparar(base, actual, tolerancia=TOLERANCIA, minimo=MINIMO_ABSOLUTO):
+    # Filas (clave, base, actual, proporción, estado); estado: "regresion", "mejora", "igual",
+    # "sin_base", "omitido" (la base lo midió y ahora falló) o "faltante" (la base lo midió y no está en
+    # los resultados de un caso que sí se corrió). Los estados de FALLAS hacen terminar con código 1.
+    # Con otro tokenizador que la base, los casos que dependen de él quedan sin base.
+    filas = []
+    corridos = set(actual.get("casos") or CASOS)
+    if base.get("maquina", {}).get("tokenizador") != actual.get("maquina", {}).get("tokenizador"):
+        corridos -= DEPENDEN_DEL_TOKENIZADOR
+    for clave, previa in base["resultados"].items():
+        if clave not in actual["resultados"] and clave.split("/")[0] in corridos and "omitido" not in previa:
+            filas.append((clave, previa["segundos"], None, None, "faltante"))
+    for clave, medicion in actual["resultados"].items():
+        previa = base["resultados"].get(clave)
+        if previa is None or "omitido" in previa or clave.split("/")[0] not in corridos:
+            filas.append((clave, None, medicion.get("segundos"), None, "sin_base"))
+            continue
+        if "omitido" in medicion:
+            filas.append((clave, previa["segundos"], None, None, "omitido"))
+            continue
+        a, b = medicion["segundos"], previa["segundos"]
+        proporcion = a / b if b else float("inf")
+        if proporcion > 1 + tolerancia and a - b > minimo:
+            estado = "regresion"
+        elif proporcion < 1 / (1 + tolerancia) and b - a > minimo:
+            estado = "mejora"
+        else:
+            estado = "igual"
+        filas.append((clave, b, a, proporcion, estado))
+    orden = {nombre: i for i, nombre in enumerate(CASOS)}
+    return sorted(filas, key=lambda f: (orden.get(f[0].split("/")[0], len(orden)), int(f[0].split("/")[1])))
+
+
+def imprimir_comparacion(filas, base, actual):
+    if base.get("maquina") != actual.get("maquina"):
+        print("⚠️ La línea base se midió en otra máquina o con otro tokenizador; las proporciones son orientativas.")
+    if base.get("escala") != actual.get("escala"):
+        print(f"⚠️ La línea base es de la escala {base.get('escala')!r} y estos resultados de {actual.get('escala')!r}.")
+    simbolos = {"regresion": "❌", "omitido": "❌ omitido", "faltante": "❌ faltante", "mejora": "🚀", "igual": "✅",
+                "sin_base": "·"}
+    print(f"{'caso':<40} {'base':>10} {'actual':>10} {'x':>7}")
+    for clave, b, a, proporcion, estado in filas:
+        base_txt = f"{b:.4f}" if b is not None else "—"
+        actual_txt = f"{a:.4f}" if a is not None else "—"
+        proporcion_txt = f"{proporcion:.2f}" if proporcion is not None else "—"
+        print(f"{clave:<40} {base_txt:>10} {actual_txt:>10} {proporcion_txt:>7} {simbolos[estado]}")
+    fallas = [f for f in filas if f[4] in FALLAS]
+    print(f"{len(fallas)} regresiones ({sum(f[4] != 'regresion' for f in fallas)} omitidas o faltantes), "
+          f"{sum(f[4] == 'mejora' for f in filas)} mejoras de {len(filas)} casos")
+    return fallas
+
+
+def _leer(ruta):
+    return json.loads(Path(ruta).read_text(encoding="utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de CPU de ACE Writer con datos sintéticos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_correr = sub.add_parser("correr", help="Medir y guardar los resultados")
+    p_correr.add_argument("casos", nargs="*", help=f"Casos a medir (por defecto, todos): {', '.join(CASOS)}")
+    p_correr.add_argument("--escala", choices=list(ESCALAS), default="rapida")
+    p_correr.add_argument("-r", "--repeticiones", type=int, default=REPETICIONES)
+    p_correr.add_argument("--tokenizador", choices=TOKENIZADORES, default="tiktoken",
+                          help="Codificador para contar_tokens (aproximado: sin la codificación de tiktoken)")
+    p_correr.add_argument("-o", "--salida", help="Archivo JSON de resultados")
+    p_correr.add_argument("--base", help="Comparar al terminar contra esta línea base")
+    p_correr.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    p_comparar = sub.add_parser("comparar", help="Comparar dos archivos de resultados")
+    p_comparar.add_argument("actual")
+    p_comparar.add_argument("--base", help="Línea base (por defecto, la de la escala de los resultados)")
+    p_comparar.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                            help="Proporción de más que cuenta como regresión (0.25 = 25%% más lento)")
+    args = parser.parse_args(argv)
+
+    if args.comando == "correr":
+        desconocidos = set(args.casos) - set(CASOS)
+        if desconocidos:
+            parser.error(f"casos desconocidos: {', '.join(sorted(desconocidos))}")
+        actual = correr(args.casos, args.escala, args.repeticiones, args.tokenizador)
+        if args.salida:
+            Path(args.salida).write_text(json.dumps(actual, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        if not args.base:
+            return 0
+        base = _leer(args.base)
+    else:
+        actual = _leer(args.actual)
+        base = _leer(args.base or LINEAS_BASE[actual.get("escala", "rapida")])
+    fallas = imprimir_comparacion(comparar(base, actual, args.tolerancia), base, actual)
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())